@@ -47,6 +47,19 @@ class Route:
     def __init__(self, tracks: list[tuple[Path, bool]]):
         self.tracks = tuple(tracks)
 
+    @property
+    def cost(self) -> int:
+        return sum(path.cost for path, _ in self.tracks)
+
+    def __repr__(self):
+        if not self.tracks:
+            return '<>'
+        names = [self.tracks[0][0].fromPoint.name] + [path.toPoint.name for path, _ in self.tracks]
+        return '<' + ' -> '.join(f'\'{name}\'' for name in names) + f' ({self.cost})>'
+
 class RouteSet:
     def __init__(self, routes: dict[tuple[Point, Point], Route]):
         self.routes = types.MappingProxyType(routes)
+
+    def __repr__(self):
+        return repr(dict(self.routes))
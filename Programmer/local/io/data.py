@@ -1,13 +1,61 @@
+import os
+import sys
 import uuid
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree import ElementTree
 
 from local.entities import *
 from local.io.util import *
 
+# 拠点ファイル 1 つ分の読込結果: (Key, Name, Group, [(CategoryKey, From, To), ...])
+# Key / Name / Group が無い場合は None
+PointValues = tuple[str | None, str | None, str | None, list[tuple[str, int, int]]]
+
+# 拠点ファイル 1 つ分を読み、必要な値だけを取り出す。
+# 結果は XmlUtil.ioToXml + findtext / XmlUtil.find で読んだ場合と同じになるようにしている。
+# (iterparse で要素ごとにイベントを受け取るより、fromstring で一度に木を作る方が速い)
+def _parsePointEntry(content: bytes, entry: str, categoryKeys: frozenset[str]) -> PointValues:
+    try:
+        root = ElementTree.fromstring(content)
+    except Exception as e:
+        raise FileFormatError(entry, innerException=e)
+    if root.tag != 'Point':
+        raise FileFormatError(entry, f'ルート要素名 \'{root.tag}\'が間違っています。正しくは \'Point\' です。')
+
+    objectValues: list[tuple[str, int, int]] = []
+    for objectElement in XmlUtil.find(root, 'Objects').findall('Object'):
+        categoryKey = objectElement.get('CategoryKey')
+        if categoryKey not in categoryKeys:
+            raise FileFormatError(entry, f'物品カテゴリ \'{categoryKey}\'が存在しません。')
+        fromAmount = XmlUtil.toInt(objectElement.get('From'), 0, entry)
+        toAmount = XmlUtil.toInt(objectElement.get('To'), 0, entry)
+        objectValues.append((sys.intern(categoryKey), fromAmount, toAmount))
+    return root.findtext('Key'), root.findtext('Name'), root.findtext('Group'), objectValues
+
+def _readPointEntriesFrom(zf: zipfile.ZipFile, entries: list[str], categoryKeys: frozenset[str]) -> list[PointValues | FileFormatError]:
+    # エラーは例外を投げずに結果として返し、呼び出し側でエントリ順に処理する
+    results: list[PointValues | FileFormatError] = []
+    for entry in entries:
+        try:
+            results.append(_parsePointEntry(zf.read(entry), entry, categoryKeys))
+        except FileFormatError as e:
+            results.append(e)
+            break
+    return results
+
+def _readPointEntriesInWorker(path: str, entries: list[str], categoryKeys: frozenset[str]) -> list[PointValues | FileFormatError]:
+    with zipfile.ZipFile(path) as zf:
+        return _readPointEntriesFrom(zf, entries, categoryKeys)
+
 class Data:
     _FILENAME_OBJECTS = 'Objects.xml'
     _FILENAME_PATHS = 'Paths.xml'
     _DIR_POINTS = 'Points/'
+    # ワーカー 1 つあたり拠点ファイルがこの数以上になるときだけ、プロセスを分けて並列に読む。
+    # 1 ファイルのパースは約 43us、結果の受け渡しは親プロセス側で 1 ファイル約 3us + プロセスの起動で約 20ms かかるので、
+    # 2 プロセスで読んでも約 1200 ファイルまでは 1 プロセスで読む方が速い
+    _PARALLEL_THRESHOLD = 2048
 
     def __init__(self, objectCategories: dict[str, ObjectCategory],
                  points: dict[str, Point], waypoints: dict[str, Waypoint], groups: dict[str, list[Point]],
@@ -17,6 +65,27 @@ class Data:
         self.waypoints = waypoints
         self.groups = groups
         self.paths = paths
+        # .dat から読み込んだときの各エントリの内容 (save で変わっていないエントリをそのままコピーするのに使う)
+        self._source = None
+
+    # 整数インデックスの配列で保存するバイナリ形式 (local.io.snapshot) での保存・読込
+    def saveSnapshot(self, path: str) -> None:
+        from local.io.snapshot import Snapshot
+        Snapshot.save(self, path)
+
+    # load と同じ zip 形式 (.dat) での保存。load した元のファイルから変わった拠点・ファイルだけを書き直す
+    def save(self, path: str) -> None:
+        from local.io.writer import DataWriter
+        DataWriter.save(self, path)
+
+    def dirtyPointKeys(self) -> list[str]:
+        from local.io.writer import DataWriter
+        return DataWriter.dirtyPointKeys(self)
+
+    @staticmethod
+    def loadSnapshot(path: str) -> 'Data':
+        from local.io.snapshot import Snapshot
+        return Snapshot.load(path)
 
     @staticmethod
     def _appendGroupPoint(groups: dict[str, list[Point]], groupKey: str, point: Point) -> None:
@@ -26,9 +95,24 @@ class Data:
             groups[groupKey] = groupPoints
         groupPoints.append(point)
 
+    @classmethod
+    def _readPointEntries(cls, path: str, zf: zipfile.ZipFile, entries: list[str], categoryKeys: frozenset[str]):
+        workers = min(os.cpu_count() or 1, len(entries) // cls._PARALLEL_THRESHOLD)
+        if workers <= 1:
+            yield from _readPointEntriesFrom(zf, entries, categoryKeys)
+            return
+
+        chunkSize = -(-len(entries) // (workers * 4))
+        chunks = [entries[i:i + chunkSize] for i in range(0, len(entries), chunkSize)]
+        with ProcessPoolExecutor(workers) as executor:
+            for results in executor.map(_readPointEntriesInWorker, [path] * len(chunks), chunks, [categoryKeys] * len(chunks)):
+                yield from results
+
     @classmethod
     def load(cls, path: str) -> 'Data':
+        from local.io.writer import SourceArchive
         with zipfile.ZipFile(path) as zf:
+            source = SourceArchive(path)
             namelist = zf.namelist()
             print(namelist)
 
@@ -43,39 +127,31 @@ class Data:
                 categoryElements = categoriesElement.findall('ObjectCategory')
                 categories: dict[str, ObjectCategory] = {}
                 for categoryElement in categoryElements:
-                    key = categoryElement.get('Key', str(uuid.uuid4()))
+                    key = sys.intern(categoryElement.get('Key', str(uuid.uuid4())))
                     name = categoryElement.get('Name', '名称未設定')
                     categories[key] = ObjectCategory(name)
+                source.categories = tuple((key, category.name) for key, category in categories.items())
 
             points: dict[str, Point] = {}
             groups: dict[str, list[Point]] = {}
-            for entry in namelist:
-                if not entry.startswith(cls._DIR_POINTS) or entry.endswith('/'):
-                    continue
-
-                with zf.open(entry) as pointFile:
-                    pointRoot = XmlUtil.ioToXml(pointFile, 'Point', entry)
-                    key = pointRoot.findtext('Key', str(uuid.uuid4()))
-                    name = pointRoot.findtext('Name', '名称未設定')
-                    group = pointRoot.findtext('Group', str(uuid.uuid4()))
-
-                    objectsElement = XmlUtil.find(pointRoot, 'Objects')
-                    objectElements = objectsElement.findall('Object')
-                    objects: dict[ObjectCategory, QuantityChange] = {}
-                    for objectElement in objectElements:
-                        categoryKey = objectElement.get('CategoryKey')
-                        category = categories.get(categoryKey)
-                        if not category:
-                            raise FileFormatError(entry, f'物品カテゴリ \'{categoryKey}\'が存在しません。')
-
-                        fromAmount = XmlUtil.toInt(objectElement.get('From'), 0, entry)
-                        toAmount = XmlUtil.toInt(objectElement.get('To'), 0, entry)
-
-                        objects[category] = QuantityChange(fromAmount, toAmount)
-
-                    point = Point(name, objects)
-                    points[key] = point
-                    cls._appendGroupPoint(groups, group, point)
+            pointEntries = [entry for entry in namelist if entry.startswith(cls._DIR_POINTS) and not entry.endswith('/')]
+            for entry, result in zip(pointEntries, cls._readPointEntries(path, zf, pointEntries, frozenset(categories))):
+                if isinstance(result, FileFormatError):
+                    raise result
+                key, name, group, objectValues = result
+                if key is None:
+                    key = str(uuid.uuid4())
+                if group is None:
+                    group = str(uuid.uuid4())
+
+                objects: dict[ObjectCategory, QuantityChange] = {}
+                for categoryKey, fromAmount, toAmount in objectValues:
+                    objects[categories[categoryKey]] = QuantityChange(fromAmount, toAmount)
+
+                point = Point('名称未設定' if name is None else name, objects)
+                points[sys.intern(key)] = point
+                cls._appendGroupPoint(groups, sys.intern(group), point)
+                source.loadedPoints.append((entry, key, point.name, group, objectValues))
 
             with zf.open(cls._FILENAME_PATHS) as pathsFile:
                 pathsRoot = XmlUtil.ioToXml(pathsFile, 'PathCollection', cls._FILENAME_PATHS)
@@ -86,11 +162,12 @@ class Data:
                 for waypointElement in waypointElements:
                     key = waypointElement.get('Key', str(uuid.uuid4()))
                     name = waypointElement.get('Name', '名称未設定')
-                    group = waypointElement.get('Group', str(uuid.uuid4()))
+                    group = sys.intern(waypointElement.get('Group', str(uuid.uuid4())))
 
                     waypoint = Waypoint(name)
                     waypoints[key] = waypoint
                     cls._appendGroupPoint(groups, group, waypoint)
+                    source.waypoints.append((key, name, group))
 
                 pathsElement = XmlUtil.find(pathsRoot, 'Paths')
                 pathElements = pathsElement.findall('Path')
@@ -112,5 +189,8 @@ class Data:
 
                     paths[(fromPoint, toPoint)] = Path(fromPoint, toPoint, cost, isInternal)
                     paths[(toPoint, fromPoint)] = Path(toPoint, fromPoint, oppositeCost, isInternal)
+                    source.loadedPaths.append((fromKey, toKey, cost, oppositeCost, isInternal))
 
-        return Data(categories, points, waypoints, groups, paths)
+        data = Data(categories, points, waypoints, groups, paths)
+        data._source = source
+        return data
@@ -0,0 +1,239 @@
+import array
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+
+from local.entities import *
+from local.io.data import Data
+from local.io.util import *
+from local.routing import RouteGraph
+
+# 拠点 (行) × 全ノード (列) の最短距離行列と直前ノード行列を .dat の隣のファイルに保存し、
+# メモリマップで読み込む。経路グラフのハッシュが一致すればダイクストラ法は実行しない。
+#
+# ファイル形式 (リトルエンディアン):
+#   ヘッダ: マジック 'MTDM', バージョン, グラフのハッシュ (32 バイト), 行数, 列数, ノードキー JSON の長さ
+#   ノードキー JSON (8 バイト境界までパディング)
+#   距離 float64 [行数 × 列数] (到達不能は inf)
+#   直前ノード int32 [行数 × 列数] (出発点自身と到達不能は -1)
+class DistanceMatrix:
+    _EXTENSION = '.dist'
+    _MAGIC = b'MTDM'
+    _VERSION = 1
+    _HEADER = struct.Struct('<4sI32sIII')
+    _HASH_OFFSET = 8
+
+    def __init__(self, filePath: str, data: Data, graph: RouteGraph):
+        self.filePath = filePath
+        self.data = data
+        self.graph = graph
+        self.rowCount = len(data.points)
+        self.nodeCount = len(graph.nodes)
+        self._file = None
+        self._mmap = None
+        self.dist: memoryview | None = None
+        self.pred: memoryview | None = None
+        # 差分更新の後、ファイルのハッシュをまだ書き直していないか
+        self._hashStale = False
+
+    @classmethod
+    def filePathFor(cls, datPath: str) -> str:
+        return os.path.splitext(datPath)[0] + cls._EXTENSION
+
+    # Paths.xml の内容 (辺とそのコスト) から作るハッシュ。XML の書式や並び順には依存しない
+    # (取り除かれてコストが inf になった辺は含めない)
+    @staticmethod
+    def graphHash(graph: RouteGraph) -> bytes:
+        lines = sorted(f'{graph.keys[graph.edgeSources[e]]}\t{graph.keys[graph.targets[e]]}\t{graph.costs[e]!r}'
+                       for e in range(len(graph.paths)) if not math.isinf(graph.costs[e]))
+        return hashlib.sha256('\n'.join(lines).encode()).digest()
+
+    @classmethod
+    def open(cls, datPath: str, data: Data, maxWorkers: int | None = None) -> 'DistanceMatrix':
+        graph = RouteGraph.fromData(data)
+        matrix = DistanceMatrix(cls.filePathFor(datPath), data, graph)
+        if not matrix._tryMap(cls.graphHash(graph)):
+            matrix._rebuild(maxWorkers)
+        return matrix
+
+    # 差分更新後のグラフのハッシュをファイルに書き込む (close でも呼ばれる)
+    def sync(self) -> None:
+        if self._hashStale and self._mmap is not None:
+            self._mmap[self._HASH_OFFSET:self._HASH_OFFSET + 32] = self.graphHash(self.graph)
+            self._mmap.flush()
+            self._hashStale = False
+
+    def close(self) -> None:
+        self.sync()
+        if self.dist is not None:
+            self.dist.release()
+            self.pred.release()
+            self.dist = None
+            self.pred = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
+            self._file = None
+
+    def __enter__(self) -> 'DistanceMatrix':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _layout(self) -> tuple[bytes, int, int]:
+        keysJson = json.dumps(self.graph.keys, ensure_ascii=False).encode()
+        distOffset = self._HEADER.size + len(keysJson)
+        distOffset += -distOffset % 8
+        predOffset = distOffset + self.rowCount * self.nodeCount * 8
+        return keysJson, distOffset, predOffset
+
+    def _tryMap(self, graphHash: bytes) -> bool:
+        keysJson, distOffset, predOffset = self._layout()
+        try:
+            with open(self.filePath, 'rb') as f:
+                header = f.read(self._HEADER.size + len(keysJson))
+        except OSError:
+            return False
+        if len(header) < self._HEADER.size:
+            return False
+        magic, version, storedHash, rowCount, nodeCount, keysLength = self._HEADER.unpack_from(header)
+        if (magic, version, storedHash, rowCount, nodeCount) != (self._MAGIC, self._VERSION, graphHash, self.rowCount, self.nodeCount):
+            return False
+        if header[self._HEADER.size:self._HEADER.size + keysLength] != keysJson:
+            return False
+        if os.path.getsize(self.filePath) < predOffset + self.rowCount * self.nodeCount * 4:
+            return False
+        self._map(distOffset, predOffset)
+        return True
+
+    def _map(self, distOffset: int, predOffset: int) -> None:
+        self._file = open(self.filePath, 'r+b')
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+        size = self.rowCount * self.nodeCount
+        view = memoryview(self._mmap)
+        self.dist = view[distOffset:distOffset + size * 8].cast('d')
+        self.pred = view[predOffset:predOffset + size * 4].cast('i')
+        view.release()
+
+    def _rebuild(self, maxWorkers: int | None) -> None:
+        self.close()
+        keysJson, distOffset, predOffset = self._layout()
+        sources = self.graph.nodes[:self.rowCount]
+        results = self.graph.shortestPaths(sources, maxWorkers)
+
+        tempPath = self.filePath + '.tmp'
+        with open(tempPath, 'wb') as f:
+            f.write(self._HEADER.pack(self._MAGIC, self._VERSION, self.graphHash(self.graph), self.rowCount, self.nodeCount, len(keysJson)))
+            f.write(keysJson)
+            f.write(b'\0' * (distOffset - f.tell()))
+            for source in sources:
+                results[source][0].tofile(f)
+            for source in sources:
+                f.write(self._predNodes(results[source][1]).tobytes())
+        os.replace(tempPath, self.filePath)
+        self._map(distOffset, predOffset)
+
+    def _predNodes(self, predEdge: array.array) -> array.array:
+        edgeSources = self.graph.edgeSources
+        return array.array('i', [edgeSources[e] if e >= 0 else -1 for e in predEdge])
+
+    def _index(self, point: Point) -> int:
+        index = self.graph.indices.get(point)
+        if index is None:
+            raise KeyError(f'拠点 {point!r} はこの距離行列に含まれていません。')
+        return index
+
+    def distance(self, source: Point, target: Point) -> float:
+        s = self._index(source)
+        if s >= self.rowCount:
+            raise KeyError(f'経由地 {source!r} は出発点にできません。')
+        return self.dist[s * self.nodeCount + self._index(target)]
+
+    def route(self, source: Point, target: Point) -> Route | None:
+        s = self._index(source)
+        t = self._index(target)
+        if s >= self.rowCount:
+            raise KeyError(f'経由地 {source!r} は出発点にできません。')
+        base = s * self.nodeCount
+        if math.isinf(self.dist[base + t]):
+            return None
+        nodes = self.graph.nodes
+        tracks: list[tuple[Path, bool]] = []
+        while t != s:
+            p = self.pred[base + t]
+            tracks.append((self.data.paths[(nodes[p], nodes[t])], False))
+            t = p
+        tracks.reverse()
+        return Route(tracks)
+
+    # --- 辺の変更に伴う差分更新 ---
+
+    def setPathCost(self, path: Path, cost: int) -> None:
+        oldCost = path.cost
+        path.cost = cost
+        self._applyChange(path, oldCost, cost)
+
+    def addPath(self, path: Path) -> None:
+        key = (path.fromPoint, path.toPoint)
+        old = self.data.paths.get(key)
+        self.data.paths[key] = path
+        self._applyChange(path, old.cost if old else math.inf, path.cost)
+
+    def removePath(self, path: Path) -> None:
+        key = (path.fromPoint, path.toPoint)
+        if self.data.paths.get(key) is not path:
+            raise KeyError(f'経路 {path!r} は存在しません。')
+        del self.data.paths[key]
+        self._applyChange(path, path.cost, math.inf)
+
+    def _applyChange(self, path: Path, oldCost: float, newCost: float) -> None:
+        u = self._index(path.fromPoint)
+        v = self._index(path.toPoint)
+        if math.isinf(newCost):
+            self.graph.removePath(path)
+        else:
+            self.graph.setPath(path)
+        if not self._hashStale:
+            # ハッシュ (辺の数に比例) は変更のたびには計算せず、sync / close でまとめて書く。
+            # それまでに終了しても次の open で作り直されるよう、先に無効な値にしておく
+            self._mmap[self._HASH_OFFSET:self._HASH_OFFSET + 32] = bytes(32)
+            self._hashStale = True
+        if newCost < oldCost:
+            self._relax(u, v, newCost)
+        elif newCost > oldCost:
+            self._recomputeRowsUsing(u, v)
+
+    # 辺 u→v が安くなった (追加された) 場合: 新しい辺を経由した方が短くなる組だけを更新する
+    def _relax(self, u: int, v: int, cost: float) -> None:
+        dist, pred, n = self.dist, self.pred, self.nodeCount
+        fromV, predEdgeFromV = self.graph.search(v)
+        predFromV = self._predNodes(predEdgeFromV)
+        for s in range(self.rowCount):
+            base = s * n
+            via = dist[base + u] + cost
+            if not via < dist[base + v]:
+                continue
+            for t in range(n):
+                nd = via + fromV[t]
+                if nd < dist[base + t]:
+                    dist[base + t] = nd
+                    pred[base + t] = u if t == v else predFromV[t]
+
+    # 辺 u→v が高くなった (削除された) 場合: その辺を最短路木で使っていた出発点だけを再計算する。
+    # 出発点が少なければ同じプロセスで、多ければ共有のワーカーで計算する (local.shortestpath.searchMany)
+    def _recomputeRowsUsing(self, u: int, v: int) -> None:
+        n = self.nodeCount
+        rows = [s for s in range(self.rowCount) if self.pred[s * n + v] == u]
+        if not rows:
+            return
+        results = self.graph.shortestPaths([self.graph.nodes[s] for s in rows])
+        for s in rows:
+            dist, predEdge = results[self.graph.nodes[s]]
+            base = s * n
+            self.dist[base:base + n] = dist
+            self.pred[base:base + n] = self._predNodes(predEdge)
@@ -0,0 +1,288 @@
+import array
+import mmap
+import os
+import struct
+import typing
+import uuid
+from collections.abc import MutableMapping
+
+from local.entities import *
+from local.io.util import *
+
+# Data の中身を整数インデックスの列指向配列として保存するバイナリ形式。
+# 読込時はファイルをメモリマップし、Point / Path などのオブジェクトはアクセスされたときに初めて作る。
+#
+# ノード番号は拠点 0..P-1、経由地 P..P+W-1。ファイルの構成は _layout を参照。
+
+# 整数値として読めなかった値 (XmlUtil.toInt が None を返したもの) を表す
+_NONE_INT = -2 ** 63
+
+class _LazyMapping(MutableMapping):
+    # 0..count-1 の番号で管理される辞書。値は valueAt で必要になったときに作ってキャッシュする。
+    # 書き換えられたら全要素を実体化して普通の dict として扱う。
+    def __init__(self, count: int, keyAt: typing.Callable[[int], typing.Any], indexOf: typing.Callable[[typing.Any], int | None], valueAt: typing.Callable[[int], typing.Any]):
+        self._count = count
+        self._keyAt = keyAt
+        self._indexOf = indexOf
+        self._valueAt = valueAt
+        self._dict: dict | None = None
+
+    def _materialize(self) -> dict:
+        if self._dict is None:
+            self._dict = {self._keyAt(i): self._valueAt(i) for i in range(self._count)}
+        return self._dict
+
+    def __getitem__(self, key):
+        if self._dict is not None:
+            return self._dict[key]
+        index = self._indexOf(key)
+        if index is None:
+            raise KeyError(key)
+        return self._valueAt(index)
+
+    def __contains__(self, key) -> bool:
+        if self._dict is not None:
+            return key in self._dict
+        return self._indexOf(key) is not None
+
+    def __iter__(self):
+        if self._dict is not None:
+            return iter(self._dict)
+        return (self._keyAt(i) for i in range(self._count))
+
+    def __len__(self) -> int:
+        if self._dict is not None:
+            return len(self._dict)
+        return self._count
+
+    def __setitem__(self, key, value) -> None:
+        self._materialize()[key] = value
+
+    def __delitem__(self, key) -> None:
+        del self._materialize()[key]
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+class Snapshot:
+    _MAGIC = b'MTSN'
+    _VERSION = 1
+    # マジック, バージョン, カテゴリ数, 拠点数, 経由地数, グループ数, グループ所属数, 経路数, 文字列の総バイト数
+    _HEADER = struct.Struct('<4sIIIIIIIQ')
+
+    @staticmethod
+    def _layout(c: int, p: int, w: int, g: int, members: int, e: int, blobLength: int) -> dict[str, tuple[str, int, int]]:
+        # 各配列の (型, 要素数, ファイル先頭からのオフセット)。すべて 8 バイト境界に揃える
+        stringCount = 2 * c + 2 * p + 2 * w + g
+        sections = [
+            ('stringOffsets', 'q', stringCount + 1),
+            ('strings', 'B', blobLength),
+            ('fromAmounts', 'q', p * c),
+            ('toAmounts', 'q', p * c),
+            ('hasObject', 'B', p * c),
+            ('groupOffsets', 'q', g + 1),
+            ('groupMembers', 'i', members),
+            ('pathSources', 'i', e),
+            ('pathTargets', 'i', e),
+            ('pathCosts', 'q', e),
+            ('pathInternal', 'B', e),
+            ('adjacencyOffsets', 'q', p + w + 1),
+            ('adjacencyPaths', 'i', e),
+        ]
+        layout = {}
+        offset = Snapshot._HEADER.size
+        for name, typecode, count in sections:
+            offset += -offset % 8
+            layout[name] = (typecode, count, offset)
+            offset += count * array.array(typecode).itemsize
+        return layout
+
+    @classmethod
+    def save(cls, data: 'Data', path: str) -> None:
+        categoryKeys = list(data.objectCategories)
+        categoryIndices = {category: i for i, category in enumerate(data.objectCategories.values())}
+        nodeKeys = list(data.points) + list(data.waypoints)
+        nodes = list(data.points.values()) + list(data.waypoints.values())
+        nodeIndices = {node: i for i, node in enumerate(nodes)}
+        c, p, w = len(categoryKeys), len(data.points), len(data.waypoints)
+
+        strings = categoryKeys + [category.name for category in data.objectCategories.values()]
+        strings += nodeKeys[:p] + [point.name for point in data.points.values()]
+        strings += nodeKeys[p:] + [waypoint.name for waypoint in data.waypoints.values()]
+        strings += list(data.groups)
+        encoded = [text.encode() for text in strings]
+        stringOffsets = array.array('q', [0])
+        for text in encoded:
+            stringOffsets.append(stringOffsets[-1] + len(text))
+        blob = b''.join(encoded)
+
+        fromAmounts = array.array('q', [0]) * (p * c)
+        toAmounts = array.array('q', [0]) * (p * c)
+        hasObject = bytearray(p * c)
+        for i, point in enumerate(data.points.values()):
+            for category, change in point.objects.items():
+                j = i * c + categoryIndices[category]
+                fromAmounts[j] = _NONE_INT if change.fromAmount is None else change.fromAmount
+                toAmounts[j] = _NONE_INT if change.toAmount is None else change.toAmount
+                hasObject[j] = 1
+
+        groupOffsets = array.array('q', [0])
+        groupMembers = array.array('i')
+        for members in data.groups.values():
+            groupMembers.extend(nodeIndices[node] for node in members)
+            groupOffsets.append(len(groupMembers))
+
+        # 経路は data.paths の順に並べ、始点ごとの索引 (CSR) を別に持つ
+        paths = list(data.paths.values())
+        pathSources = array.array('i', [nodeIndices[path.fromPoint] for path in paths])
+        pathTargets = array.array('i', [nodeIndices[path.toPoint] for path in paths])
+        pathCosts = array.array('q', [_NONE_INT if path.cost is None else path.cost for path in paths])
+        pathInternal = bytes(1 if path.isInternal else 0 for path in paths)
+        adjacencyOffsets = array.array('q', [0]) * (len(nodes) + 1)
+        for source in pathSources:
+            adjacencyOffsets[source + 1] += 1
+        for i in range(len(nodes)):
+            adjacencyOffsets[i + 1] += adjacencyOffsets[i]
+        adjacencyPaths = array.array('i', [0]) * len(paths)
+        cursor = adjacencyOffsets[:-1]
+        for e, source in enumerate(pathSources):
+            adjacencyPaths[cursor[source]] = e
+            cursor[source] += 1
+
+        values = {
+            'stringOffsets': stringOffsets, 'strings': blob,
+            'fromAmounts': fromAmounts, 'toAmounts': toAmounts, 'hasObject': hasObject,
+            'groupOffsets': groupOffsets, 'groupMembers': groupMembers,
+            'pathSources': pathSources, 'pathTargets': pathTargets, 'pathCosts': pathCosts, 'pathInternal': pathInternal,
+            'adjacencyOffsets': adjacencyOffsets, 'adjacencyPaths': adjacencyPaths,
+        }
+        counts = (c, p, w, len(data.groups), len(groupMembers), len(paths), len(blob))
+        layout = cls._layout(*counts)
+        # 上書きするファイルを loadSnapshot した Data がまだメモリマップしていることがあるので、
+        # 別のファイルに書いてから置き換える (マップ中の内容は古いファイルのまま残る)
+        directory = os.path.dirname(os.path.abspath(path))
+        temporaryPath = os.path.join(directory, f'.{os.path.basename(path)}.{uuid.uuid4().hex}.tmp')
+        try:
+            with open(temporaryPath, 'wb') as f:
+                f.write(cls._HEADER.pack(cls._MAGIC, cls._VERSION, *counts))
+                for name, (_, _, offset) in layout.items():
+                    f.write(b'\0' * (offset - f.tell()))
+                    f.write(values[name])
+            os.replace(temporaryPath, path)
+        except BaseException:
+            if os.path.exists(temporaryPath):
+                os.remove(temporaryPath)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> 'Data':
+        from local.io.data import Data
+
+        try:
+            with open(path, 'rb') as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, *counts = cls._HEADER.unpack_from(buffer)
+        except (ValueError, struct.error) as e:
+            raise FileFormatError(path, innerException=e)
+        if magic != cls._MAGIC or version != cls._VERSION:
+            raise FileFormatError(path, 'スナップショットの形式が正しくありません。')
+        c, p, w, g, _, e, _ = counts
+
+        view = memoryview(buffer)
+        arrays = {}
+        for name, (typecode, count, offset) in cls._layout(*counts).items():
+            size = count * array.array(typecode).itemsize
+            if offset + size > len(buffer):
+                raise FileFormatError(path, 'スナップショットが途中で切れています。')
+            arrays[name] = view[offset:offset + size].cast(typecode)
+        stringOffsets = arrays['stringOffsets']
+        strings = arrays['strings']
+
+        def text(i: int) -> str:
+            return str(strings[stringOffsets[i]:stringOffsets[i + 1]], 'utf-8')
+
+        def toValue(value: int) -> int | None:
+            return None if value == _NONE_INT else value
+
+        # 文字列表の中での各種キー・名前の開始位置
+        categoryKeyBase, categoryNameBase = 0, c
+        pointKeyBase, pointNameBase = 2 * c, 2 * c + p
+        waypointKeyBase, waypointNameBase = 2 * c + 2 * p, 2 * c + 2 * p + w
+        groupKeyBase = 2 * c + 2 * p + 2 * w
+
+        def keyIndex(base: int, count: int) -> typing.Callable[[str], int | None]:
+            # キー → 番号の索引は最初に引かれたときに作る
+            index: dict[str, int] = {}
+
+            def indexOf(key) -> int | None:
+                if not index and count:
+                    index.update((text(base + i), i) for i in range(count))
+                return index.get(key)
+            return indexOf
+
+        categoryCache: list[ObjectCategory | None] = [None] * c
+        def categoryAt(i: int) -> ObjectCategory:
+            category = categoryCache[i]
+            if category is None:
+                category = categoryCache[i] = ObjectCategory(text(categoryNameBase + i))
+            return category
+
+        nodeCache: list[Point | None] = [None] * (p + w)
+        nodeIndices: dict[Point, int] = {}
+        def nodeAt(i: int) -> Point:
+            node = nodeCache[i]
+            if node is None:
+                if i < p:
+                    objects: dict[ObjectCategory, QuantityChange] = {}
+                    for j in range(c):
+                        k = i * c + j
+                        if arrays['hasObject'][k]:
+                            objects[categoryAt(j)] = QuantityChange(toValue(arrays['fromAmounts'][k]), toValue(arrays['toAmounts'][k]))
+                    node = Point(text(pointNameBase + i), objects)
+                else:
+                    node = Waypoint(text(waypointNameBase + i - p))
+                nodeCache[i] = node
+                nodeIndices[node] = i
+            return node
+
+        pathCache: list[Path | None] = [None] * e
+        def pathAt(i: int) -> Path:
+            path = pathCache[i]
+            if path is None:
+                path = pathCache[i] = Path(nodeAt(arrays['pathSources'][i]), nodeAt(arrays['pathTargets'][i]), toValue(arrays['pathCosts'][i]), bool(arrays['pathInternal'][i]))
+            return path
+
+        def pathIndexOf(key) -> int | None:
+            try:
+                fromPoint, toPoint = key
+            except (TypeError, ValueError):
+                return None
+            source = nodeIndices.get(fromPoint)
+            target = nodeIndices.get(toPoint)
+            if source is None or target is None:
+                return None
+            # 同じ始点・終点の経路が複数あれば後のものが有効 (dict と同じ)
+            found = None
+            for k in range(arrays['adjacencyOffsets'][source], arrays['adjacencyOffsets'][source + 1]):
+                pathIndex = arrays['adjacencyPaths'][k]
+                if arrays['pathTargets'][pathIndex] == target:
+                    found = pathIndex
+            return found
+
+        groupOffsets = arrays['groupOffsets']
+        groupMembers = arrays['groupMembers']
+        # 所属する拠点のリストも一度作ったものを返す (data.groups[k].append(p) などの変更が残るように)
+        groupCache: list[list[Point] | None] = [None] * g
+        def groupAt(i: int) -> list[Point]:
+            members = groupCache[i]
+            if members is None:
+                members = groupCache[i] = [nodeAt(groupMembers[k]) for k in range(groupOffsets[i], groupOffsets[i + 1])]
+            return members
+
+        categories = _LazyMapping(c, lambda i: text(categoryKeyBase + i), keyIndex(categoryKeyBase, c), categoryAt)
+        points = _LazyMapping(p, lambda i: text(pointKeyBase + i), keyIndex(pointKeyBase, p), nodeAt)
+        waypoints = _LazyMapping(w, lambda i: text(waypointKeyBase + i), keyIndex(waypointKeyBase, w), lambda i: nodeAt(p + i))
+        groups = _LazyMapping(g, lambda i: text(groupKeyBase + i), keyIndex(groupKeyBase, g), groupAt)
+        paths = _LazyMapping(e, lambda i: (nodeAt(arrays['pathSources'][i]), nodeAt(arrays['pathTargets'][i])), pathIndexOf, pathAt)
+
+        return Data(categories, points, waypoints, groups, paths)
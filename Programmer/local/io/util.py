@@ -5,6 +5,7 @@ class FileFormatError(Exception):
     def __init__(self, fileName: str, message: str | None = None, innerException: Exception | None = None):
         self.fileName = fileName
         self.innerException = innerException
+        self.message = message
 
         if not message:
             if innerException:
@@ -13,6 +14,10 @@ class FileFormatError(Exception):
                 message = 'ファイルの読込に失敗しました。ファイルが破損している可能性があります。'
         super().__init__([f'Failed to parse \'{fileName}\'. ' + message])
 
+    # ワーカープロセスから受け渡せるよう、コンストラクタ引数で復元する
+    def __reduce__(self):
+        return (FileFormatError, (self.fileName, self.message, self.innerException))
+
 class XmlUtil:
     @staticmethod
     def ioToXml(f: typing.IO[bytes], rootTag: str, fileName: str) -> ElementTree.Element:
@@ -0,0 +1,479 @@
+import contextlib
+import os
+import struct
+import time
+import typing
+import uuid
+import zipfile
+import zlib
+from xml.sax.saxutils import escape, quoteattr
+
+from local.entities import *
+from local.io.util import *
+
+# Data.load が読む zip 形式 (.dat) への書き出し。
+# 読込時の各エントリの内容 (SourceArchive) と比べて変わった拠点・ファイルだけを XML に書き直し、
+# 変わっていないエントリは元のファイルから圧縮済みのバイト列をそのままコピーする。
+# zip は自前で書く (zipfile には圧縮済みデータをそのまま書き込む方法がないため)。
+# 自前の書き出しは ZIP64 に対応しないので、元のファイルや保存後のファイルが ZIP64 を必要とするときは zipfile ですべて書き直す。
+
+_FILENAME_OBJECTS = 'Objects.xml'
+_FILENAME_PATHS = 'Paths.xml'
+_DIR_POINTS = 'Points/'
+
+_LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+_CENTRAL_HEADER = struct.Struct('<4sBBBBHHHHIIIHHHHHII')
+_END_OF_CENTRAL_DIRECTORY = struct.Struct('<4sHHHHIIH')
+_OFFSET = struct.Struct('<I')
+_FLAG_UTF8 = 0x800
+_ZIP32_LIMIT = 0xFFFFFFFF
+_COPY_CHUNK = 1 << 20
+_NEWLINE = '\r\n'
+
+# zip のエントリ 1 つ分: (エントリ名, 中央ディレクトリのレコード, ローカルヘッダーの位置, データ (記述子を含む) の終わりの位置)
+ZipEntry = tuple[str, bytes, int, int]
+
+def _dosDateTime(dateTime: tuple) -> tuple[int, int]:
+    year, month, day, hour, minute, second = dateTime[:6]
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+def _encodeName(name: str, flags: int) -> bytes:
+    # zipfile は UTF-8 フラグの無い名前を cp437 として読むので、同じ規則で戻す
+    return name.encode('utf-8') if flags & _FLAG_UTF8 else name.encode('cp437')
+
+# 自前の書き出しでは ZIP64 が必要な大きさ・数になる (zipfile での書き出しに切り替える)
+class _Zip64Required(ValueError):
+    def __init__(self):
+        super().__init__('ZIP64 が必要な大きさのファイルは保存できません。')
+
+def _centralRecord(nameBytes: bytes, flags: int, method: int, dosTime: int, dosDate: int, crc: int,
+                   compressSize: int, fileSize: int, offset: int, createSystem: int, externalAttr: int) -> bytes:
+    if offset > _ZIP32_LIMIT or compressSize > _ZIP32_LIMIT or fileSize > _ZIP32_LIMIT:
+        raise _Zip64Required()
+    return _CENTRAL_HEADER.pack(b'PK\x01\x02', 20, createSystem, 20, 0, flags, method, dosTime, dosDate, crc,
+                                compressSize, fileSize, len(nameBytes), 0, 0, 0, 0, externalAttr, offset) + nameBytes
+
+# 元のファイルの中央ディレクトリのレコードを、拡張フィールドやバージョンも含めてそのまま取り出す。
+# 戻り値の 2 つ目は、ZIP64 を使っている (レコードをそのままコピーできない) か
+def _readEntries(path: str) -> tuple[list[ZipEntry], bool]:
+    with zipfile.ZipFile(path) as zf, open(path, 'rb') as f:
+        infos = zf.infolist()
+        # 各エントリのデータは、次のエントリのローカルヘッダー (最後のエントリは中央ディレクトリ) の手前まで
+        offsets = sorted({info.header_offset for info in infos})
+        ends = dict(zip(offsets, offsets[1:] + [zf.start_dir]))
+        f.seek(zf.start_dir)
+        directory = f.read()
+        requiresZip64 = len(infos) > 0xFFFF or zf.start_dir > _ZIP32_LIMIT
+
+    entries = []
+    position = 0
+    for info in infos:
+        fields = _CENTRAL_HEADER.unpack_from(directory, position)
+        if fields[0] != b'PK\x01\x02':
+            raise FileFormatError(path)
+        compressSize, fileSize, nameLength, extraLength, commentLength, disk = fields[10:16]
+        if _ZIP32_LIMIT in (compressSize, fileSize, fields[18]) or disk == 0xFFFF:
+            requiresZip64 = True
+        length = _CENTRAL_HEADER.size + nameLength + extraLength + commentLength
+        entries.append((info.filename, directory[position:position + length], info.header_offset,
+                        ends[info.header_offset]))
+        position += length
+    return entries, requiresZip64
+
+# 文字列の断片を、_COPY_CHUNK 程度にまとめた UTF-8 のバイト列にする
+def _encodeChunks(pieces: typing.Iterable[str]) -> typing.Iterator[bytes]:
+    buffer: list[str] = []
+    bufferLength = 0
+    for piece in pieces:
+        buffer.append(piece)
+        bufferLength += len(piece)
+        if bufferLength >= _COPY_CHUNK:
+            yield ''.join(buffer).encode('utf-8')
+            buffer.clear()
+            bufferLength = 0
+    yield ''.join(buffer).encode('utf-8')
+
+# Data.load で読んだ (または save で書いた) ときの各エントリの内容。保存時に変更の有無を判定するために使う。
+# 読込を遅くしないよう、Data.load では読んだ値をそのまま並べておくだけにし、
+# 比較用の辞書と zip のエントリの一覧は最初に使うとき (save / dirtyPointKeys) に作る
+class SourceArchive:
+    def __init__(self, path: str):
+        stat = os.stat(path)
+        self.path = path
+        self.size = stat.st_size
+        self.mtimeNs = stat.st_mtime_ns
+        # ((Key, Name), ...)
+        self.categories: tuple = ()
+        # [(Key, Name, Group), ...]
+        self.waypoints: list[tuple[str, str, str]] = []
+        # Data.load で読んだ順の拠点 [(エントリ名, Key, Name, Group, [(CategoryKey, From, To), ...]), ...]
+        self.loadedPoints: list[tuple[str, str, str, str, list[tuple[str, int, int]]]] = []
+        # Data.load で読んだ順の辺 [(始点キー, 終点キー, コスト, 逆向きのコスト, 内部通路か), ...]
+        self.loadedPaths: list[tuple[str, str, int, int, bool]] = []
+        self._entries: list[ZipEntry] | None = None
+        self._requiresZip64 = False
+        self._points: dict[str, tuple[str, tuple]] | None = None
+        self._paths: dict[tuple[str, str], tuple[int, bool]] | None = None
+
+    # save で書いたファイル。entries が None (zipfile で書いた) ならエントリの一覧は使うときに読む
+    @classmethod
+    def saved(cls, path: str, entries: list[ZipEntry] | None, points: dict[str, tuple[str, tuple]], categories: tuple,
+              waypoints: list[tuple[str, str, str]], paths: dict[tuple[str, str], tuple[int, bool]]) -> 'SourceArchive':
+        source = cls(path)
+        source._entries = entries
+        source._points = points
+        source.categories = categories
+        source.waypoints = waypoints
+        source._paths = paths
+        return source
+
+    @property
+    def entries(self) -> list[ZipEntry]:
+        if self._entries is None:
+            self._entries, self._requiresZip64 = _readEntries(self.path)
+        return self._entries
+
+    # ZIP64 を使っているファイルは、エントリをコピーせず zipfile ですべて書き直す
+    @property
+    def requiresZip64(self) -> bool:
+        if self._entries is None:
+            self._entries, self._requiresZip64 = _readEntries(self.path)
+        return self._requiresZip64
+
+    # 拠点キー -> (エントリ名, (Name, Group, ((CategoryKey, From, To), ...)))
+    @property
+    def points(self) -> dict[str, tuple[str, tuple]]:
+        if self._points is None:
+            self._points = {}
+            for entry, key, name, group, objectValues in self.loadedPoints:
+                # 同じカテゴリが複数あるときは Point.objects と同じく後の値で上書きする
+                amounts = {categoryKey: (fromAmount, toAmount) for categoryKey, fromAmount, toAmount in objectValues}
+                objects = tuple((categoryKey, fromAmount, toAmount) for categoryKey, (fromAmount, toAmount) in amounts.items())
+                self._points[key] = (entry, (name, group, objects))
+            self.loadedPoints = []
+        return self._points
+
+    # Data.load と同じく、後に出てきた辺で上書きしたときの (始点キー, 終点キー) -> (コスト, 内部通路か)
+    @property
+    def paths(self) -> dict[tuple[str, str], tuple[int, bool]]:
+        if self._paths is None:
+            self._paths = {}
+            for fromKey, toKey, cost, oppositeCost, isInternal in self.loadedPaths:
+                self._paths[(fromKey, toKey)] = (cost, isInternal)
+                self._paths[(toKey, fromKey)] = (oppositeCost, isInternal)
+            self.loadedPaths = []
+        return self._paths
+
+    # 読込後に元のファイルが書き換えられていなければ、圧縮済みのバイト列を再利用できる
+    def isAvailable(self) -> bool:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return stat.st_size == self.size and stat.st_mtime_ns == self.mtimeNs
+
+class _ZipWriter:
+    def __init__(self, f: typing.BinaryIO, src: typing.BinaryIO | None = None):
+        self._f = f
+        self._src = src
+        self.entries: list[ZipEntry] = []
+        # まだコピーしていない元のファイルの範囲 [開始, 終了, 書き込み先の位置]
+        self._pending: list[int] | None = None
+
+    # 元の zip のエントリを、ローカルヘッダーごと圧縮済みのまま書き込む。
+    # 元のファイルで隣り合うエントリが続くあいだは、まとめて 1 回でコピーする
+    def copyRaw(self, entry: ZipEntry) -> None:
+        name, record, start, end = entry
+        if self._pending is None or self._pending[1] != start:
+            self._flush()
+            self._pending = [start, end, self._f.tell()]
+        else:
+            self._pending[1] = end
+        offset = self._pending[2] + start - self._pending[0]
+        if offset > _ZIP32_LIMIT:
+            raise _Zip64Required()
+        # 中央ディレクトリのレコードは、ローカルヘッダーの位置 (42 バイト目から) だけを書き換える
+        self.entries.append((name, record[:42] + _OFFSET.pack(offset) + record[46:], offset, offset + end - start))
+
+    def _flush(self) -> None:
+        if self._pending is None:
+            return
+        start, end, _ = self._pending
+        self._pending = None
+        self._src.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = self._src.read(min(remaining, _COPY_CHUNK))
+            if not chunk:
+                raise FileFormatError(self._src.name)
+            self._f.write(chunk)
+            remaining -= len(chunk)
+
+    # 文字列の断片を UTF-8 にして順に圧縮しながら書き込む
+    def writeText(self, name: str, pieces: typing.Iterable[str]) -> None:
+        self._flush()
+        flags = 0 if name.isascii() else _FLAG_UTF8
+        nameBytes = _encodeName(name, flags)
+        dosTime, dosDate = _dosDateTime(time.localtime())
+        offset = self._f.tell()
+        # CRC とサイズは書き終えてから埋める
+        self._f.write(_LOCAL_HEADER.pack(b'PK\x03\x04', 20, flags, zipfile.ZIP_DEFLATED, dosTime, dosDate, 0, 0, 0,
+                                         len(nameBytes), 0) + nameBytes)
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        crc = fileSize = compressSize = 0
+        for data in _encodeChunks(pieces):
+            crc = zlib.crc32(data, crc)
+            fileSize += len(data)
+            compressed = compressor.compress(data)
+            compressSize += len(compressed)
+            self._f.write(compressed)
+        compressed = compressor.flush()
+        compressSize += len(compressed)
+        self._f.write(compressed)
+
+        end = self._f.tell()
+        self._f.seek(offset + 14)
+        self._f.write(struct.pack('<III', crc, compressSize, fileSize))
+        self._f.seek(end)
+        record = _centralRecord(nameBytes, flags, zipfile.ZIP_DEFLATED, dosTime, dosDate, crc, compressSize, fileSize,
+                                offset, 3, 0o100644 << 16)
+        self.entries.append((name, record, offset, end))
+
+    def writeDirectory(self, name: str) -> None:
+        self._flush()
+        flags = 0 if name.isascii() else _FLAG_UTF8
+        nameBytes = _encodeName(name, flags)
+        dosTime, dosDate = _dosDateTime(time.localtime())
+        offset = self._f.tell()
+        self._f.write(_LOCAL_HEADER.pack(b'PK\x03\x04', 20, flags, zipfile.ZIP_STORED, dosTime, dosDate, 0, 0, 0,
+                                         len(nameBytes), 0) + nameBytes)
+        record = _centralRecord(nameBytes, flags, zipfile.ZIP_STORED, dosTime, dosDate, 0, 0, 0, offset, 3,
+                                (0o40755 << 16) | 0x10)
+        self.entries.append((name, record, offset, self._f.tell()))
+
+    def close(self) -> None:
+        self._flush()
+        if len(self.entries) > 0xFFFF:
+            raise _Zip64Required()
+        start = self._f.tell()
+        self._f.write(b''.join(record for _, record, _, _ in self.entries))
+        size = self._f.tell() - start
+        if start > _ZIP32_LIMIT:
+            raise _Zip64Required()
+        self._f.write(_END_OF_CENTRAL_DIRECTORY.pack(b'PK\x05\x06', 0, 0, len(self.entries), len(self.entries),
+                                                     size, start, 0))
+
+# ZIP64 が必要なときの、zipfile による書き出し (元のファイルからはコピーせず、すべてのエントリを書き直す)
+class _ZipFileWriter:
+    def __init__(self, zf: zipfile.ZipFile):
+        self._zf = zf
+
+    def writeText(self, name: str, pieces: typing.Iterable[str]) -> None:
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = 0o100644 << 16
+        with self._zf.open(info, 'w', force_zip64=True) as f:
+            for data in _encodeChunks(pieces):
+                f.write(data)
+
+    def writeDirectory(self, name: str) -> None:
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        info.external_attr = (0o40755 << 16) | 0x10
+        self._zf.writestr(info, b'')
+
+def _attribute(name: str, value) -> str:
+    return f' {name}={quoteattr(str(value))}'
+
+def _pointXml(key: str, point: Point, group: str, categoryKeyOf: dict[int, str]) -> typing.Iterator[str]:
+    yield f'<?xml version="1.0" encoding="utf-8"?>{_NEWLINE}<Point>{_NEWLINE}'
+    yield f'  <Key>{escape(key)}</Key>{_NEWLINE}'
+    yield f'  <Name>{escape(point.name)}</Name>{_NEWLINE}'
+    yield f'  <Group>{escape(group)}</Group>{_NEWLINE}'
+    yield f'  <Objects>{_NEWLINE}'
+    for category, change in point.objects.items():
+        yield (f'    <Object{_attribute("CategoryKey", categoryKeyOf[id(category)])}'
+               f'{_attribute("From", change.fromAmount)}{_attribute("To", change.toAmount)} />{_NEWLINE}')
+    yield f'  </Objects>{_NEWLINE}</Point>{_NEWLINE}'
+
+def _objectsXml(categories: typing.Mapping[str, ObjectCategory]) -> typing.Iterator[str]:
+    yield f'<?xml version="1.0" encoding="utf-8"?>{_NEWLINE}<ObjectCollection>{_NEWLINE}  <Categories>{_NEWLINE}'
+    for key, category in categories.items():
+        yield f'    <ObjectCategory{_attribute("Key", key)}{_attribute("Name", category.name)} />{_NEWLINE}'
+    yield f'  </Categories>{_NEWLINE}</ObjectCollection>{_NEWLINE}'
+
+def _pathsXml(waypoints: list[tuple[str, str, str]],
+              paths: dict[tuple[str, str], tuple[int, bool]]) -> typing.Iterator[str]:
+    yield f'<?xml version="1.0" encoding="utf-8"?>{_NEWLINE}<PathCollection>{_NEWLINE}  <Waypoints>{_NEWLINE}'
+    for key, name, group in waypoints:
+        yield f'    <Waypoint{_attribute("Key", key)}{_attribute("Name", name)}{_attribute("Group", group)} />{_NEWLINE}'
+    yield f'  </Waypoints>{_NEWLINE}  <Paths>{_NEWLINE}'
+    # 逆向きの辺は OppositeCost として同じ要素にまとめる
+    written: set[tuple[str, str]] = set()
+    for (fromKey, toKey), (cost, isInternal) in paths.items():
+        if (fromKey, toKey) in written:
+            continue
+        written.add((fromKey, toKey))
+        written.add((toKey, fromKey))
+        text = f'    <Path{_attribute("Point1Key", fromKey)}{_attribute("Point2Key", toKey)}{_attribute("Cost", cost)}'
+        opposite = paths.get((toKey, fromKey))
+        if opposite is not None and opposite[0] != cost:
+            text += _attribute('OppositeCost', opposite[0])
+        if isInternal:
+            text += _attribute('IsInternal', 'true')
+        yield text + f' />{_NEWLINE}'
+    yield f'  </Paths>{_NEWLINE}</PathCollection>{_NEWLINE}'
+
+class DataWriter:
+    @staticmethod
+    def _groupKeys(data) -> dict[int, str]:
+        groupOf: dict[int, str] = {}
+        for groupKey, groupPoints in data.groups.items():
+            for point in groupPoints:
+                groupOf[id(point)] = groupKey
+        return groupOf
+
+    @staticmethod
+    def _pointSignature(point: Point, group: str | None, categoryKeyOf: dict[int, str]) -> tuple:
+        try:
+            objects = tuple([(categoryKeyOf[id(category)], change.fromAmount, change.toAmount)
+                             for category, change in point.objects.items()])
+        except KeyError:
+            raise ValueError(f'拠点 \'{point.name}\' に objectCategories に無い物品カテゴリがあります。')
+        return point.name, group, objects
+
+    # グループが分からない拠点 (差し替えられた Point など) は読込時のグループのままにする
+    @staticmethod
+    def _pointGroup(key: str, point: Point, groupOf: dict[int, str], source: SourceArchive | None) -> str | None:
+        group = groupOf.get(id(point))
+        if group is None and source is not None and key in source.points:
+            group = source.points[key][1][1]
+        return group
+
+    # 読込時から内容が変わった拠点のキー (新しく追加された拠点を含む)。
+    # 変更を記録しているのではなく、全拠点の値を読込時の値と比べるので、1 回の呼び出しに拠点数 × 物品数に比例する時間がかかる
+    # (初回は読込時の値から比較用の辞書も作る)
+    @classmethod
+    def dirtyPointKeys(cls, data) -> list[str]:
+        source = data._source
+        if source is None:
+            return list(data.points)
+        categoryKeyOf = {id(category): key for key, category in data.objectCategories.items()}
+        groupOf = cls._groupKeys(data)
+        dirty = []
+        for key, point in data.points.items():
+            loaded = source.points.get(key)
+            group = cls._pointGroup(key, point, groupOf, source)
+            if loaded is None or loaded[1] != cls._pointSignature(point, group, categoryKeyOf):
+                dirty.append(key)
+        return dirty
+
+    # copy が真なら source のエントリのうち変わっていないものをそのままコピーし、偽ならすべて書き直す。
+    # 戻り値は保存後の各拠点の (エントリ名, 内容)
+    @classmethod
+    def _writeEntries(cls, writer, data, source: SourceArchive | None, copy: bool, categories: tuple,
+                      waypoints: list[tuple[str, str, str]], paths: dict[tuple[str, str], tuple[int, bool]],
+                      groupOf: dict[int, str], categoryKeyOf: dict[int, str]) -> dict[str, tuple[str, tuple]]:
+        savedPoints: dict[str, tuple[str, tuple]] = {}
+
+        def writePoint(entry: str, key: str, point: Point, signature: tuple) -> None:
+            if signature[1] is None:
+                signature = (signature[0], str(uuid.uuid4()), signature[2])
+            writer.writeText(entry, _pointXml(key, point, signature[1], categoryKeyOf))
+            savedPoints[key] = (entry, signature)
+
+        written: set[str] = set()
+        if copy:
+            pointEntries = {entry: key for key, (entry, _) in source.points.items()}
+            for entry in source.entries:
+                name = entry[0]
+                if name == _FILENAME_OBJECTS:
+                    if categories == source.categories:
+                        writer.copyRaw(entry)
+                    else:
+                        writer.writeText(name, _objectsXml(data.objectCategories))
+                elif name == _FILENAME_PATHS:
+                    if waypoints == source.waypoints and paths == source.paths:
+                        writer.copyRaw(entry)
+                    else:
+                        writer.writeText(name, _pathsXml(waypoints, paths))
+                elif name in pointEntries:
+                    key = pointEntries[name]
+                    point = data.points.get(key)
+                    if point is None:
+                        # 削除された拠点
+                        continue
+                    group = cls._pointGroup(key, point, groupOf, source)
+                    signature = cls._pointSignature(point, group, categoryKeyOf)
+                    if source.points[key][1] == signature:
+                        writer.copyRaw(entry)
+                        savedPoints[key] = source.points[key]
+                    else:
+                        writePoint(name, key, point, signature)
+                else:
+                    # 読込に使わないエントリ (ディレクトリなど) はそのまま残す
+                    writer.copyRaw(entry)
+                written.add(name)
+        else:
+            writer.writeText(_FILENAME_OBJECTS, _objectsXml(data.objectCategories))
+            writer.writeText(_FILENAME_PATHS, _pathsXml(waypoints, paths))
+            writer.writeDirectory(_DIR_POINTS)
+            written.update([_FILENAME_OBJECTS, _FILENAME_PATHS, _DIR_POINTS])
+
+        # 新しく追加された拠点 (すべて書き直すときは全拠点)
+        for key, point in data.points.items():
+            if key in savedPoints:
+                continue
+            signature = cls._pointSignature(point, cls._pointGroup(key, point, groupOf, source), categoryKeyOf)
+            name = f'{_DIR_POINTS}{key}.xml'
+            if name in written or '/' in key:
+                name = f'{_DIR_POINTS}{uuid.uuid4()}.xml'
+            writePoint(name, key, point, signature)
+            written.add(name)
+        return savedPoints
+
+    @classmethod
+    def save(cls, data, path: str) -> None:
+        categoryKeyOf = {id(category): key for key, category in data.objectCategories.items()}
+        groupOf = cls._groupKeys(data)
+        nodeKeyOf = {id(point): key for key, point in data.points.items()}
+        nodeKeyOf.update((id(waypoint), key) for key, waypoint in data.waypoints.items())
+        paths: dict[tuple[str, str], tuple[int, bool]] = {}
+        for edge in data.paths.values():
+            fromKey, toKey = nodeKeyOf.get(id(edge.fromPoint)), nodeKeyOf.get(id(edge.toPoint))
+            if fromKey is None or toKey is None:
+                raise ValueError(f'辺 {edge} の端点が拠点・経由地にありません。')
+            paths[(fromKey, toKey)] = (edge.cost, edge.isInternal)
+        categories = tuple((key, category.name) for key, category in data.objectCategories.items())
+
+        # 読込後に元のファイルが書き換えられていたら、すべて書き直す
+        source = data._source if data._source is not None and data._source.isAvailable() else None
+        sourceWaypointGroups = {key: group for key, _, group in source.waypoints} if source is not None else {}
+        waypoints = [(key, waypoint.name,
+                      groupOf.get(id(waypoint)) or sourceWaypointGroups.get(key) or str(uuid.uuid4()))
+                     for key, waypoint in data.waypoints.items()]
+        copy = source is not None and not source.requiresZip64
+
+        directory = os.path.dirname(os.path.abspath(path))
+        temporaryPath = os.path.join(directory, f'.{os.path.basename(path)}.{uuid.uuid4().hex}.tmp')
+        try:
+            try:
+                with open(temporaryPath, 'wb') as f, contextlib.ExitStack() as stack:
+                    src = stack.enter_context(open(source.path, 'rb')) if copy else None
+                    writer = _ZipWriter(f, src)
+                    savedPoints = cls._writeEntries(writer, data, source, copy, categories, waypoints, paths,
+                                                    groupOf, categoryKeyOf)
+                    writer.close()
+                entries = writer.entries
+            except _Zip64Required:
+                with zipfile.ZipFile(temporaryPath, 'w') as zf:
+                    savedPoints = cls._writeEntries(_ZipFileWriter(zf), data, source, False, categories, waypoints,
+                                                    paths, groupOf, categoryKeyOf)
+                entries = None
+            os.replace(temporaryPath, path)
+        except BaseException:
+            if os.path.exists(temporaryPath):
+                os.remove(temporaryPath)
+            raise
+
+        # 次の保存では、今回書いたファイルを元のファイルとして使う
+        data._source = SourceArchive.saved(path, entries, savedPoints, categories, waypoints, paths)
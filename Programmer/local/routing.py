@@ -0,0 +1,103 @@
+import array
+import math
+
+from local import shortestpath
+from local.entities import *
+from local.io.data import Data
+
+# Data.paths を整数インデックスの隣接配列 (CSR 形式) に変換したグラフ。
+# offsets[i]:offsets[i + 1] がノード i から出る辺の範囲で、targets / costs / paths はその辺の情報。
+class RouteGraph:
+    def __init__(self, keys: list[str], nodes: list[Point], offsets: array.array, targets: array.array, costs: array.array, paths: list[Path]):
+        self.keys = keys
+        self.nodes = nodes
+        self.indices = {node: i for i, node in enumerate(nodes)}
+        self.offsets = offsets
+        self.targets = targets
+        self.costs = costs
+        self.paths = paths
+        self.edgeSources = array.array('q', [self.indices[path.fromPoint] for path in paths])
+
+    @classmethod
+    def fromData(cls, data: Data) -> 'RouteGraph':
+        # 拠点を先に並べるので、拠点の番号は 0..len(data.points)-1 になる
+        keys = list(data.points) + list(data.waypoints)
+        nodes: list[Point] = list(data.points.values()) + list(data.waypoints.values())
+        indices = {node: i for i, node in enumerate(nodes)}
+
+        allPaths = list(data.paths.values())
+        offsets, targets, costs, order = shortestpath.buildCsr(len(nodes), [indices[path.fromPoint] for path in allPaths],
+                                                               [indices[path.toPoint] for path in allPaths],
+                                                               [path.cost for path in allPaths])
+        return RouteGraph(keys, nodes, offsets, targets, costs, [allPaths[i] for i in order])
+
+    # 辺 u→v の番号 (無ければ -1)
+    def edgeIndex(self, u: int, v: int) -> int:
+        for e in range(self.offsets[u], self.offsets[u + 1]):
+            if self.targets[e] == v:
+                return e
+        return -1
+
+    # 辺を追加するかコストを変える。グラフ全体は作り直さず、無い辺だけを u の範囲の末尾に差し込む
+    def setPath(self, path: Path) -> None:
+        u = self.indices[path.fromPoint]
+        v = self.indices[path.toPoint]
+        e = self.edgeIndex(u, v)
+        if e >= 0:
+            self.costs[e] = path.cost
+            self.paths[e] = path
+            return
+        e = self.offsets[u + 1]
+        self.targets.insert(e, v)
+        self.costs.insert(e, path.cost)
+        self.paths.insert(e, path)
+        self.edgeSources.insert(e, u)
+        for i in range(u + 1, len(self.offsets)):
+            self.offsets[i] += 1
+
+    # 辺を取り除く。配列からは消さずにコストを inf にする (探索では通らず、setPath で再利用される)
+    def removePath(self, path: Path) -> None:
+        e = self.edgeIndex(self.indices[path.fromPoint], self.indices[path.toPoint])
+        if e >= 0:
+            self.costs[e] = math.inf
+
+    def search(self, source: int) -> tuple[array.array, array.array]:
+        return shortestpath.dijkstra(self.offsets, self.targets, self.costs, source)
+
+    # 各出発点からダイクストラ法を実行し、出発点ごとに (距離, 直前の辺番号) の配列を返す。
+    # 出発点が多いときはプロセスを分けて並列に計算する (shortestpath.PARALLEL_MIN_SOURCES)。
+    def shortestPaths(self, sources: list[Point], maxWorkers: int | None = None) -> dict[Point, tuple[array.array, array.array]]:
+        sourceIndices = [self.indices[source] for source in sources]
+        results = shortestpath.searchMany((self.offsets, self.targets, self.costs), sourceIndices, maxWorkers)
+        return {self.nodes[i]: (dist, predEdge) for i, dist, predEdge in results}
+
+    def track(self, predEdge: array.array, source: Point, target: Point) -> Route | None:
+        edges = shortestpath.track(predEdge, self.edgeSources, self.indices[source], self.indices[target])
+        if edges is None:
+            return None
+        # Data.paths は両方向の Path を持つので、常に Path の向きどおりに辿る (逆走 = False)
+        return Route([(self.paths[e], False) for e in edges])
+
+    # 出発点から各目的地への最短経路をまとめた RouteSet を作る。
+    # 省略時は拠点 (Waypoint 以外) の全組み合わせを対象にする。到達できない組は含めない。
+    def routeSet(self, sources: list[Point] | None = None, targets: list[Point] | None = None, maxWorkers: int | None = None) -> RouteSet:
+        points = [node for node in self.nodes if not isinstance(node, Waypoint)]
+        if sources is None:
+            sources = points
+        if targets is None:
+            targets = points
+
+        routes: dict[tuple[Point, Point], Route] = {}
+        for source, (dist, predEdge) in self.shortestPaths(sources, maxWorkers).items():
+            for target in targets:
+                if target is source or math.isinf(dist[self.indices[target]]):
+                    continue
+                route = self.track(predEdge, source, target)
+                if route is not None:
+                    routes[(source, target)] = route
+        return RouteSet(routes)
+
+    # いずれかの物品の個数が減る (= 運び出す) 拠点
+    @staticmethod
+    def supplyPoints(data: Data) -> list[Point]:
+        return [point for point in data.points.values() if any(change.toAmount < change.fromAmount for change in point.objects.values())]
@@ -0,0 +1,97 @@
+import array
+import heapq
+import math
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# 整数インデックスの隣接配列 (CSR 形式) のグラフでのダイクストラ法と経路の復元。
+# グラフは (offsets, targets, costs) で、offsets[u]:offsets[u + 1] がノード u から出る辺の範囲。
+
+# 並列に探索するワーカープロセスの数 (1 なら常に同じプロセスで探索する)
+MAX_WORKERS = os.cpu_count() or 1
+# 出発点がこの数より少なければ、プロセスの起動・グラフの受け渡しの方が高くつくので並列にしない
+PARALLEL_MIN_SOURCES = 64
+
+Graph = tuple[array.array, array.array, array.array]
+
+# 番号つきの辺を CSR 形式にする。
+# 戻り値の order[e] は CSR の e 番目の辺が元の何番目の辺か (辺に付随する情報を並べ替えるのに使う)
+def buildCsr(nodeCount: int, edgeFrom: list[int], edgeTo: list[int], edgeCosts: list[float]) -> tuple[array.array, array.array, array.array, array.array]:
+    offsets = array.array('q', [0]) * (nodeCount + 1)
+    for u in edgeFrom:
+        offsets[u + 1] += 1
+    for i in range(nodeCount):
+        offsets[i + 1] += offsets[i]
+
+    targets = array.array('q', [0]) * len(edgeFrom)
+    costs = array.array('d', [0.0]) * len(edgeFrom)
+    order = array.array('q', [0]) * len(edgeFrom)
+    cursor = offsets[:-1]
+    for i, (u, v, c) in enumerate(zip(edgeFrom, edgeTo, edgeCosts)):
+        e = cursor[u]
+        cursor[u] += 1
+        targets[e] = v
+        costs[e] = c
+        order[e] = i
+    return offsets, targets, costs, order
+
+# source からの (距離, 最短路木で各ノードに入る辺の番号)。到達できないノードは inf と -1
+def dijkstra(offsets: array.array, targets: array.array, costs: array.array, source: int) -> tuple[array.array, array.array]:
+    n = len(offsets) - 1
+    dist = array.array('d', [math.inf]) * n
+    predEdge = array.array('q', [-1]) * n
+    dist[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        for e in range(offsets[u], offsets[u + 1]):
+            v = targets[e]
+            nd = d + costs[e]
+            if nd < dist[v]:
+                dist[v] = nd
+                predEdge[v] = e
+                heapq.heappush(heap, (nd, v))
+    return dist, predEdge
+
+# dijkstra の predEdge から source → target の辺の番号を順に並べる。到達できなければ None
+def track(predEdge: array.array, edgeSources: array.array, source: int, target: int) -> list[int] | None:
+    edges: list[int] = []
+    v = target
+    while v != source:
+        e = predEdge[v]
+        if e < 0:
+            return None
+        edges.append(e)
+        v = edgeSources[e]
+    edges.reverse()
+    return edges
+
+# ワーカーで出発点の一部を探索する (プロセスに渡すのでモジュールの関数にしておく)
+def _searchChunk(graph: Graph, sources: list[int]) -> list[tuple[int, array.array, array.array]]:
+    return [(s, *dijkstra(*graph, s)) for s in sources]
+
+_executor: ProcessPoolExecutor | None = None
+_executorLock = threading.Lock()
+
+def _getExecutor() -> ProcessPoolExecutor:
+    # グラフは呼び出しごとに渡すので、プロセスはグラフが変わっても使い回せる
+    global _executor
+    with _executorLock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=MAX_WORKERS)
+        return _executor
+
+# 各出発点からダイクストラ法を実行し、出発点の順に (出発点, 距離, 辺の番号) を返す
+def searchMany(graph: Graph, sources: list[int], maxWorkers: int | None = None) -> list[tuple[int, array.array, array.array]]:
+    workers = min(MAX_WORKERS if maxWorkers is None else maxWorkers, len(sources))
+    if workers <= 1 or len(sources) < PARALLEL_MIN_SOURCES:
+        return _searchChunk(graph, sources)
+
+    # ワーカーあたり数個に分け、探索の重さの偏りをならす
+    chunkSize = -(-len(sources) // (workers * 4))
+    chunks = [sources[i:i + chunkSize] for i in range(0, len(sources), chunkSize)]
+    futures = [_getExecutor().submit(_searchChunk, graph, chunk) for chunk in chunks]
+    return [result for future in futures for result in future.result()]
@@ -1,5 +1,6 @@
 from local.io.data import *
 from local.entities import *
+from local.routing import *
 
 def main():
     data = Data.load('../_Samples/SampleData.dat')
@@ -18,6 +19,10 @@ def main():
     print()
     print('Paths:')
     print(data.paths)
+    print()
+    print('Routes:')
+    graph = RouteGraph.fromData(data)
+    print(graph.routeSet(RouteGraph.supplyPoints(data)))
 
 if __name__ == '__main__':
     main()
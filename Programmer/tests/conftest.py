@@ -0,0 +1,37 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# local パッケージと、合成会場を作る benchmark/synthetic.py を import できるようにする
+sys.path.append(os.path.join(_ROOT, 'Programmer'))
+sys.path.append(os.path.join(_ROOT, 'benchmark'))
+
+from local.io.data import Data
+
+SAMPLE_DAT = os.path.join(_ROOT, '_Samples', 'SampleData.dat')
+
+@pytest.fixture
+def sampleDat(tmp_path) -> str:
+    path = str(tmp_path / 'SampleData.dat')
+    shutil.copy(SAMPLE_DAT, path)
+    return path
+
+# 比較用に、Data の内容をキーと値だけの形にする (オブジェクトの同一性やグループのキーの違いは無視する)
+def canonical(data: Data) -> tuple:
+    categoryKeyOf = {id(category): key for key, category in data.objectCategories.items()}
+    nodeKeyOf = {id(point): key for key, point in data.points.items()}
+    nodeKeyOf.update((id(waypoint), key) for key, waypoint in data.waypoints.items())
+    membersOf = {}
+    for groupPoints in data.groups.values():
+        members = frozenset(nodeKeyOf[id(point)] for point in groupPoints)
+        for point in groupPoints:
+            membersOf[id(point)] = members
+    return ({key: category.name for key, category in data.objectCategories.items()},
+            {key: (point.name, membersOf[id(point)],
+                   {categoryKeyOf[id(category)]: (change.fromAmount, change.toAmount) for category, change in point.objects.items()})
+             for key, point in data.points.items()},
+            {key: (waypoint.name, membersOf[id(waypoint)]) for key, waypoint in data.waypoints.items()},
+            {(nodeKeyOf[id(path.fromPoint)], nodeKeyOf[id(path.toPoint)]): (path.cost, path.isInternal) for path in data.paths.values()})
@@ -0,0 +1,67 @@
+import os
+import random
+
+import pytest
+
+import synthetic
+from local.entities import *
+from local.io.data import Data
+from local.io.distances import DistanceMatrix
+from local.routing import RouteGraph
+
+@pytest.fixture
+def venue(tmp_path) -> tuple[str, Data]:
+    path = str(tmp_path / 'venue.dat')
+    synthetic.write_dat(synthetic.generate_venue(points=60, waypoints=15, groups=6, categories=2, seed=4), path)
+    return path, Data.load(path)
+
+def _assertSameAsRebuilt(matrix: DistanceMatrix, data: Data, tmp_path) -> None:
+    full = DistanceMatrix(str(tmp_path / 'full.dist'), data, RouteGraph.fromData(data))
+    full._rebuild(1)
+    try:
+        assert full.graph.keys == matrix.graph.keys
+        assert list(full.dist[:full.rowCount * full.nodeCount]) == list(matrix.dist[:matrix.rowCount * matrix.nodeCount])
+    finally:
+        full.close()
+
+@pytest.mark.parametrize('seed', range(3))
+def test_incrementalUpdatesMatchFullRebuild(venue, tmp_path, seed):
+    path, data = venue
+    rng = random.Random(seed)
+    matrix = DistanceMatrix.open(path, data, 1)
+    nodes = matrix.graph.nodes
+    for _ in range(20):
+        kind = rng.choice(['cost', 'add', 'remove'])
+        if kind == 'cost':
+            matrix.setPathCost(rng.choice(list(data.paths.values())), rng.randint(1, 300))
+        elif kind == 'add':
+            a, b = rng.sample(nodes, 2)
+            matrix.addPath(Path(a, b, rng.randint(1, 300), False))
+        else:
+            matrix.removePath(rng.choice(list(data.paths.values())))
+        _assertSameAsRebuilt(matrix, data, tmp_path)
+    matrix.close()
+
+def test_routesFollowTheMatrix(venue):
+    path, data = venue
+    with DistanceMatrix.open(path, data, 1) as matrix:
+        points = list(data.points.values())
+        for source in points[:5]:
+            for target in points:
+                route = matrix.route(source, target)
+                if route is None:
+                    assert source is target or matrix.distance(source, target) == float('inf')
+                else:
+                    assert route.cost == matrix.distance(source, target)
+
+def test_reopenWithSameGraphDoesNotRebuild(venue, monkeypatch):
+    path, data = venue
+    with DistanceMatrix.open(path, data, 1) as matrix:
+        matrix.setPathCost(next(iter(data.paths.values())), 1)
+        expected = list(matrix.dist)
+
+    def rebuild(self, maxWorkers):
+        raise AssertionError('再計算されました')
+    monkeypatch.setattr(DistanceMatrix, '_rebuild', rebuild)
+    with DistanceMatrix.open(path, data, 1) as matrix:
+        assert list(matrix.dist) == expected
@@ -0,0 +1,92 @@
+import math
+import random
+
+import pytest
+
+import synthetic
+from local import shortestpath
+from local.entities import *
+from local.io.data import Data
+from local.routing import RouteGraph
+
+@pytest.fixture
+def data(tmp_path) -> Data:
+    path = str(tmp_path / 'venue.dat')
+    synthetic.write_dat(synthetic.generate_venue(points=40, waypoints=10, groups=4, categories=2, seed=2), path)
+    return Data.load(path)
+
+# 比較用の全点対最短距離 (Floyd–Warshall)
+def allPairs(graph: RouteGraph) -> list[list[float]]:
+    n = len(graph.nodes)
+    dist = [[0.0 if i == j else math.inf for j in range(n)] for i in range(n)]
+    for u in range(n):
+        for e in range(graph.offsets[u], graph.offsets[u + 1]):
+            v = graph.targets[e]
+            dist[u][v] = min(dist[u][v], graph.costs[e])
+    for k in range(n):
+        for i in range(n):
+            for j in range(n):
+                if dist[i][k] + dist[k][j] < dist[i][j]:
+                    dist[i][j] = dist[i][k] + dist[k][j]
+    return dist
+
+def test_buildCsrKeepsEveryEdge():
+    offsets, targets, costs, order = shortestpath.buildCsr(3, [2, 0, 2, 1], [0, 1, 1, 2], [5.0, 1.0, 2.0, 3.0])
+    assert list(offsets) == [0, 1, 2, 4]
+    edges = {(u, targets[e], costs[e]) for u in range(3) for e in range(offsets[u], offsets[u + 1])}
+    assert edges == {(2, 0, 5.0), (0, 1, 1.0), (2, 1, 2.0), (1, 2, 3.0)}
+    assert sorted(order) == [0, 1, 2, 3]
+
+def test_dijkstraMatchesAllPairs(data):
+    graph = RouteGraph.fromData(data)
+    expected = allPairs(graph)
+    for s in range(len(graph.nodes)):
+        dist, predEdge = graph.search(s)
+        assert list(dist) == expected[s]
+        for t in range(len(graph.nodes)):
+            edges = shortestpath.track(predEdge, graph.edgeSources, s, t)
+            if math.isinf(dist[t]):
+                assert edges is None
+            else:
+                assert sum(graph.costs[e] for e in edges) == dist[t]
+
+def test_parallelSearchMatchesSerial(data, monkeypatch):
+    graph = RouteGraph.fromData(data)
+    sources = list(range(len(graph.nodes)))
+    serial = shortestpath.searchMany((graph.offsets, graph.targets, graph.costs), sources, 1)
+    monkeypatch.setattr(shortestpath, 'PARALLEL_MIN_SOURCES', 1)
+    monkeypatch.setattr(shortestpath, 'MAX_WORKERS', 2)
+    parallel = shortestpath.searchMany((graph.offsets, graph.targets, graph.costs), sources, 2)
+    assert [(s, list(dist)) for s, dist, _ in parallel] == [(s, list(dist)) for s, dist, _ in serial]
+
+def test_routeSetFollowsPaths(data):
+    graph = RouteGraph.fromData(data)
+    expected = allPairs(graph)
+    sources = RouteGraph.supplyPoints(data)
+    routes = graph.routeSet(sources)
+    points = [point for point in data.points.values()]
+    for source in sources:
+        for target in points:
+            i, j = graph.indices[source], graph.indices[target]
+            route = routes.routes.get((source, target))
+            if source is target or math.isinf(expected[i][j]):
+                assert route is None
+                continue
+            assert route.cost == expected[i][j]
+            assert route.tracks[0][0].fromPoint is source and route.tracks[-1][0].toPoint is target
+            for (a, _), (b, _) in zip(route.tracks, route.tracks[1:]):
+                assert a.toPoint is b.fromPoint
+
+def test_setAndRemovePathUpdateTheGraph(data):
+    graph = RouteGraph.fromData(data)
+    rng = random.Random(0)
+    for _ in range(10):
+        a, b = rng.sample(graph.nodes, 2)
+        path = Path(a, b, rng.randint(1, 50), False)
+        data.paths[(a, b)] = path
+        graph.setPath(path)
+    for path in rng.sample(list(data.paths.values()), 10):
+        del data.paths[(path.fromPoint, path.toPoint)]
+        graph.removePath(path)
+    # 差分で変えたグラフと、変更後の data から作り直したグラフの距離は同じになる
+    assert allPairs(graph) == allPairs(RouteGraph.fromData(data))
@@ -0,0 +1,39 @@
+from conftest import canonical
+from local.entities import *
+from local.io.data import Data
+
+def test_snapshotRoundTrip(sampleDat, tmp_path):
+    data = Data.load(sampleDat)
+    path = str(tmp_path / 'data.snap')
+    data.saveSnapshot(path)
+    loaded = Data.loadSnapshot(path)
+    assert canonical(loaded) == canonical(data)
+    assert list(loaded.points) == list(data.points)
+    assert list(loaded.groups) == list(data.groups)
+
+def test_pathsAreLookedUpByLoadedPoints(sampleDat, tmp_path):
+    path = str(tmp_path / 'data.snap')
+    Data.load(sampleDat).saveSnapshot(path)
+    loaded = Data.loadSnapshot(path)
+    # 先にキーで引いた拠点と、経路が指す拠点は同じオブジェクトになる
+    a, b = next(iter(loaded.paths))
+    assert loaded.paths[(a, b)].fromPoint is a and loaded.paths[(a, b)].toPoint is b
+    point = next(iter(loaded.points.values()))
+    assert all(loaded.paths[key].fromPoint is point for key in loaded.paths if key[0] is point)
+
+def test_groupMutationsPersist(sampleDat, tmp_path):
+    path = str(tmp_path / 'data.snap')
+    Data.load(sampleDat).saveSnapshot(path)
+    loaded = Data.loadSnapshot(path)
+
+    groupKey = next(iter(loaded.groups))
+    assert loaded.groups[groupKey] is loaded.groups[groupKey]
+    point = Point('追加', {})
+    loaded.points['ADDED'] = point
+    loaded.groups[groupKey].append(point)
+    assert loaded.groups[groupKey][-1] is point
+
+    loaded.saveSnapshot(path)
+    again = Data.loadSnapshot(path)
+    assert canonical(again) == canonical(loaded)
+    assert again.groups[groupKey][-1] is again.points['ADDED']
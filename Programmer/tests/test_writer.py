@@ -0,0 +1,123 @@
+import os
+import zipfile
+
+from conftest import canonical
+from local.entities import *
+from local.io import writer
+from local.io.data import Data
+
+def _rawEntries(path: str) -> dict[str, bytes]:
+    # 各エントリの圧縮済みのバイト列 (ローカルヘッダーの後ろ)
+    entries = {}
+    with zipfile.ZipFile(path) as zf, open(path, 'rb') as f:
+        for info in zf.infolist():
+            f.seek(info.header_offset + 26)
+            nameLength, extraLength = int.from_bytes(f.read(2), 'little'), int.from_bytes(f.read(2), 'little')
+            f.seek(info.header_offset + 30 + nameLength + extraLength)
+            entries[info.filename] = f.read(info.compress_size)
+    return entries
+
+def test_unchangedSaveIsByteIdentical(sampleDat, tmp_path):
+    data = Data.load(sampleDat)
+    assert data.dirtyPointKeys() == []
+    saved = str(tmp_path / 'saved.dat')
+    data.save(saved)
+    with open(sampleDat, 'rb') as a, open(saved, 'rb') as b:
+        assert a.read() == b.read()
+
+def test_extraFieldsAndVersionsAreKept(sampleDat, tmp_path):
+    # 拡張フィールド (UT: 更新時刻) とバージョンを持つ zip を作る
+    source = str(tmp_path / 'extra.dat')
+    with zipfile.ZipFile(sampleDat) as a, zipfile.ZipFile(source, 'w', zipfile.ZIP_DEFLATED) as b:
+        for info in a.infolist():
+            info.extra = b'UT\x05\x00\x01\x00\x00\x00\x60'
+            info.create_version = 30
+            b.writestr(info, a.read(info))
+    data = Data.load(source)
+    saved = str(tmp_path / 'saved.dat')
+    data.save(saved)
+    with open(source, 'rb') as a, open(saved, 'rb') as b:
+        assert a.read() == b.read()
+
+def test_editsRoundTripAndOnlyChangedEntriesAreRewritten(sampleDat):
+    data = Data.load(sampleDat)
+    before = _rawEntries(sampleDat)
+
+    key = next(iter(data.points))
+    change = next(iter(data.points[key].objects.values()))
+    change.toAmount += 3
+    category = next(iter(data.objectCategories.values()))
+    data.points['NEW'] = Point('新拠点 <&>', {category: QuantityChange(1, 2)})
+    data.groups.setdefault('NEW-GROUP', []).append(data.points['NEW'])
+    assert data.dirtyPointKeys() == [key, 'NEW']
+
+    data.save(sampleDat)
+    assert canonical(Data.load(sampleDat)) == canonical(data)
+    after = _rawEntries(sampleDat)
+    changedEntries = {name for name in before if before[name] != after.get(name)}
+    assert len(changedEntries) == 1 and changedEntries <= {name for name in before if name.startswith('Points/')}
+    assert 'Points/NEW.xml' in after
+
+    # 保存したファイルを元に、続けて差分だけを保存できる
+    assert data.dirtyPointKeys() == []
+    path = next(iter(data.paths.values()))
+    path.cost += 1
+    data.save(sampleDat)
+    again = _rawEntries(sampleDat)
+    assert {name for name in after if after[name] != again.get(name)} == {'Paths.xml'}
+    assert canonical(Data.load(sampleDat)) == canonical(data)
+
+def test_deletedPointsAreDropped(sampleDat):
+    data = Data.load(sampleDat)
+    key = list(data.points)[1]
+    point = data.points.pop(key)
+    for groupPoints in data.groups.values():
+        if point in groupPoints:
+            groupPoints.remove(point)
+    for pathKey in [pathKey for pathKey in data.paths if point in pathKey]:
+        del data.paths[pathKey]
+    data.save(sampleDat)
+    loaded = Data.load(sampleDat)
+    assert key not in loaded.points
+    assert canonical(loaded) == canonical(data)
+
+def test_sourceChangedOnDiskIsRewrittenInFull(sampleDat, tmp_path):
+    data = Data.load(sampleDat)
+    with open(sampleDat, 'ab') as f:
+        f.write(b'\0')
+    saved = str(tmp_path / 'saved.dat')
+    data.save(saved)
+    assert canonical(Data.load(saved)) == canonical(data)
+
+def test_zip64SourceLoadsAndIsRewrittenWithZipfile(sampleDat, tmp_path, monkeypatch):
+    source = str(tmp_path / 'zip64.dat')
+    with monkeypatch.context() as patch:
+        # 小さなファイルでも中央ディレクトリに ZIP64 のレコードを書かせる
+        patch.setattr(zipfile, 'ZIP64_LIMIT', 10)
+        with zipfile.ZipFile(sampleDat) as a, zipfile.ZipFile(source, 'w', zipfile.ZIP_DEFLATED) as b:
+            for info in a.infolist():
+                b.writestr(info, a.read(info))
+    data = Data.load(source)
+    assert data._source.requiresZip64
+    saved = str(tmp_path / 'saved.dat')
+    data.save(saved)
+    assert canonical(Data.load(saved)) == canonical(data)
+
+def test_fallsBackToZipfileWhenOutputNeedsZip64(sampleDat, tmp_path, monkeypatch):
+    data = Data.load(sampleDat)
+    next(iter(next(iter(data.points.values())).objects.values())).toAmount += 1
+    monkeypatch.setattr(writer, '_ZIP32_LIMIT', 1000)
+    saved = str(tmp_path / 'saved.dat')
+    data.save(saved)
+    monkeypatch.undo()
+    with zipfile.ZipFile(saved) as zf:
+        assert zf.testzip() is None
+    assert canonical(Data.load(saved)) == canonical(data)
+
+def test_snapshotDataIsWrittenInFull(sampleDat, tmp_path):
+    data = Data.load(sampleDat)
+    snapshot = str(tmp_path / 'data.snap')
+    data.saveSnapshot(snapshot)
+    saved = str(tmp_path / 'saved.dat')
+    Data.loadSnapshot(snapshot).save(saved)
+    assert canonical(Data.load(saved)) == canonical(data)
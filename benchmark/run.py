@@ -0,0 +1,219 @@
+"""
+ソルバーと読込処理のスケーリングを測るベンチマーク
+
+合成会場 (synthetic.py) を大きさを変えて作り、段階ごとの処理時間を測って JSON に書き出す。
+
+    python benchmark/run.py --points 50 200 800 --categories 3 10 --engines flow cbc --output bench.json
+    python benchmark/run.py ... --baseline old.json   # 前回の結果より遅くなった段階があれば終了コード 1
+
+測る段階:
+    write_dat      合成会場を .dat に書き出す
+    load           Data.load (Programmer)
+    snapshot_load  Data.loadSnapshot と全拠点・全経路の実体化
+    validate       JSON 文字列から ProblemDataModel への変換
+    build          build_fast_problems (数量・コストの抽出)
+    model_build    CBC モデルの組み立て (engine が cbc のときだけ)
+    solve          solver.solve_category によるカテゴリごとの求解 (scheduler のワーカーで並列)
+    serialize      結果の JSON 化
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import synthetic  # python-api と Programmer を sys.path に追加する
+
+from fastapi.encoders import jsonable_encoder
+
+import main
+import scheduler
+import solver
+from local.io.data import Data
+
+# これより短い差は計測誤差とみなして劣化扱いしない（秒）
+MIN_REGRESSION_SECONDS = 0.01
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def quiet(func, *args, **kwargs):
+    """Data.load や build_fast_problems の print を抑えて呼ぶ"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def load_snapshot(path: str) -> Data:
+    data = Data.loadSnapshot(path)
+    for point in data.points.values():
+        point.objects
+    for edge in data.paths.values():
+        edge.cost
+    return data
+
+
+def build_models(problems: list[dict]) -> None:
+    for problem in problems:
+        route_keys = solver.candidate_arcs(problem["supply_nodes"], problem["demand_nodes"], problem["costs"],
+                                           problem["candidate_limit"])
+        solver.build_cbc_model(problem["supply_nodes"], problem["demand_nodes"], problem["costs"],
+                               problem["task_penalty"], route_keys)
+
+
+def run_case(case: dict, engines: list[str], repeat: int, time_limit: int, workdir: str) -> list[dict]:
+    venue = synthetic.generate_venue(case["points"], case["waypoints"], case["groups"], case["categories"],
+                                     case["imbalance"], case["seed"])
+    dat_path = os.path.join(workdir, "venue.dat")
+    snapshot_path = os.path.join(workdir, "venue.snap")
+
+    common: dict[str, list[float]] = {"write_dat": [], "load": [], "snapshot_load": []}
+    for _ in range(repeat):
+        common["write_dat"].append(timed(synthetic.write_dat, venue, dat_path)[1])
+        data, elapsed = timed(quiet, Data.load, dat_path)
+        common["load"].append(elapsed)
+        data.saveSnapshot(snapshot_path)
+        common["snapshot_load"].append(timed(load_snapshot, snapshot_path)[1])
+
+    results = []
+    for engine in engines:
+        payload = synthetic.to_payload(venue, case["route_density"], time_limit=time_limit,
+                                       seed=case["seed"], engine=engine, warmStart=False)
+        text = json.dumps(payload, ensure_ascii=False)
+        stages = {name: list(times) for name, times in common.items()}
+        stages.update({"validate": [], "build": [], "solve": [], "serialize": []})
+        if engine == "cbc":
+            stages["model_build"] = []
+
+        for _ in range(repeat):
+            model, elapsed = timed(main.ProblemDataModel.model_validate_json, text)
+            stages["validate"].append(elapsed)
+            problems, elapsed = timed(quiet, main.build_fast_problems, model)
+            stages["build"].append(elapsed)
+            if engine == "cbc":
+                stages["model_build"].append(timed(build_models, problems)[1])
+            limit = solver.split_time_limit(time_limit, len(problems))
+            for i, problem in enumerate(problems):
+                problem["time_limit"] = limit
+                # CBC のログは標準出力ではなく作業ディレクトリに書かせる
+                problem["log_path"] = os.path.join(workdir, f"cbc-{i}.log")
+            solved, elapsed = timed(quiet, scheduler.run_parallel, solver.solve_category, problems)
+            stages["solve"].append(elapsed)
+            stages["serialize"].append(timed(json.dumps, jsonable_encoder(solved), ensure_ascii=False)[1])
+
+        results.append({
+            **case,
+            "engine": engine,
+            "routes": len(payload["routes"]),
+            "paths": len(venue["paths"]),
+            "stages": {name: {"min": min(times), "median": statistics.median(times), "runs": times}
+                       for name, times in stages.items()},
+            "totalCost": sum(result["totalCost"] or 0 for result in solved),
+            "taskCount": sum(result["taskCount"] or 0 for result in solved),
+            "statuses": [result["status"] for result in solved],
+        })
+    return results
+
+
+def case_id(result: dict) -> tuple:
+    return tuple(result[key] for key in ("points", "waypoints", "groups", "categories", "imbalance",
+                                         "route_density", "seed", "engine"))
+
+
+def compare(results: list[dict], baseline: dict, tolerance: float) -> list[str]:
+    """基準の結果より中央値が tolerance の割合以上遅くなった段階を列挙する"""
+    previous = {case_id(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get(case_id(result))
+        if old is None:
+            continue
+        for name, stage in result["stages"].items():
+            old_stage = old["stages"].get(name)
+            if old_stage is None:
+                continue
+            new_time, old_time = stage["median"], old_stage["median"]
+            if new_time > old_time * (1 + tolerance) and new_time - old_time > MIN_REGRESSION_SECONDS:
+                regressions.append(f"{case_id(result)} {name}: {old_time:.3f}s -> {new_time:.3f}s")
+    return regressions
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=synthetic.ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--categories", type=int, nargs="+", default=[3])
+    parser.add_argument("--route-density", type=float, nargs="+", default=[1.0])
+    parser.add_argument("--imbalance", type=float, default=0.0)
+    parser.add_argument("--waypoints", type=int, help="経由地の数（省略時は拠点数の 1/10）")
+    parser.add_argument("--groups", type=int, help="グループの数（省略時は拠点数の 1/20）")
+    parser.add_argument("--engines", nargs="+", choices=["flow", "cbc"], default=["flow", "cbc"])
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--time-limit", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="比較する過去の結果ファイル")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for points, categories, density in itertools.product(args.points, args.categories, args.route_density):
+            case = {
+                "points": points,
+                "waypoints": points // 10 if args.waypoints is None else args.waypoints,
+                "groups": max(1, points // 20) if args.groups is None else args.groups,
+                "categories": categories,
+                "imbalance": args.imbalance,
+                "route_density": density,
+                "seed": args.seed,
+            }
+            for result in run_case(case, args.engines, args.repeat, args.time_limit, workdir):
+                results.append(result)
+                summary = " ".join(f"{name}={stage['median']:.3f}" for name, stage in result["stages"].items())
+                print(f"P={points} C={categories} density={density} {result['engine']}: {summary}", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "createdAt": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpuCount": os.cpu_count(),
+            "solverMaxWorkers": solver.MAX_WORKERS,
+            "repeat": args.repeat,
+            "timeLimitSeconds": args.time_limit,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"劣化: {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,166 @@
+"""
+ベンチマーク用の合成会場データ
+
+シードを固定して、拠点・経由地・グループ・物品カテゴリの数を指定した会場を作り、
+Programmer が読む .dat ファイルと python-api へ送る ProblemDataModel 形式の dict に書き出す。
+"""
+import os
+import random
+import sys
+import zipfile
+from xml.etree import ElementTree
+
+# python-api と Programmer のモジュールを import できるようにする (main は python-api のものを優先)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for _path in (os.path.join(ROOT, "Programmer"), os.path.join(ROOT, "python-api")):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+import routing
+
+
+def generate_venue(points: int = 100, waypoints: int = 10, groups: int = 5, categories: int = 3,
+                   imbalance: float = 0.0, seed: int = 0) -> dict:
+    """
+    合成会場を作る。
+
+    imbalance は物品ごとの「変化後の合計 / 変化前の合計 - 1」。
+    0 なら個数は移動だけで釣り合い、正なら増える側（高速版エンドポイントの供給側）が多くなる。
+    """
+    rng = random.Random(seed)
+    category_keys = [f"C{j}" for j in range(categories)]
+    group_keys = [f"G{g}" for g in range(max(groups, 1))]
+    centers = {g: (rng.uniform(0, 1000), rng.uniform(0, 1000)) for g in group_keys}
+
+    def near(group: str) -> tuple[float, float]:
+        cx, cy = centers[group]
+        return round(cx + rng.gauss(0, 30), 1), round(cy + rng.gauss(0, 30), 1)
+
+    venue_waypoints = []
+    for k in range(waypoints):
+        group = group_keys[k % len(group_keys)]
+        x, y = near(group)
+        venue_waypoints.append({"key": f"W{k}", "name": f"経由地{k}", "group": group, "x": x, "y": y})
+
+    venue_points = []
+    for i in range(points):
+        group = rng.choice(group_keys)
+        x, y = near(group)
+        venue_points.append({"key": f"P{i}", "name": f"拠点{i}", "group": group, "x": x, "y": y,
+                             "objects": {key: [rng.randint(0, 20), 0] for key in category_keys}})
+
+    # 変化後の個数は、変化前の合計 × (1 + imbalance) 個をランダムな拠点に配り直して決める
+    for key in category_keys:
+        total = sum(point["objects"][key][0] for point in venue_points)
+        for _ in range(round(total * (1 + imbalance)) if venue_points else 0):
+            rng.choice(venue_points)["objects"][key][1] += 1
+
+    # 辺: グループ内の拠点を一列につなぎ、グループの代表（経由地があればその1つ）どうしを環状につなぐ
+    def cost(a: dict, b: dict) -> int:
+        return max(1, round(abs(a["x"] - b["x"]) + abs(a["y"] - b["y"])))
+
+    paths = []
+
+    def connect(a: dict, b: dict) -> None:
+        c = cost(a, b)
+        opposite = c + rng.randint(-1, 1) if rng.random() < 0.2 else None
+        paths.append({"from": a["key"], "to": b["key"], "cost": c, "oppositeCost": opposite})
+
+    anchors = []
+    for group in group_keys:
+        members = [point for point in venue_points if point["group"] == group]
+        hubs = [waypoint for waypoint in venue_waypoints if waypoint["group"] == group]
+        for a, b in zip(members, members[1:]):
+            connect(a, b)
+        for hub in hubs[1:]:
+            connect(hubs[0], hub)
+        if hubs and members:
+            connect(hubs[0], members[0])
+        if hubs or members:
+            anchors.append(hubs[0] if hubs else members[0])
+    for a, b in zip(anchors, anchors[1:] + anchors[:1]):
+        if a is not b:
+            connect(a, b)
+
+    return {"categories": category_keys, "points": venue_points, "waypoints": venue_waypoints, "paths": paths}
+
+
+def _xml(root: ElementTree.Element) -> bytes:
+    ElementTree.indent(root)
+    return ElementTree.tostring(root, encoding="utf-8", xml_declaration=True)
+
+
+def write_dat(venue: dict, path: str) -> None:
+    """Data.load で読める zip 形式 (.dat) に書き出す"""
+    objects = ElementTree.Element("ObjectCollection")
+    categories = ElementTree.SubElement(objects, "Categories")
+    for key in venue["categories"]:
+        ElementTree.SubElement(categories, "ObjectCategory", Key=key, Name=f"物品{key}")
+
+    paths_root = ElementTree.Element("PathCollection")
+    waypoints = ElementTree.SubElement(paths_root, "Waypoints")
+    for waypoint in venue["waypoints"]:
+        ElementTree.SubElement(waypoints, "Waypoint", Key=waypoint["key"], Name=waypoint["name"], Group=waypoint["group"])
+    paths = ElementTree.SubElement(paths_root, "Paths")
+    for edge in venue["paths"]:
+        attributes = {"Point1Key": edge["from"], "Point2Key": edge["to"], "Cost": str(edge["cost"])}
+        if edge["oppositeCost"] is not None:
+            attributes["OppositeCost"] = str(edge["oppositeCost"])
+        ElementTree.SubElement(paths, "Path", attributes)
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("Objects.xml", _xml(objects))
+        zf.writestr("Paths.xml", _xml(paths_root))
+        zf.writestr("Points/", b"")
+        for point in venue["points"]:
+            root = ElementTree.Element("Point")
+            ElementTree.SubElement(root, "Key").text = point["key"]
+            ElementTree.SubElement(root, "Name").text = point["name"]
+            ElementTree.SubElement(root, "Group").text = point["group"]
+            objects_element = ElementTree.SubElement(root, "Objects")
+            for key, (from_amount, to_amount) in point["objects"].items():
+                ElementTree.SubElement(objects_element, "Object", CategoryKey=key, From=str(from_amount), To=str(to_amount))
+            zf.writestr(f"Points/{point['key']}.xml", _xml(root))
+
+
+def to_payload(venue: dict, route_density: float = 1.0, task_penalty: int = 10, time_limit: int = 60,
+               include_paths: bool = False, seed: int = 0, **options) -> dict:
+    """
+    ProblemDataModel 形式の dict を作る。
+
+    routes は拠点間の最短距離で、route_density の割合の組だけを含める（1.0 なら全組）。
+    include_paths を指定すると辺の一覧も送り、サーバー側で距離を計算させる。
+    options (engine など) はそのまま ProblemDataModel のフィールドになる。
+    """
+    rng = random.Random(seed)
+    edges = []
+    for path in venue["paths"]:
+        edges.append((path["from"], path["to"], path["cost"]))
+        edges.append((path["to"], path["from"], path["cost"] if path["oppositeCost"] is None else path["oppositeCost"]))
+    point_keys = [point["key"] for point in venue["points"]]
+
+    routes = {}
+    for (a, b), distance in routing.shortest_distances(edges, point_keys, point_keys).items():
+        if a != b and rng.random() < route_density:
+            routes[f"{a}_{b}"] = {"key": f"{a}_{b}", "from": a, "to": b, "distance": distance, "nodeKeys": [a, b]}
+
+    payload = {
+        "objectCategories": {key: {"key": key, "name": f"物品{key}"} for key in venue["categories"]},
+        "points": {
+            point["key"]: {
+                "key": point["key"], "name": point["name"], "groupKey": point["group"], "x": point["x"], "y": point["y"],
+                "objects": {key: {"fromAmount": from_amount, "toAmount": to_amount}
+                            for key, (from_amount, to_amount) in point["objects"].items()},
+            }
+            for point in venue["points"]
+        },
+        "routes": routes,
+        "taskPenalty": task_penalty,
+        "targetObjectCategoryKeys": list(venue["categories"]),
+        "timeLimitSeconds": time_limit,
+    }
+    if include_paths:
+        payload["paths"] = [{"from": path["from"], "to": path["to"], "cost": path["cost"], "oppositeCost": path["oppositeCost"]}
+                            for path in venue["paths"]]
+    payload.update(options)
+    return payload
@@ -0,0 +1,159 @@
+"""
+求解結果の単位タスクへの整形
+
+輸送問題の解（地点 S から地点 D へ物品 O を N 個）を、1回の運搬で運べる量ごとの単位タスク
+(1task) ＝ 地点S1から［地点D1へ備品O1をN1個，地点D2へ備品O2をN2個，...］
+にまとめる。
+
+1. 運搬元ごとに、1つの運搬先だけで運搬量の上限に達する分はそれだけで1タスクにする
+2. 残り（上限に満たない運搬先）は、セービング法 (Clarke-Wright) で近い運搬先どうしを
+   1回の巡回にまとめる。運搬元から戻って次を運ぶ前提で、
+   節約量 = d(i, 運搬元) + d(運搬元, j) - d(i, j) の大きい順に巡回をつなぐ
+距離はリクエストの経路（preprocess.ProblemArrays）から運搬元ごとにまとめて引く。
+"""
+import itertools
+import math
+from typing import Iterator
+
+import numpy as np
+
+import preprocess
+
+
+def physical_flows(arrays: preprocess.ProblemArrays, routes: list[dict]) -> dict[str, dict[str, dict[str, int]]]:
+    """
+    求解結果の経路を 運搬元 → 運搬先 → 物品カテゴリ → 個数 にまとめる。
+    高速版エンドポイントの supplyNode は在庫が増える地点なので、向きは数量の変化から判定する。
+    """
+    flows: dict[str, dict[str, dict[str, int]]] = {}
+    for route in routes:
+        amount = round(route["amount"])
+        if amount <= 0:
+            continue
+        s, d = route["supplyNode"], route["demandNode"]
+        i = arrays.point_index.get(s)
+        j = arrays.category_index.get(route["objectKey"])
+        if i is not None and j is not None and arrays.to_amounts[i, j] > arrays.from_amounts[i, j]:
+            s, d = d, s
+        items = flows.setdefault(s, {}).setdefault(d, {})
+        items[route["objectKey"]] = items.get(route["objectKey"], 0) + amount
+    return flows
+
+
+def _load(items: dict[str, int], unit_loads: dict[str, float]) -> float:
+    return sum(unit_loads.get(key, 1) * amount for key, amount in items.items())
+
+
+def split_full_trips(items: dict[str, int], capacity: float,
+                     unit_loads: dict[str, float]) -> tuple[list[dict[str, int]], dict[str, int]]:
+    """
+    1つの運搬先への物品から、運搬量の上限まで積んだ便を取り出せるだけ取り出す。
+    戻り値は (取り出した便のリスト, 上限に満たない残り)。1個で上限を超える物品は1個ずつ運ぶ。
+    """
+    remaining = dict(items)
+    trips = []
+    while remaining and _load(remaining, unit_loads) >= capacity:
+        trip = {}
+        room = capacity
+        for key, amount in remaining.items():
+            count = min(amount, math.floor(room / unit_loads.get(key, 1)))
+            if count > 0:
+                trip[key] = count
+                room -= count * unit_loads.get(key, 1)
+        if not trip:
+            key = next(iter(remaining))
+            trip[key] = 1
+        for key, count in trip.items():
+            remaining[key] -= count
+        remaining = {key: amount for key, amount in remaining.items() if amount > 0}
+        trips.append(trip)
+    return trips, remaining
+
+
+def savings_tours(arrays: preprocess.ProblemArrays, source: str, loads: dict[str, float],
+                  capacity: float) -> list[list[str]]:
+    """運搬先ごとの量 loads を、セービング法で運搬量の上限を超えない巡回（運搬先の並び）にまとめる"""
+    destinations = list(loads)
+    n = len(destinations)
+    tours: dict[int, list[int]] = {i: [i] for i in range(n)}
+    if n > 1:
+        points = np.array([arrays.point_index.get(d, -1) for d in destinations], dtype=np.int64)
+        origin = np.full(n, arrays.point_index.get(source, -1), dtype=np.int64)
+        outbound = arrays.distances_by_index(origin, points)
+        inbound = arrays.distances_by_index(points, origin)
+        # 戻りの経路がなければ行きと同じ距離とみなす
+        inbound = np.where(np.isnan(inbound), outbound, inbound)
+        i_index, j_index = np.nonzero(~np.eye(n, dtype=bool))
+        between = arrays.distances_by_index(points[i_index], points[j_index])
+        savings = inbound[i_index] + outbound[j_index] - between
+        # 経路のない組と、つないでも得をしない組は使わない
+        usable = np.flatnonzero(savings > 0)
+        order = usable[np.argsort(-savings[usable], kind="stable")]
+
+        tour_of = list(range(n))
+        tour_load = {i: loads[destinations[i]] for i in range(n)}
+        for i, j in zip(i_index[order].tolist(), j_index[order].tolist()):
+            a, b = tour_of[i], tour_of[j]
+            # i で終わる巡回の後ろに j から始まる巡回をつなぐ
+            if a == b or tours[a][-1] != i or tours[b][0] != j or tour_load[a] + tour_load[b] > capacity:
+                continue
+            tours[a] += tours.pop(b)
+            tour_load[a] += tour_load.pop(b)
+            for k in tours[a]:
+                tour_of[k] = a
+    return [[destinations[i] for i in tour] for tour in tours.values()]
+
+
+def _tour_distance(arrays: preprocess.ProblemArrays, source: str, stops: list[str]) -> float | None:
+    """運搬元から運搬先を順に回るまでの距離（戻りは含めない）。経路のない区間があれば None"""
+    legs = arrays.distances_between([source] + stops[:-1], stops)
+    return None if np.isnan(legs).any() else float(legs.sum())
+
+
+def iter_tasks(arrays: preprocess.ProblemArrays, routes: list[dict], capacity: float,
+               unit_loads: dict[str, float] | None = None) -> Iterator[dict]:
+    """
+    求解結果の経路を単位タスクにして1件ずつ返す（運搬元ごとに作るので、全タスクを保持しない）。
+    capacity は1回に運べる量、unit_loads は物品カテゴリごとの1個あたりの量（省略したカテゴリは 1）。
+    """
+    unit_loads = unit_loads or {}
+    task_ids = itertools.count(1)
+
+    def make_task(source: str, stops: list[tuple[str, dict[str, int]]]) -> dict:
+        return {
+            "taskId": next(task_ids),
+            "sourceNode": source,
+            "stops": [{"demandNode": d, "items": [{"objectKey": key, "amount": amount} for key, amount in items.items()]}
+                      for d, items in stops],
+            "load": sum(_load(items, unit_loads) for _, items in stops),
+            "distance": _tour_distance(arrays, source, [d for d, _ in stops]),
+        }
+
+    for source, destinations in physical_flows(arrays, routes).items():
+        remainders: dict[str, dict[str, int]] = {}
+        for d, items in destinations.items():
+            trips, remaining = split_full_trips(items, capacity, unit_loads)
+            for trip in trips:
+                yield make_task(source, [(d, trip)])
+            if remaining:
+                remainders[d] = remaining
+
+        loads = {d: _load(items, unit_loads) for d, items in remainders.items()}
+        for tour in savings_tours(arrays, source, loads, capacity):
+            yield make_task(source, [(d, remainders[d]) for d in tour])
+
+
+def build_tasks(arrays: preprocess.ProblemArrays, routes: list[dict], capacity: float,
+                unit_loads: dict[str, float] | None = None) -> list[dict]:
+    """iter_tasks の結果をリストで返す"""
+    return list(iter_tasks(arrays, routes, capacity, unit_loads))
+
+
+def summarize(tasks: list[dict]) -> dict:
+    distances = [task["distance"] for task in tasks if task["distance"] is not None]
+    return {
+        "taskCount": len(tasks),
+        "stopCount": sum(len(task["stops"]) for task in tasks),
+        "totalLoad": sum(task["load"] for task in tasks),
+        "totalDistance": sum(distances),
+    }
@@ -0,0 +1,149 @@
+"""
+カテゴリ単位の求解結果キャッシュ
+
+キーは結果に影響する入力（供給量・需要量・関係する経路の距離・タスクペナルティ・エンジン・グループ分解等）
+だけを正規化したハッシュで、カテゴリ名は含めない。同じ内容なら別カテゴリの結果も再利用できる。
+"""
+import copy
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+# 保持するエントリ数の上限（超えたら最も使われていないものから捨てる）
+DEFAULT_MAX_ENTRIES = 256
+# 距離のキャッシュは地点数の2乗の大きさになるので、保持する数を少なくする
+DEFAULT_MAX_DISTANCE_ENTRIES = 8
+# リクエストごとの計測値（solver の profile、レスポンスの debug）はキャッシュに残さない
+_TRANSIENT_KEYS = ("profile", "debug")
+
+
+def problem_key(problem: dict) -> str:
+    """solver.solve_category の引数から、結果に影響する部分だけのハッシュを作る"""
+    canonical = {
+        "supply": sorted(problem["supply_nodes"].items()),
+        "demand": sorted(problem["demand_nodes"].items()),
+        "costs": sorted([s, d, c] for (s, d), c in problem["costs"].items()),
+        "taskPenalty": problem["task_penalty"],
+        "engine": problem.get("engine", "cbc"),
+        "candidateArcLimit": problem.get("candidate_limit"),
+        "groups": sorted(problem["groups"].items()) if "groups" in problem else None,
+    }
+    text = json.dumps(canonical, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def distance_key(edges: list[tuple[str, str, float]], points: list[str]) -> str:
+    """経路グラフの辺と、距離を求める地点の組から作るハッシュ（辺・地点の並び順には依存しない）"""
+    canonical = {"edges": sorted([u, v, float(c)] for u, v, c in edges), "points": sorted(points)}
+    text = json.dumps(canonical, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def is_cacheable(result: dict) -> bool:
+    """
+    時間制限で打ち切られたCBCの暫定解は、時間を延ばせば改善しうるのでキャッシュしない。
+    最適解と、決定的に同じ結果を返す flow エンジンの解だけを保存する。
+    """
+    return result.get("status") == "Optimal" or (result.get("engine") == "flow" and result.get("status") != "Infeasible")
+
+
+def relabel(result: dict, category_key: str) -> None:
+    """別のカテゴリの結果を、category_key のカテゴリの結果に付け替える（結果とその経路を書き換える）"""
+    result["objectKey"] = category_key
+    for route in result.get("routes", []):
+        route["objectKey"] = category_key
+
+
+class SolutionCache:
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        # カテゴリごとの直近の解（内容が少し変わったときの初期解に使う）
+        self._latest: OrderedDict[str, dict[tuple[str, str], float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, category_key: str) -> dict | None:
+        """キャッシュされた結果を、要求されたカテゴリのキーに付け替えて返す"""
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                return None
+            self._entries.move_to_end(key)
+            result = copy.deepcopy(result)
+
+        relabel(result, category_key)
+        result["solveTime"] = 0.0
+        result["cacheHit"] = True
+        return result
+
+    def put(self, key: str, result: dict) -> None:
+        if self.max_entries <= 0 or not is_cacheable(result):
+            return
+        with self._lock:
+            self._entries[key] = copy.deepcopy({k: v for k, v in result.items() if k not in _TRANSIENT_KEYS})
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def remember_latest(self, result: dict) -> None:
+        """暫定解も含め、そのカテゴリで最後に得られた解を覚えておく"""
+        if self.max_entries <= 0 or not result.get("routes"):
+            return
+        flows = {(route["supplyNode"], route["demandNode"]): route["amount"] for route in result["routes"]}
+        with self._lock:
+            self._latest[result["objectKey"]] = flows
+            self._latest.move_to_end(result["objectKey"])
+            while len(self._latest) > self.max_entries:
+                self._latest.popitem(last=False)
+
+    def latest_flows(self, category_key: str) -> dict[tuple[str, str], float] | None:
+        with self._lock:
+            flows = self._latest.get(category_key)
+            return dict(flows) if flows is not None else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._latest.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class DistanceCache:
+    """
+    paths から求めた地点どうしの最短距離のキャッシュ。
+    同じ辺・同じ地点の組で送り直されたリクエストでは、ダイクストラ法を実行しない
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_DISTANCE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, object] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """保存した値をそのまま返す（呼び出し側は書き換えないこと）"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,260 @@
+"""
+グループ単位の階層分解
+
+会場全体を1つの輸送問題として解く代わりに、
+1. グループ（同じ建物の教室など）ごとに、グループ内の経路で運べるだけ運ぶ
+2. グループ内で運べなかった残りだけで、グループ間の輸送問題を解く
+の2段階で解く。グループ内の問題は小さく互いに独立なので、scheduler のワーカーで並列に解く。
+全体の最適解は保証されないため、結果は暫定解 (Feasible) 扱いになる。
+グループ間の経路が足りず運べない分が残ったときは、一部だけの解 (Partial) として返す。
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import flow
+import scheduler
+import solver
+
+# グループ内の部分問題で、グループ内では満たせない需要を表す架空の供給地（地点キーと重ならない名前）
+UNMET_NODE = "__decompose_unmet__"
+# グループ間の問題が待ち行列に入らないとき、入れ直すまでの待ち時間（秒。入らないたびに倍にし、上限で止める）
+REQUEUE_INITIAL_DELAY = 0.05
+REQUEUE_MAX_DELAY = 2.0
+# 期限のない問題（ジョブ）でも、待ち行列に入れ直すのをあきらめるまでの秒数
+REQUEUE_TIMEOUT_SECONDS = float(os.environ.get("DECOMPOSE_REQUEUE_TIMEOUT", 600))
+
+
+def _solve_kwargs(problem: dict, supply_nodes: dict[str, int], demand_nodes: dict[str, int],
+                  costs: dict[tuple[str, str], float], time_limit: int,
+                  initial_flows: dict[tuple[str, str], float] | None) -> dict:
+    """solver.solve_category に渡す引数を、元の問題の設定を引き継いで作る"""
+    return {
+        "category_key": problem["category_key"],
+        "supply_nodes": supply_nodes,
+        "demand_nodes": demand_nodes,
+        "costs": costs,
+        "task_penalty": problem["task_penalty"],
+        "time_limit": time_limit,
+        "engine": problem.get("engine", "flow"),
+        "log_path": problem.get("log_path"),
+        "warm_start": problem.get("warm_start", True),
+        "initial_flows": initial_flows,
+        "candidate_limit": problem.get("candidate_limit"),
+    }
+
+
+def group_subproblems(problem: dict, time_limit: int) -> list[dict]:
+    """
+    グループごとの部分問題を作る。戻り値は {"group", "problem"} のリスト。
+    グループ内の経路だけでは満たせない需要もあるので、どの需要地へも大きなコストで送れる
+    架空の供給地 UNMET_NODE を加え、グループ内で運べるだけ運ぶ問題にする（UNMET_NODE から届いた分は
+    グループ間の問題に回す）。これにより部分問題は常に実行可能で、solver.candidate_arcs が
+    存在しない経路を含む全組み合わせに戻すこともない。
+    """
+    groups = problem["groups"]
+    supply_by_group: dict[str, dict[str, int]] = {}
+    demand_by_group: dict[str, dict[str, int]] = {}
+    for s, amount in problem["supply_nodes"].items():
+        if groups.get(s) is not None:
+            supply_by_group.setdefault(groups[s], {})[s] = amount
+    for d, amount in problem["demand_nodes"].items():
+        if groups.get(d) is not None:
+            demand_by_group.setdefault(groups[d], {})[d] = amount
+
+    costs_by_group: dict[str, dict[tuple[str, str], float]] = {}
+    for (s, d), cost in problem["costs"].items():
+        group = groups.get(s)
+        if group is not None and group == groups.get(d):
+            costs_by_group.setdefault(group, {})[(s, d)] = cost
+
+    initial_flows = problem.get("initial_flows") or {}
+    subproblems = []
+    for group, supply_nodes in supply_by_group.items():
+        demand_nodes = demand_by_group.get(group)
+        costs = costs_by_group.get(group)
+        if not demand_nodes or not costs:
+            continue
+        initial = {r: amount for r, amount in initial_flows.items() if r in costs} or None
+        # グループ内で運べる1個は、タスクを1つ増やしてでも UNMET_NODE から届けるより安くなるようにする
+        unmet_cost = max(costs.values()) + problem["task_penalty"] + 1
+        sub = _solve_kwargs(problem, {**supply_nodes, UNMET_NODE: sum(demand_nodes.values())}, demand_nodes,
+                            {**costs, **{(UNMET_NODE, d): unmet_cost for d in demand_nodes}}, time_limit, initial)
+        # ログはグループ間の問題だけが書く（ジョブの進捗表示用）
+        sub["log_path"] = None
+        subproblems.append({"group": group, "problem": sub})
+    return subproblems
+
+
+def subproblem_flows(subproblem: dict, result: dict) -> dict[tuple[str, str], float]:
+    """部分問題の結果を (供給地, 需要地) → 個数 に直す。UNMET_NODE からの分と、解けなかったグループは含めない"""
+    if result["status"] == "Infeasible":
+        return {}
+    flows = {}
+    for route in result["routes"]:
+        r = (route["supplyNode"], route["demandNode"])
+        if r[0] != UNMET_NODE:
+            flows[r] = flows.get(r, 0) + route["amount"]
+    return flows
+
+
+def residual_problem(problem: dict, flows: dict[tuple[str, str], float], time_limit: int) -> dict:
+    """グループ内で運んだ分を差し引いた、グループ間の問題"""
+    supply_nodes = dict(problem["supply_nodes"])
+    demand_nodes = dict(problem["demand_nodes"])
+    for (s, d), amount in flows.items():
+        supply_nodes[s] -= amount
+        demand_nodes[d] -= amount
+    supply_nodes = {s: round(amount) for s, amount in supply_nodes.items() if amount > 0.5}
+    demand_nodes = {d: round(amount) for d, amount in demand_nodes.items() if amount > 0.5}
+    costs = {r: cost for r, cost in problem["costs"].items() if r[0] in supply_nodes and r[1] in demand_nodes}
+    initial_flows = problem.get("initial_flows")
+    if initial_flows:
+        initial_flows = {r: amount for r, amount in initial_flows.items() if r in costs} or None
+    return _solve_kwargs(problem, supply_nodes, demand_nodes, costs, time_limit, initial_flows)
+
+
+def merge_results(problem: dict, group_results: list[dict], intra_flows: dict[tuple[str, str], float],
+                  inter_result: dict | None) -> dict:
+    """グループ内・グループ間の結果を1カテゴリ分の結果にまとめる"""
+    category_key = problem["category_key"]
+    engine = problem.get("engine", "flow")
+    sub_results = group_results + ([inter_result] if inter_result is not None else [])
+
+    # 段階ごとの時間とモデルの大きさは部分問題の合計
+    stages: dict[str, float] = {}
+    model = None
+    for result in sub_results:
+        profile = result.get("profile") or {}
+        for stage, seconds in profile.get("stages", {}).items():
+            stages[stage] = stages.get(stage, 0.0) + seconds
+        if profile.get("model"):
+            model = model or {"variables": 0, "constraints": 0}
+            model["variables"] += profile["model"]["variables"]
+            model["constraints"] += profile["model"]["constraints"]
+    profile = {"stages": stages, "model": model, "gap": None}
+    solve_time = sum(result.get("solveTime", 0.0) for result in sub_results)
+
+    if inter_result is not None and inter_result["status"] == "Infeasible":
+        return {
+            "objectKey": category_key,
+            "status": "Infeasible",
+            "totalCost": None,
+            "taskCount": 0,
+            "routes": [],
+            "engine": engine,
+            "profile": profile,
+            "solveTime": solve_time,
+        }
+
+    flows = dict(intra_flows)
+    for route in (inter_result or {}).get("routes", []):
+        r = (route["supplyNode"], route["demandNode"])
+        flows[r] = flows.get(r, 0) + route["amount"]
+    # グループ間の問題が全経路で実行不能だと、CBC は存在しない経路（大きなコスト）で運ぶ解を返す。
+    # 実際には運べないので経路には含めず、運べなかった個数として返す
+    unrouted = sum(amount for r, amount in flows.items() if r not in problem["costs"])
+    flows = {r: amount for r, amount in flows.items() if r in problem["costs"]}
+    routes = [{"supplyNode": s, "demandNode": d, "amount": amount, "objectKey": category_key}
+              for (s, d), amount in flows.items()]
+    inter_amount = sum(route["amount"] for route in (inter_result or {}).get("routes", []))
+    return {
+        "objectKey": category_key,
+        "status": "Partial" if unrouted > 0 else "Feasible",
+        "totalCost": flow.total_cost(flows, problem["costs"], problem["task_penalty"]),
+        "taskCount": len(routes),
+        "routes": routes,
+        "engine": engine,
+        "decomposition": {
+            "groups": len(group_results),
+            "intraGroupAmount": sum(intra_flows.values()),
+            "interGroupAmount": inter_amount,
+            "unroutedAmount": unrouted,
+        },
+        "profile": profile,
+        "solveTime": solve_time,
+    }
+
+
+def _has_residual(residual: dict) -> bool:
+    # 需要が残っていなければ、余った供給はそのままでよい
+    return bool(residual["demand_nodes"])
+
+
+def _submit_until_queued(problem: dict, priority: int, deadline: float | None) -> Future:
+    """
+    グループ間の問題を待ち行列に入れる。グループ内の問題を解き終えてから入れるので、
+    待ち行列がいっぱいなら間隔を延ばしながら入れ直し、期限（期限がなければ REQUEUE_TIMEOUT_SECONDS 後）を過ぎたらあきらめる
+    """
+    give_up = time.monotonic() + REQUEUE_TIMEOUT_SECONDS if deadline is None else deadline
+    delay = REQUEUE_INITIAL_DELAY
+    while True:
+        try:
+            return scheduler.submit(solver.solve_category, problem, priority, deadline)
+        except scheduler.QueueFullError:
+            remaining = give_up - time.monotonic()
+            if remaining <= 0:
+                raise
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, REQUEUE_MAX_DELAY)
+
+
+def _finish_decomposed(problems: list[dict], subproblems: list[list[dict]], group_futures: list[list[Future]],
+                       futures: list[Future], priority: int, deadline: float | None) -> None:
+    # グループ内の問題を解き終えたカテゴリから、順にグループ間の問題を入れる
+    pending: list[tuple[list[dict], dict[tuple[str, str], float], Future | None] | None] = []
+    for problem, subs, subs_futures, future in zip(problems, subproblems, group_futures, futures):
+        try:
+            group_results = [sub_future.result() for sub_future in subs_futures]
+            intra_flows: dict[tuple[str, str], float] = {}
+            for sub, result in zip(subs, group_results):
+                intra_flows.update(subproblem_flows(sub, result))
+            residual = residual_problem(problem, intra_flows, max(1, problem["time_limit"] // 2))
+            inter_future = _submit_until_queued(residual, priority, deadline) if _has_residual(residual) else None
+            pending.append((group_results, intra_flows, inter_future))
+        except Exception as e:
+            future.set_exception(e)
+            pending.append(None)
+
+    for problem, future, item in zip(problems, futures, pending):
+        if item is None:
+            continue
+        group_results, intra_flows, inter_future = item
+        try:
+            inter_result = inter_future.result() if inter_future is not None else None
+            future.set_result(merge_results(problem, group_results, intra_flows, inter_result))
+        except Exception as e:
+            future.set_exception(e)
+
+
+def submit_decomposed(problems: list[dict], priority: int = scheduler.PRIORITY_INTERACTIVE,
+                      deadline: float | None = None) -> list[Future]:
+    """
+    カテゴリごとの問題をグループ分解で解き始め、カテゴリごとの結果の Future を返す。
+    全カテゴリのグループ内の部分問題をまとめて scheduler の待ち行列に入れ（入りきらなければ QueueFullError）、
+    グループ内を解き終えたカテゴリからグループ間の問題を続けて解く。
+    各 problem は solver.solve_category の引数に groups を加えたもの。deadline は scheduler の期限。
+    """
+    # 時間制限は前半・後半で半分ずつ。前半はさらに部分問題の順番待ちの段数で分ける
+    subproblems = []
+    for problem in problems:
+        half = max(1, problem["time_limit"] // 2)
+        subs = group_subproblems(problem, half)
+        for sub in subs:
+            sub["problem"]["time_limit"] = solver.split_time_limit(half, len(subs))
+        subproblems.append(subs)
+    flat = [sub["problem"] for subs in subproblems for sub in subs]
+    flat_futures = iter(scheduler.get_scheduler().submit_many(solver.solve_category, flat, priority, deadline))
+    group_futures = [[next(flat_futures) for _ in subs] for subs in subproblems]
+
+    futures = [Future() for _ in problems]
+    thread = threading.Thread(target=_finish_decomposed,
+                              args=(problems, subproblems, group_futures, futures, priority, deadline), daemon=True)
+    thread.start()
+    return futures
+
+
+def solve_decomposed(problems: list[dict], deadline: float | None = None) -> list[dict]:
+    """submit_decomposed で解き、全カテゴリの結果を元の順番で返す"""
+    return [future.result() for future in submit_decomposed(problems, deadline=deadline)]
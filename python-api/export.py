@@ -0,0 +1,161 @@
+"""
+タスク一覧の CSV / Excel (xlsx) 出力
+
+タスクは物品1種類ごとに1行（タスク番号・何か所目か・運搬元・運搬先・物品・個数）に展開し、
+行のジェネレーターから一定行数ごとにバイト列を作って返す。全行を一度にメモリに載せないので、
+大きな計画でも StreamingResponse でそのまま送り出せる。
+xlsx は外部ライブラリを使わず、シートの XML を zip に逐次書き込む（文字列はセル内に直接書く inlineStr）。
+"""
+import csv
+import io
+import zipfile
+from typing import Iterable, Iterator
+from xml.sax.saxutils import escape
+
+# 1回に送り出す行数
+CHUNK_ROWS = 1000
+
+COLUMNS = ("taskId", "stop", "sourceNode", "sourceName", "demandNode", "demandName",
+           "objectKey", "objectName", "amount")
+HEADERS = ("タスク番号", "順番", "運搬元キー", "運搬元", "運搬先キー", "運搬先", "物品キー", "物品", "個数")
+
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def task_rows(tasks: Iterable[dict], point_names: dict[str, str] | None = None,
+              category_names: dict[str, str] | None = None) -> Iterator[tuple]:
+    """タスクを COLUMNS の順の行に展開する"""
+    point_names = point_names or {}
+    category_names = category_names or {}
+    for task in tasks:
+        source = task["sourceNode"]
+        for stop_number, stop in enumerate(task["stops"], start=1):
+            demand = stop["demandNode"]
+            for item in stop["items"]:
+                yield (task["taskId"], stop_number, source, point_names.get(source, source),
+                       demand, point_names.get(demand, demand),
+                       item["objectKey"], category_names.get(item["objectKey"], item["objectKey"]), item["amount"])
+
+
+def iter_csv(rows: Iterable[tuple], chunk_rows: int = CHUNK_ROWS) -> Iterator[bytes]:
+    """Excel でそのまま開けるよう BOM 付き UTF-8 の CSV を返す"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\r\n")
+    buffer.write("\ufeff")
+    writer.writerow(HEADERS)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % chunk_rows == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """zip の書き込み先。シークできないストリームとして、書かれたバイト列を溜めておく"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _column_name(index: int) -> str:
+    name = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        name = chr(ord("A") + remainder) + name
+    return name
+
+
+def _sheet_row(row_number: int, values: tuple) -> str:
+    cells = []
+    for i, value in enumerate(values):
+        ref = f"{_column_name(i)}{row_number}"
+        if value is None:
+            continue
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            cells.append(f'<c r="{ref}"><v>{value}</v></c>')
+        else:
+            cells.append(f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{escape(str(value))}</t></is></c>')
+    return f'<row r="{row_number}">{"".join(cells)}</row>'
+
+
+_XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="tasks" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def iter_xlsx(rows: Iterable[tuple], chunk_rows: int = CHUNK_ROWS) -> Iterator[bytes]:
+    """1シート (tasks) の xlsx を返す。1行目は見出し"""
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, content in _XLSX_PARTS.items():
+            zf.writestr(name, content)
+        with zf.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            sheet.write(_sheet_row(1, HEADERS).encode("utf-8"))
+            lines = []
+            for row_number, row in enumerate(rows, start=2):
+                lines.append(_sheet_row(row_number, row))
+                if len(lines) >= chunk_rows:
+                    sheet.write("".join(lines).encode("utf-8"))
+                    lines.clear()
+                    yield buffer.take()
+            sheet.write("".join(lines).encode("utf-8"))
+            sheet.write(b"</sheetData></worksheet>")
+    yield buffer.take()
+
+
+def iter_export(rows: Iterable[tuple], file_format: str) -> Iterator[bytes]:
+    return iter_xlsx(rows) if file_format == "xlsx" else iter_csv(rows)
@@ -0,0 +1,343 @@
+"""
+輸送問題向けの最小費用流ソルバー
+
+PuLP/CBC を起動せずにプロセス内で解くためのモジュール。
+ネットワーク単体法でタスクペナルティ抜きの厳密な最適解を求め、
+その後の局所探索で小さな流れをまとめてタスク数（固定費）を減らす。
+単体法の各反復では、退出枝で切り離された部分木だけをつなぎ直し、進入枝の選択（価格付け）は NumPy でまとめて計算する。
+"""
+import array
+import math
+
+import numpy as np
+
+# 被約費用の判定に使う許容誤差
+EPS = 1e-9
+# 価格付けで一度に被約費用を求める枝の数の下限
+PRICING_MIN_BLOCK = 1024
+
+
+def network_simplex(supply: dict[str, int], demand: dict[str, int],
+                    costs: dict[tuple[str, str], float]) -> dict[tuple[str, str], int] | None:
+    """
+    供給地からの送り出し量 <= supply、需要地への到着量 == demand を満たす
+    最小費用流を求める。costs に存在する (供給地, 需要地) の組だけを枝として使う。
+    実行不能な場合は None を返す。
+    """
+    supply_keys = list(supply)
+    demand_keys = list(demand)
+    total_supply = sum(supply.values())
+    total_demand = sum(demand.values())
+    if total_demand > total_supply:
+        return None
+
+    s_index = {k: i for i, k in enumerate(supply_keys)}
+    d_index = {k: i for i, k in enumerate(demand_keys)}
+    n_s = len(supply_keys)
+    n_d = len(demand_keys)
+
+    # ノード番号: 供給地 0..n_s-1, 需要地 n_s..n_s+n_d-1, 余剰を吸収するダミー, 人工ルート
+    dummy = n_s + n_d
+    root = dummy + 1
+    n = root + 1
+    balance = [supply[k] for k in supply_keys] + [-demand[k] for k in demand_keys]
+    balance += [total_demand - total_supply, 0]
+
+    src: list[int] = []
+    dst: list[int] = []
+    cost: list[float] = []
+    for (s, d), c in costs.items():
+        i = s_index.get(s)
+        j = d_index.get(d)
+        if i is None or j is None:
+            continue
+        src.append(i)
+        dst.append(n_s + j)
+        cost.append(float(c))
+    n_real = len(src)
+    for i in range(n_s):
+        src.append(i)
+        dst.append(dummy)
+        cost.append(0.0)
+
+    # 人工枝による初期全域木（強実行可能になるよう流量0の枝はルートから外向き）
+    max_cost = max((abs(c) for c in cost), default=0.0)
+    art_cost = (max_cost + 1.0) * n
+    flow = [0] * len(src)
+    # 木の枝をノードごとに持つ（ルートには全ノードの人工枝がつくので、取り除きやすいよう set にする）
+    tree_adj: list[set[int]] = [set() for _ in range(n)]
+    for v in range(root):
+        a = len(src)
+        if balance[v] > 0:
+            src.append(v)
+            dst.append(root)
+            flow.append(balance[v])
+        else:
+            src.append(root)
+            dst.append(v)
+            flow.append(-balance[v])
+        cost.append(art_cost)
+        tree_adj[v].add(a)
+        tree_adj[root].add(a)
+    m = len(src)
+    # in_tree と pi は、価格付けで NumPy からも読めるよう同じメモリを共有する配列にする
+    # （木の更新では要素ごとに書き換えるので、Python から速く書ける bytearray / array.array を使う）
+    in_tree = bytearray(m)
+    for a in range(len(src) - root, m):
+        in_tree[a] = 1
+
+    parent = [-1] * n
+    pred = [-1] * n
+    depth = [0] * n
+    pi = array.array("d", [0.0]) * n
+
+    def update_subtree(top: int, above: int, a: int):
+        # top を枝 a で above の下につなぎ、top から下（above 側を除く）の親・深さ・ポテンシャルを更新する
+        parent[top] = above
+        pred[top] = a
+        if above < 0:
+            depth[top] = 0
+            pi[top] = 0.0
+        else:
+            depth[top] = depth[above] + 1
+            pi[top] = pi[above] + cost[a] if src[a] == above else pi[above] - cost[a]
+        stack = [top]
+        while stack:
+            u = stack.pop()
+            for a in tree_adj[u]:
+                if a == pred[u]:
+                    continue
+                w = dst[a] if src[a] == u else src[a]
+                parent[w] = u
+                pred[w] = a
+                depth[w] = depth[u] + 1
+                pi[w] = pi[u] + cost[a] if src[a] == u else pi[u] - cost[a]
+                stack.append(w)
+
+    def pivot(e: int):
+        u, v = src[e], dst[e]
+        # 閉路の頂点（join）まで両側から登る
+        u_path: list[int] = []
+        v_path: list[int] = []
+        x, y = u, v
+        while x != y:
+            if depth[x] >= depth[y]:
+                u_path.append(x)
+                x = parent[x]
+            else:
+                v_path.append(y)
+                y = parent[y]
+
+        # join から u へ下り、e を通って v から join へ登る順で閉路を走査し、
+        # 最後に見つかったブロッキング枝を退出枝とする（巡回防止）
+        leave = -1
+        leave_on_u_side = False
+        delta = math.inf
+        for w in reversed(u_path):
+            a = pred[w]
+            if src[a] == w and flow[a] <= delta:
+                delta = flow[a]
+                leave = a
+                leave_on_u_side = True
+        for w in v_path:
+            a = pred[w]
+            if dst[a] == w and flow[a] <= delta:
+                delta = flow[a]
+                leave = a
+                leave_on_u_side = False
+        if leave < 0:
+            raise ValueError("負のコストの閉路があるため最小費用流が定まりません。")
+
+        flow[e] += delta
+        for w in u_path:
+            a = pred[w]
+            flow[a] += delta if dst[a] == w else -delta
+        for w in v_path:
+            a = pred[w]
+            flow[a] += delta if src[a] == w else -delta
+
+        tree_adj[src[leave]].remove(leave)
+        tree_adj[dst[leave]].remove(leave)
+        in_tree[leave] = 0
+        tree_adj[u].add(e)
+        tree_adj[v].add(e)
+        in_tree[e] = 1
+        # 退出枝で切り離された部分木（退出枝がある側の端点を含む）だけを、進入枝でつなぎ直す。
+        # 木全体を辿り直さないので、1回の更新は部分木の大きさに比例する
+        if leave_on_u_side:
+            update_subtree(u, v, e)
+        else:
+            update_subtree(v, u, e)
+
+    update_subtree(root, -1, -1)
+
+    # ブロック探索による価格付け。ブロックごとの被約費用は NumPy でまとめて計算し、
+    # 最も負のものを進入枝にする。全ブロックに負のものがなければ最適
+    src_np = np.array(src, dtype=np.int64)
+    dst_np = np.array(dst, dtype=np.int64)
+    cost_np = np.array(cost, dtype=np.float64)
+    pi_np = np.frombuffer(pi, dtype=np.float64)
+    in_tree_np = np.frombuffer(in_tree, dtype=np.uint8)
+    block = min(max(int(math.sqrt(m)) * 8, PRICING_MIN_BLOCK), m)
+    bounds = [(lo, min(lo + block, m)) for lo in range(0, m, block)]
+    b = 0
+    missed = 0
+    while missed < len(bounds):
+        lo, hi = bounds[b]
+        b = b + 1 if b + 1 < len(bounds) else 0
+        rc = cost_np[lo:hi] + pi_np[src_np[lo:hi]] - pi_np[dst_np[lo:hi]]
+        rc[in_tree_np[lo:hi] != 0] = 0.0
+        a = int(rc.argmin())
+        if rc[a] < -EPS:
+            pivot(lo + a)
+            missed = 0
+        else:
+            missed += 1
+
+    # 人工枝に流れが残っていれば実行不能
+    for a in range(n_real + n_s, m):
+        if flow[a] > 0:
+            return None
+
+    result: dict[tuple[str, str], int] = {}
+    for a in range(n_real):
+        if flow[a] > 0:
+            result[(supply_keys[src[a]], demand_keys[dst[a] - n_s])] = flow[a]
+    return result
+
+
+def total_cost(flows: dict[tuple[str, str], int], costs: dict[tuple[str, str], float], task_penalty: float) -> float:
+    """輸送費用とタスクペナルティの合計（CBCモデルの目的関数と同じ値）"""
+    return sum(costs[r] * amount for r, amount in flows.items()) + task_penalty * len(flows)
+
+
+def lower_bound(min_cost_flows: dict[tuple[str, str], int], demand: dict[str, int],
+                costs: dict[tuple[str, str], float], task_penalty: float) -> float:
+    """
+    輸送費用 + タスクペナルティの下界。輸送費用は network_simplex の解（ペナルティ抜きの最小値）以上で、
+    需要のある需要地にはそれぞれ少なくとも1つタスクが要る
+    """
+    return total_cost(min_cost_flows, costs, 0) + task_penalty * sum(1 for amount in demand.values() if amount > 0)
+
+
+def merge_tasks(flows: dict[tuple[str, str], int], supply: dict[str, int],
+                costs: dict[tuple[str, str], float], task_penalty: float,
+                max_passes: int = 50) -> dict[tuple[str, str], int]:
+    """
+    小さな流れを他の経路へ寄せてタスク数を減らす局所探索。
+    目的関数（輸送費用 + タスクペナルティ）が改善する移動だけを受け入れる。
+
+    - 付け替え: 流れ (s, d) を余裕のある供給地 s2 からの (s2, d) に移す
+    - 交換: 流れ (s, d) と (s2, d2) の間で a 個を (s, d2), (s2, d) に入れ替える
+    """
+    flows = dict(flows)
+    if task_penalty <= 0:
+        return flows
+
+    slack = dict(supply)
+    for (s, _), amount in flows.items():
+        slack[s] -= amount
+
+    for _ in range(max_passes):
+        improved = False
+        for r in sorted(flows, key=flows.get):
+            a = flows.get(r)
+            if not a:
+                continue
+            s, d = r
+            best_delta = -EPS
+            best_move = None
+
+            for s2, spare in slack.items():
+                if s2 == s or spare < a or (s2, d) not in costs:
+                    continue
+                delta = a * (costs[(s2, d)] - costs[r]) - task_penalty
+                if (s2, d) not in flows:
+                    delta += task_penalty
+                if delta < best_delta:
+                    best_delta = delta
+                    best_move = ("shift", s2)
+
+            for r2, b in flows.items():
+                s2, d2 = r2
+                if s2 == s or d2 == d or b < a:
+                    continue
+                if (s, d2) not in costs or (s2, d) not in costs:
+                    continue
+                opened = ((s, d2) not in flows) + ((s2, d) not in flows)
+                closed = 1 + (b == a)
+                delta = a * (costs[(s, d2)] + costs[(s2, d)] - costs[r] - costs[r2]) + task_penalty * (opened - closed)
+                if delta < best_delta:
+                    best_delta = delta
+                    best_move = ("swap", r2)
+
+            if best_move is None:
+                continue
+
+            kind, target = best_move
+            del flows[r]
+            if kind == "shift":
+                flows[(target, d)] = flows.get((target, d), 0) + a
+                slack[target] -= a
+                slack[s] += a
+            else:
+                s2, d2 = target
+                flows[target] -= a
+                if flows[target] == 0:
+                    del flows[target]
+                flows[(s, d2)] = flows.get((s, d2), 0) + a
+                flows[(s2, d)] = flows.get((s2, d), 0) + a
+            improved = True
+        if not improved:
+            break
+    return flows
+
+
+def _trim_excess(flows: dict[tuple[str, str], int], limits: dict[str, int], side: int,
+                 costs: dict[tuple[str, str], float]) -> None:
+    # 上限を超えている地点の流れを、コストの高い経路から削る
+    totals: dict[str, int] = {}
+    for r, amount in flows.items():
+        totals[r[side]] = totals.get(r[side], 0) + amount
+    for r in sorted(flows, key=costs.get, reverse=True):
+        excess = totals[r[side]] - limits[r[side]]
+        if excess <= 0:
+            continue
+        cut = min(excess, flows[r])
+        flows[r] -= cut
+        totals[r[side]] -= cut
+        if flows[r] == 0:
+            del flows[r]
+
+
+def repair_solution(initial: dict[tuple[str, str], float], supply: dict[str, int], demand: dict[str, int],
+                    costs: dict[tuple[str, str], float]) -> dict[tuple[str, str], int] | None:
+    """
+    前回の解などを、新しい供給量・需要量を満たすように修正する。
+    使えない経路や超過分を削り、足りない需要は残りの供給から最小費用流で埋める。
+    修正できない場合は None を返す。
+    """
+    flows: dict[tuple[str, str], int] = {}
+    for r, amount in initial.items():
+        amount = int(round(amount))
+        if amount > 0 and r in costs and r[0] in supply and r[1] in demand:
+            flows[r] = amount
+
+    _trim_excess(flows, supply, 0, costs)
+    _trim_excess(flows, demand, 1, costs)
+
+    slack = dict(supply)
+    deficit = dict(demand)
+    for (s, d), amount in flows.items():
+        slack[s] -= amount
+        deficit[d] -= amount
+    deficit = {d: amount for d, amount in deficit.items() if amount > 0}
+    if not deficit:
+        return flows
+
+    extra = network_simplex({s: amount for s, amount in slack.items() if amount > 0}, deficit, costs)
+    if extra is None:
+        return None
+    for r, amount in extra.items():
+        flows[r] = flows.get(r, 0) + amount
+    return flows
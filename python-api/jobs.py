@@ -0,0 +1,188 @@
+"""
+長時間かかる求解をジョブとして非同期に実行するためのモジュール
+
+ジョブはメモリ上の JobStore に保持する。各カテゴリの進捗（暫定解・下界・ギャップ）は
+ワーカーが書き出す CBC のログファイルを定期的に読み取って更新する。
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable
+
+import scheduler
+import solver
+
+# 保持する完了済みジョブの上限（古いものから削除）
+MAX_JOBS = 100
+# ログを読み直す間隔（秒）
+POLL_INTERVAL = 0.5
+
+
+class Job:
+    def __init__(self, category_keys: list[str]):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"
+        self.createdAt = time.time()
+        self.finishedAt: float | None = None
+        self.categories = [
+            {"objectKey": key, "state": "queued", "status": None,
+             "incumbent": None, "bound": None, "gap": None, "solveTime": None}
+            for key in category_keys
+        ]
+        self.result: list[dict] | None = None
+        self.error: str | None = None
+        # 状態が変わるたびに増える番号（SSEで差分を検知するため）
+        self.version = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "jobId": self.id,
+            "status": self.status,
+            "createdAt": self.createdAt,
+            "finishedAt": self.finishedAt,
+            "categories": [dict(c) for c in self.categories],
+            "error": self.error,
+        }
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+
+class JobStore:
+    def __init__(self, max_jobs: int = MAX_JOBS):
+        self.max_jobs = max_jobs
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, category_keys: list[str]) -> Job:
+        job = Job(category_keys)
+        with self._lock:
+            self._jobs[job.id] = job
+            # 完了済みのジョブから古い順に捨てる
+            for job_id in list(self._jobs):
+                if len(self._jobs) <= self.max_jobs:
+                    break
+                if self._jobs[job_id].finished:
+                    del self._jobs[job_id]
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def update(self, job: Job, **fields) -> None:
+        with self._lock:
+            for name, value in fields.items():
+                setattr(job, name, value)
+            job.version += 1
+
+    def update_category(self, job: Job, index: int, **fields) -> None:
+        with self._lock:
+            category = job.categories[index]
+            changed = any(category.get(name) != value for name, value in fields.items())
+            if changed:
+                category.update(fields)
+                job.version += 1
+
+    def snapshot(self, job: Job) -> tuple[int, dict]:
+        with self._lock:
+            return job.version, job.to_dict()
+
+
+def _read_log(path: str) -> str:
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            return f.read()
+    except FileNotFoundError:
+        return ""
+
+
+def _run(store: JobStore, job: Job, futures: dict[int, Future], log_dir: str, results: list[dict | None],
+         on_result: Callable[[int, dict], None] | None) -> None:
+    try:
+        store.update(job, status="running")
+        results = list(results)
+        for i, result in enumerate(results):
+            if result is not None:
+                # キャッシュ済みの結果はすぐに完了扱い
+                store.update_category(job, i, state="done", status=result["status"],
+                                      incumbent=result["totalCost"], solveTime=result.get("solveTime"),
+                                      gap=0.0 if result["status"] == "Optimal" else None)
+
+        while futures:
+            for i, future in list(futures.items()):
+                path = _log_path(log_dir, i)
+                if not future.done():
+                    # ログファイルが作られていれば、ワーカーが解き始めている
+                    if os.path.exists(path):
+                        store.update_category(job, i, state="running", **solver.parse_cbc_log(_read_log(path)))
+                    continue
+
+                del futures[i]
+                if future.exception() is not None:
+                    store.update_category(job, i, state="failed")
+                    raise future.exception()
+                result = future.result()
+                results[i] = result
+                if on_result is not None:
+                    on_result(i, result)
+                progress = solver.parse_cbc_log(_read_log(path))
+                if result.get("totalCost") is not None:
+                    progress["incumbent"] = result["totalCost"]
+                if result["status"] == "Optimal":
+                    progress["gap"] = 0.0
+                store.update_category(job, i, state="done", status=result["status"],
+                                      solveTime=result.get("solveTime"), **progress)
+            if futures:
+                time.sleep(POLL_INTERVAL)
+
+        store.update(job, status="done", result=results, finishedAt=time.time())
+    except Exception as e:
+        store.update(job, status="failed", error=repr(e), finishedAt=time.time())
+    finally:
+        shutil.rmtree(log_dir, ignore_errors=True)
+
+
+def _log_path(log_dir: str, i: int) -> str:
+    return os.path.join(log_dir, f"{i}.log")
+
+
+def start(store: JobStore, func: Callable[..., dict], category_keys: list[str], problems: list[dict],
+          results: list[dict | None] | None = None,
+          on_result: Callable[[int, dict], None] | None = None, deadline: float | None = None,
+          submit_many: Callable[[list[dict], int, float | None], list[Future]] | None = None) -> Job:
+    """
+    ジョブを登録してバックグラウンドで解き始める。
+    func はキーワード引数 log_path で CBC のログファイルパスを受け取る必要がある。
+    submit_many を指定すると、func の代わりにそれで (問題のリスト, 優先度, 期限) を待ち行列に入れる
+    （decompose.submit_decomposed のように、1カテゴリを複数の問題に分けて解く場合）。
+    results に既に分かっている結果（キャッシュなど）があればそのカテゴリは解かない。
+    on_result は新しく解けたカテゴリごとに (番号, 結果) で呼ばれる。
+    問題は対話的なリクエストより低い優先度で scheduler の待ち行列に入れ、入りきらなければ
+    ジョブを作らずに scheduler.QueueFullError を送出する。
+    deadline を省略すると、対話的なリクエストの後で待たされても期限切れにせずに解く。
+    """
+    if results is None:
+        results = [None] * len(problems)
+    log_dir = tempfile.mkdtemp(prefix="solve-job-")
+    pending = [i for i, result in enumerate(results) if result is None]
+    try:
+        if submit_many is None:
+            submit_many = lambda problems, priority, deadline: scheduler.get_scheduler().submit_many(
+                func, problems, priority, deadline)
+        submitted = submit_many([{**problems[i], "log_path": _log_path(log_dir, i)} for i in pending],
+                                scheduler.PRIORITY_BACKGROUND, deadline)
+    except Exception:
+        shutil.rmtree(log_dir, ignore_errors=True)
+        raise
+    job = store.create(category_keys)
+    futures = dict(zip(pending, submitted))
+    thread = threading.Thread(target=_run, args=(store, job, futures, log_dir, results, on_result), daemon=True)
+    thread.start()
+    return job
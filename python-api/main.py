@@ -1,12 +1,40 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-import pulp
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from typing import Literal
+import asyncio
+import contextlib
+import json
+import os
+import tempfile
 import time
+import urllib.parse
 
 from pydantic import BaseModel, Field # BaseModelとFieldをインポート
 
+import batching
+import cache
+import decompose
+import export
+import jobs
+import metrics
+import preprocess
+import scheduler
+import sessions
+import solver
+import taskstore
+
+# イベントごとのタスクを保存する SQLite のファイル（既定は一時ディレクトリ）
+TASK_STORE_PATH = os.environ.get("TASK_STORE_PATH", os.path.join(tempfile.gettempdir(), "movingtasks-tasks.sqlite3"))
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    # ファイルは import 時ではなくサーバーの起動時に開く（作る）
+    app.state.task_store = taskstore.SqliteTaskStore(TASK_STORE_PATH)
+    yield
+
 # FastAPIアプリケーションのインスタンスを作成
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # --- ここが重要 ---
 # CORS (Cross-Origin Resource Sharing) の設定
@@ -27,6 +55,25 @@ app.add_middleware(
 )
 # --- ここまで ---
 
+@app.exception_handler(scheduler.QueueFullError)
+async def handle_queue_full(request: Request, exc: scheduler.QueueFullError):
+    # 混雑中は断り、少し待ってから送り直してもらう
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "5"})
+
+@app.exception_handler(scheduler.DeadlineExceededError)
+async def handle_deadline_exceeded(request: Request, exc: scheduler.DeadlineExceededError):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+@app.middleware("http")
+async def measure_request(request: Request, call_next):
+    """リクエストの受付時刻を記録し、処理時間をメトリクスに加える"""
+    request.state.received_at = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - request.state.received_at, method=request.method,
+                                    path=getattr(route, "path", "unmatched"), status=str(response.status_code))
+    return response
+
 class QuantityChangeModel(BaseModel):
     fromAmount: int
     toAmount: int
@@ -54,6 +101,22 @@ class RouteModel(BaseModel):
     distance: float
     nodeKeys: list[str]
 
+# 拠点・経由地を結ぶ辺（Paths.xml の Path に相当）
+class PathModel(BaseModel):
+    from_node: str = Field(alias='from')
+    to_node: str = Field(alias='to')
+    cost: float
+    # 逆向きのコスト。省略時は cost と同じ
+    oppositeCost: float | None = None
+    isProhibited: bool = False
+
+# 求解結果の1経路分（前回の解を初期解として送り返すときに使う）
+class RouteResultModel(BaseModel):
+    supplyNode: str
+    demandNode: str
+    amount: float
+    objectKey: str
+
 # フロントから送られてくるデータ全体の構造を定義
 class ProblemDataModel(BaseModel):
     objectCategories: dict[str, ObjectCategoryModel]
@@ -64,6 +127,56 @@ class ProblemDataModel(BaseModel):
     # どの物品カテゴリについて解くかを指定するキー
     targetObjectCategoryKeys: list[str]
     timeLimitSeconds: int = 60
+    # 辺の一覧を送ると、routes の距離の代わりにサーバー側で最短距離を計算する
+    paths: list[PathModel] | None = None
+    # 高速版エンドポイントで使うソルバー ("flow": 最小費用流, "cbc": PuLP/CBC)
+    engine: Literal["flow", "cbc"] = "flow"
+    # CBCの初期解。省略時は同じカテゴリの前回の解、それもなければ最小費用流の解を使う
+    initialSolution: list[RouteResultModel] | None = None
+    warmStart: bool = True
+    # CBCモデルで供給地ごとに候補とする近い需要地の数。省略時は経路のある組をすべて使う
+    candidateArcLimit: int | None = Field(default=None, ge=1)
+    # "group" にすると、地点の groupKey ごとにグループ内で釣り合わせてから残りをグループ間で解く
+    decomposition: Literal["none", "group"] = "none"
+    # true にすると全カテゴリを1つのCBCモデルで解き、同じ供給地→需要地のタスクペナルティを共有する
+    # (engine・decomposition の指定は使わない。ジョブ形式のAPIでは使えない)
+    joint: bool = False
+    # true にすると各カテゴリの結果に段階ごとの処理時間・モデルの大きさ・ギャップ (debug) を付ける
+    debug: bool = False
+
+
+# セッションへの変更（数量）。省略した側は変えない
+class QuantityPatchModel(BaseModel):
+    pointKey: str
+    objectKey: str
+    fromAmount: int | None = None
+    toAmount: int | None = None
+
+# セッションへの変更（経路の距離）。ない経路は追加する
+class RoutePatchModel(BaseModel):
+    from_node: str = Field(alias='from')
+    to_node: str = Field(alias='to')
+    distance: float
+
+class ProblemPatchModel(BaseModel):
+    quantities: list[QuantityPatchModel] = []
+    routes: list[RoutePatchModel] = []
+    taskPenalty: int | None = None
+    timeLimitSeconds: int | None = None
+    targetObjectCategoryKeys: list[str] | None = None
+
+# 求解結果を単位タスクにまとめるときの設定
+class BatchingModel(BaseModel):
+    # 1回の運搬で運べる量（unitLoads で換算した値）
+    capacity: float = Field(gt=0)
+    # 物品カテゴリごとの1個あたりの量。省略したカテゴリは 1
+    unitLoads: dict[str, float] = {}
+
+class TaskRequestModel(BaseModel):
+    problem: ProblemDataModel
+    batching: BatchingModel
+    # 求解結果の経路。省略時は高速版エンドポイントと同じ方法で解いてからタスクにする
+    solution: list[RouteResultModel] | None = None
 
 
 # ▼▼▼ 新しいAPIエンドポイント ▼▼▼
@@ -72,189 +185,366 @@ def health_check():
     """Renderのヘルスチェック用エンドポイント"""
     return {"status": "ok"}
 
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus 形式のメトリクス"""
+    metrics.CACHE_ENTRIES.set(len(solution_cache))
+    solver_stats = scheduler.get_scheduler().stats()
+    metrics.SOLVER_QUEUED.set(solver_stats["queued"])
+    metrics.SOLVER_RUNNING.set(solver_stats["running"])
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+def request_profile(request: Request) -> dict[str, float]:
+    """受付からハンドラーが呼ばれるまで（本体の読込と ProblemDataModel への変換）を parse として記録する"""
+    return {"parse": time.perf_counter() - request.state.received_at}
+
+def finish_results(results: list[dict], stages: dict[str, float], debug: bool) -> list[dict]:
+    """solver が付けた profile をメトリクスに記録し、debug 指定時は結果の debug に移す"""
+    for result in results:
+        profile = result.pop("profile", None)
+        metrics.record_result(result, profile)
+        if debug:
+            result["debug"] = {"request": stages, **(profile or {})}
+    return results
+
 @app.post("/solve-dynamic-problem")
-def solve_dynamic_problem(data: ProblemDataModel): # 引数でデータを受け取る
+def solve_dynamic_problem(data: ProblemDataModel, request: Request): # 引数でデータを受け取る
     # --- データへのアクセス方法 ---
     # FastAPIとPydanticのおかげで、dataは既にPythonオブジェクトになっている
     # print(f"Solving for category: {data.targetObjectCategoryKey}")
     # print(f"Task Penalty: {data.taskPenalty}")
     # print(f"First point's name: {list(data.points.values())[0].name}")
-    final_response = []
     print("\n--- Backend Solver Start ---") # ログ追加
     print(f"Received request to solve for: {data.targetObjectCategoryKeys}") # ログ追加
-    
+    stages = request_profile(request)
+
+    # 地点×カテゴリの数量と経路の距離を一度だけ配列にしておく
+    stage_start = time.perf_counter()
+    arrays = preprocess.ProblemArrays.from_model(data)
+    stages["preprocess"] = time.perf_counter() - stage_start
+
     # 1. 計算対象のデータを抽出
+    stage_start = time.perf_counter()
+    problems = []
     for category_key in data.targetObjectCategoryKeys:
-        
-        supply_nodes = {}
-        demand_nodes = {}
-
-        for point_key, point in data.points.items():
-            if category_key in point.objects:
-                change = point.objects[category_key].toAmount - point.objects[category_key].fromAmount
-                if change < 0: # 供給地 (在庫が増える)
-                    supply_nodes[point_key] = -change # 応急処置
-                elif change > 0: # 需要地 (在庫が減る)
-                    demand_nodes[point_key] = +change # 応急処置
-        
+        # 供給地 (在庫が減る) / 需要地 (在庫が増える)
+        supply_nodes, demand_nodes = arrays.quantity_changes(category_key) # 応急処置
+
         print(f"Extracted Supply Nodes: {supply_nodes}")
         print(f"Extracted Demand Nodes: {demand_nodes}")
 
-        # コストはRouteのdistanceを利用
-        costs = {(r.from_node, r.to_node): r.distance for r in data.routes.values()}
-        
-        # 2. PuLP問題の定義 (ロジックは前回とほぼ同じ)
-        prob = pulp.LpProblem("Dynamic_Transportation_Problem", pulp.LpMinimize)
-        
-        # 変数定義
-        route_keys = [(s, d) for s in supply_nodes for d in demand_nodes]
-        route_vars = pulp.LpVariable.dicts("Route", route_keys, lowBound=0, cat='Integer')
-        task_vars = pulp.LpVariable.dicts("TaskActive", route_keys, cat='Binary')
-
-        # 目的関数
-        prob += (
-            pulp.lpSum([route_vars[r] * costs.get(r, 1e9) for r in route_keys]) + # 存在しない経路は大きなコスト
-            pulp.lpSum([task_vars[r] * data.taskPenalty for r in route_keys]),
-            "Total_Cost"
-        )
-
-        # 制約条件
-        for s_key, s_amount in supply_nodes.items():
-            prob += pulp.lpSum([route_vars[(s_key, d_key)] for d_key in demand_nodes]) <= s_amount
-        
-        for d_key, d_amount in demand_nodes.items():
-            prob += pulp.lpSum([route_vars[(s_key, d_key)] for s_key in supply_nodes]) == d_amount
-
-        M = sum(supply_nodes.values())
-        for r in route_keys:
-            prob += route_vars[r] <= M * task_vars[r]
-
-        # 3. 問題を解いて結果を返す (前回と同様のロジック)
-        prob.solve()
-        
-        status = pulp.LpStatus[prob.status]
-        category_routes = []
-        
-        if status == "Optimal":
-            for r in route_keys:
-                amount = pulp.value(route_vars[r])
-                if amount > 0:
-                    category_routes.append({
-                        "supplyNode": r[0],
-                        "demandNode": r[1],
-                        "amount": amount,
-                        "objectKey": category_key # ★ objectKeyも付与
-                    })
-        
-        # ★ このカテゴリの結果オブジェクトを作成
-        category_result = {
-            "objectKey": category_key,
-            "status": status,
-            "totalCost": pulp.value(prob.objective) if status == "Optimal" else None,
-            "taskCount": len(category_routes), # ★ タスク数を計算
-            "routes": category_routes
-        }
-        
-        final_response.append(category_result) # ★ 最終レスポンスリストに追加
-    return final_response
+        problems.append({
+            "category_key": category_key,
+            "supply_nodes": supply_nodes,
+            "demand_nodes": demand_nodes,
+            "costs": arrays.costs_between(supply_nodes, demand_nodes),
+            "task_penalty": data.taskPenalty,
+        })
+    stages["extraction"] = time.perf_counter() - stage_start
+    metrics.record_request_stages(stages)
 
-# ★★★ 新しいAPIエンドポイントを追加 ★★★
-@app.post("/solve-dynamic-problem-fast")
-def solve_dynamic_problem_fast(data: ProblemDataModel):
-    final_response = []
+    # 2. カテゴリごとの問題は独立しているので並列に解く (結果は元の順番で返る)
+    return finish_results(scheduler.run_parallel(solver.solve_category_plain, problems), stages, data.debug)
+
+def build_fast_problems(data: ProblemDataModel, stages: dict[str, float] | None = None,
+                        arrays: preprocess.ProblemArrays | None = None) -> list[dict]:
+    """
+    高速版エンドポイント用に、カテゴリごとの solver.solve_category の引数を組み立てる。
+    stages を渡すと前処理 (preprocess) と数量・コストの抽出 (extraction) の時間を書き込む。
+    arrays を渡すと、変換済みの配列をそのまま使う
+    """
     # TIME_LIMIT_SECONDS = 300
-    
+
+    stage_start = time.perf_counter()
+    if arrays is None:
+        arrays = preprocess.ProblemArrays.from_model(data)
+        if stages is not None:
+            stages["preprocess"] = time.perf_counter() - stage_start
+    stage_start = time.perf_counter()
+
+    initial_flows = {}
+    for route in data.initialSolution or []:
+        flows = initial_flows.setdefault(route.objectKey, {})
+        flows[(route.supplyNode, route.demandNode)] = route.amount
+
+    problems = []
     for category_key in data.targetObjectCategoryKeys:
-        
-        supply_nodes = {}
-        demand_nodes = {}
-
-        for point_key, point in data.points.items():
-            if category_key in point.objects:
-                change = point.objects[category_key].toAmount - point.objects[category_key].fromAmount
-                if change < 0: # 供給地 (在庫が増える)
-                    demand_nodes[point_key] = -change
-                elif change > 0: # 需要地 (在庫が減る)
-                    supply_nodes[point_key] = +change # 需要量は正の値にする
-        
+        # 供給地 (在庫が増える) / 需要地 (在庫が減る)
+        demand_nodes, supply_nodes = arrays.quantity_changes(category_key)
+
         print(f"Extracted Supply Nodes: {supply_nodes}")
         print(f"Extracted Demand Nodes: {demand_nodes}")
 
-        # コストはRouteのdistanceを利用
-        costs = {(r.from_node, r.to_node): r.distance for r in data.routes.values()}
-        
-        # 2. PuLP問題の定義 (ロジックは前回とほぼ同じ)
-        prob = pulp.LpProblem("Dynamic_Transportation_Problem", pulp.LpMinimize)
-        
-        # 変数定義
-        route_keys = [(s, d) for s in supply_nodes for d in demand_nodes]
-        route_vars = pulp.LpVariable.dicts("Route", route_keys, lowBound=0, cat='Integer')
-        task_vars = pulp.LpVariable.dicts("TaskActive", route_keys, cat='Binary')
-
-        # 目的関数
-        prob += (
-            pulp.lpSum([route_vars[r] * costs.get(r, 1e9) for r in route_keys]) + # 存在しない経路は大きなコスト
-            pulp.lpSum([task_vars[r] * data.taskPenalty for r in route_keys]),
-            "Total_Cost"
-        )
-
-        # 制約条件
-        for s_key, s_amount in supply_nodes.items():
-            prob += pulp.lpSum([route_vars[(s_key, d_key)] for d_key in demand_nodes]) <= s_amount
-        
-        for d_key, d_amount in demand_nodes.items():
-            prob += pulp.lpSum([route_vars[(s_key, d_key)] for s_key in supply_nodes]) == d_amount
-
-        M = sum(supply_nodes.values())
-        for r in route_keys:
-            prob += route_vars[r] <= M * task_vars[r]
-
-        # ★ 1. solveメソッドに時間制限を追加
-        # ここでは55秒に設定（Renderのタイムアウトが約1分のため） 
-        solver = pulp.PULP_CBC_CMD(timeLimit=data.timeLimitSeconds, msg=1)
-        # ★ 2. solve()の前後で時間を記録
-        start_time = time.time()
-        prob.solve(solver)
-        end_time = time.time()
-
-        solve_time = end_time - start_time
-        print(f"--- Solve time for {category_key}: {solve_time:.2f} seconds ---")
-
-        status = pulp.LpStatus[prob.status]
-        objective_value = pulp.value(prob.objective)
-        
-        # ★★★ 3. 独自のステータス判定ロジック ★★★
-        custom_status = "Infeasible" # デフォルト
-
-        if objective_value is not None:
-            # 解が見つかった場合
-            if status == "Optimal" and solve_time < data.timeLimitSeconds * 0.98:
-                # ステータスがOptimal かつ 時間制限に明らかに達していない場合のみ最適と判断
-                custom_status = "Optimal"
-            else:
-                # それ以外はすべて暫定解 (Feasible) とする
-                custom_status = "Feasible"
-    
-        category_routes = []
-
-        # --- 結果のルート抽出 ---
-        # 解が見つかっている場合（OptimalまたはFeasible）のみ実行
-        if custom_status in ["Optimal", "Feasible"]:
-            for r in route_keys:
-                amount = pulp.value(route_vars[r])
-                if amount is not None and amount > 0:
-                    category_routes.append({
-                        "supplyNode": r[0], "demandNode": r[1],
-                        "amount": amount, "objectKey": category_key
-                    })
-        
-        category_result = {
-            "objectKey": category_key,
-            "status": custom_status,
-            "totalCost": objective_value,
-            "taskCount": len(category_routes),
-            "routes": category_routes,
-        }
-        final_response.append(category_result)
-
-    return final_response
\ No newline at end of file
+        problems.append({
+            "category_key": category_key,
+            "supply_nodes": supply_nodes,
+            "demand_nodes": demand_nodes,
+            "costs": arrays.costs_between(supply_nodes, demand_nodes),
+            "task_penalty": data.taskPenalty,
+            "time_limit": data.timeLimitSeconds,
+            "engine": data.engine,
+            "warm_start": data.warmStart,
+            "candidate_limit": data.candidateArcLimit,
+            "initial_flows": initial_flows.get(category_key) or (
+                solution_cache.latest_flows(category_key) if data.warmStart else None),
+        })
+        if data.decomposition == "group":
+            problems[-1]["groups"] = {key: data.points[key].groupKey for key in (*supply_nodes, *demand_nodes)}
+    if stages is not None:
+        stages["extraction"] = time.perf_counter() - stage_start
+        metrics.record_request_stages(stages)
+    return problems
+
+# 前回と内容が変わらないカテゴリは解き直さずに結果を返す
+solution_cache = cache.SolutionCache(int(os.environ.get("SOLUTION_CACHE_SIZE", cache.DEFAULT_MAX_ENTRIES)))
+
+def lookup_cached_results(data: ProblemDataModel, problems: list[dict]) -> tuple[list[str], list[dict | None]]:
+    """キャッシュを引き、実際に解くカテゴリだけで時間制限を分け合うよう設定する"""
+    keys = [cache.problem_key(problem) for problem in problems]
+    results = [solution_cache.get(key, problem["category_key"]) for key, problem in zip(keys, problems)]
+
+    # ★ 並列数を超えるカテゴリは順番待ちになるため、全体の時間制限を分け合う
+    time_limit = solver.split_time_limit(data.timeLimitSeconds, results.count(None))
+    for problem in problems:
+        problem["time_limit"] = time_limit
+    return keys, results
+
+def cache_result(key: str, result: dict) -> dict:
+    result["cacheHit"] = False
+    solution_cache.put(key, result)
+    solution_cache.remember_latest(result)
+    return result
+
+# ★★★ 新しいAPIエンドポイントを追加 ★★★
+@app.post("/solve-dynamic-problem-fast")
+def solve_dynamic_problem_fast(data: ProblemDataModel, request: Request):
+    return solve_fast(data, request_profile(request))
+
+def solve_fast(data: ProblemDataModel, stages: dict[str, float],
+               arrays: preprocess.ProblemArrays | None = None) -> list[dict]:
+    return solve_fast_problems(data, build_fast_problems(data, stages, arrays), stages)
+
+def solve_fast_problems(data: ProblemDataModel, problems: list[dict], stages: dict[str, float]) -> list[dict]:
+    # 順番待ちを含めて timeLimitSeconds 以内に返せるよう、期限を過ぎた問題は解かない
+    deadline = scheduler.deadline_after(data.timeLimitSeconds)
+    if data.joint:
+        # 各カテゴリの解が他のカテゴリに依存するので、カテゴリ単位のキャッシュは使わない
+        results = scheduler.submit(solver.solve_joint, {
+            "problems": problems, "time_limit": data.timeLimitSeconds,
+            "warm_start": data.warmStart, "candidate_limit": data.candidateArcLimit,
+        }, deadline=deadline).result()
+        for result in results:
+            solution_cache.remember_latest(result)
+        return finish_results(results, stages, data.debug)
+    keys, results = lookup_cached_results(data, problems)
+
+    missing = [i for i, result in enumerate(results) if result is None]
+    if data.decomposition == "group":
+        solved = decompose.solve_decomposed([problems[i] for i in missing], deadline)
+    else:
+        solved = scheduler.run_parallel(solver.solve_category, [problems[i] for i in missing], deadline=deadline)
+    for i, result in zip(missing, solved):
+        results[i] = cache_result(keys[i], result)
+    return finish_results(results, stages, data.debug)
+
+def plan_routes(data: TaskRequestModel, stages: dict[str, float]) -> tuple[preprocess.ProblemArrays, list[dict]]:
+    """タスクにする求解結果の経路を用意する（solution がなければその場で解く）"""
+    stage_start = time.perf_counter()
+    arrays = preprocess.ProblemArrays.from_model(data.problem)
+    stages["preprocess"] = time.perf_counter() - stage_start
+    if data.solution is None:
+        routes = [route for result in solve_fast(data.problem, stages, arrays) for route in result["routes"]]
+    else:
+        routes = [route.model_dump() for route in data.solution]
+        # 解いたときは、ここまでの段階は build_fast_problems で記録済み
+        metrics.record_request_stages(stages)
+    return arrays, routes
+
+def task_export_rows(data: TaskRequestModel, arrays: preprocess.ProblemArrays, routes: list[dict]):
+    """タスクを1件ずつ作りながら、地点名・物品名を付けた出力用の行にする"""
+    tasks = batching.iter_tasks(arrays, routes, data.batching.capacity, data.batching.unitLoads)
+    return export.task_rows(tasks, {key: point.name for key, point in data.problem.points.items()},
+                            {key: category.name for key, category in data.problem.objectCategories.items()})
+
+def export_response(chunks, file_format: str, filename: str) -> StreamingResponse:
+    return StreamingResponse(chunks, media_type=export.CONTENT_TYPES[file_format], headers={
+        "Content-Disposition": f"attachment; filename*=UTF-8''{urllib.parse.quote(filename)}.{file_format}"})
+
+@app.post("/tasks")
+def build_tasks(data: TaskRequestModel, request: Request):
+    """求解結果（省略時はその場で解く）を、運搬量の上限ごとの単位タスクの一覧にする"""
+    stages = request_profile(request)
+    arrays, routes = plan_routes(data, stages)
+
+    stage_start = time.perf_counter()
+    tasks = batching.build_tasks(arrays, routes, data.batching.capacity, data.batching.unitLoads)
+    stages["batching"] = time.perf_counter() - stage_start
+    metrics.record_request_stages({"batching": stages["batching"]})
+    response = {"tasks": tasks, "summary": batching.summarize(tasks)}
+    if data.problem.debug:
+        response["debug"] = {"request": stages}
+    return response
+
+@app.post("/tasks/export")
+def export_tasks(data: TaskRequestModel, request: Request, format: Literal["csv", "xlsx"] = "csv"):
+    """単位タスクの一覧を、作りながら CSV / Excel で送る"""
+    arrays, routes = plan_routes(data, request_profile(request))
+    return export_response(export.iter_export(task_export_rows(data, arrays, routes), format), format, "tasks")
+
+# ▼▼▼ イベントごとのタスクの保存 ▼▼▼
+# 試行（イベント）ごとに eventId を付けて保存し、後から同じ eventId で取り出す
+def get_task_store() -> taskstore.SqliteTaskStore:
+    return app.state.task_store
+
+@app.put("/events/{event_id}/tasks")
+def save_event_tasks(event_id: str, data: TaskRequestModel, request: Request):
+    """単位タスクを作りながら、eventId ごとにバッチで保存する"""
+    arrays, routes = plan_routes(data, request_profile(request))
+    return get_task_store().write(event_id, task_export_rows(data, arrays, routes))
+
+@app.get("/events/{event_id}/tasks")
+def download_event_tasks(event_id: str, format: Literal["csv", "xlsx"] = "csv"):
+    """保存したタスクを、読み出しながら CSV / Excel で送る"""
+    task_store = get_task_store()
+    if not task_store.has_event(event_id):
+        raise HTTPException(status_code=404, detail=f"イベント '{event_id}' のタスクは保存されていません")
+    return export_response(export.iter_export(task_store.rows(event_id), format), format, f"tasks-{event_id}")
+
+@app.delete("/events/{event_id}/tasks", status_code=204)
+def delete_event_tasks(event_id: str):
+    get_task_store().delete(event_id)
+    return Response(status_code=204)
+
+# ▼▼▼ 問題セッション ▼▼▼
+# 問題を一度だけ送り、以降は変更分だけを送って、影響を受けたカテゴリだけを解き直す
+session_store = sessions.SessionStore()
+
+def get_session_or_404(session_id: str) -> sessions.Session:
+    session = session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"セッション '{session_id}' が見つかりません")
+    return session
+
+@app.post("/sessions", status_code=201)
+def create_session(data: ProblemDataModel):
+    """問題を配列に変換して保持し、セッションIDを返す"""
+    session = session_store.create(data, preprocess.ProblemArrays.from_model(data))
+    return session.to_dict()
+
+@app.get("/sessions/{session_id}")
+def get_session(session_id: str):
+    session = get_session_or_404(session_id)
+    with session.lock:
+        return session.to_dict()
+
+@app.patch("/sessions/{session_id}")
+def patch_session(session_id: str, patch: ProblemPatchModel):
+    """変更を適用し、解き直しが必要になったカテゴリを返す"""
+    session = get_session_or_404(session_id)
+    with session.lock:
+        try:
+            affected = session.apply_patch(patch)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {**session.to_dict(), "affectedCategories": affected}
+
+@app.post("/sessions/{session_id}/solve")
+def solve_session(session_id: str, request: Request):
+    """未求解のカテゴリだけを解き、他のカテゴリは前回の結果と合わせて返す"""
+    session = get_session_or_404(session_id)
+    stages = request_profile(request)
+    # 問題の組み立てまではセッションを占有し、解いている間は変更を受け付ける
+    with session.lock:
+        data = session.data
+        pending = session.pending_categories()
+        if data.joint and pending:
+            # 全カテゴリをまとめて解くので、1つでも変われば全カテゴリを解き直す
+            pending = list(data.targetObjectCategoryKeys)
+        view = data.model_copy(update={"targetObjectCategoryKeys": pending})
+        revisions = {key: session.revisions.get(key, 0) for key in pending}
+        problems = build_fast_problems(view, stages, session.arrays)
+        version = session.version
+
+    solved = {result["objectKey"]: result for result in solve_fast_problems(view, problems, stages)} if problems else {}
+
+    with session.lock:
+        session.store_results(list(solved.values()), revisions)
+        results = []
+        for key in data.targetObjectCategoryKeys:
+            if key in solved:
+                results.append({**solved[key], "reused": False})
+            elif session.result_for(key) is not None:
+                results.append({**session.result_for(key), "reused": True})
+    return {"sessionId": session.id, "version": version, "solvedCategories": pending, "results": results}
+
+@app.delete("/sessions/{session_id}", status_code=204)
+def delete_session(session_id: str):
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail=f"セッション '{session_id}' が見つかりません")
+    return Response(status_code=204)
+
+# ▼▼▼ ジョブ形式のAPI ▼▼▼
+# 求解をバックグラウンドで行い、HTTP接続を保持し続けないようにする
+job_store = jobs.JobStore()
+
+def get_job_or_404(job_id: str) -> jobs.Job:
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"ジョブ '{job_id}' が見つかりません")
+    return job
+
+@app.post("/jobs/solve-dynamic-problem-fast", status_code=202)
+def submit_solve_job(data: ProblemDataModel, request: Request):
+    """求解ジョブを登録し、すぐにジョブIDを返す"""
+    if data.joint:
+        raise HTTPException(status_code=400, detail="joint はジョブ形式のAPIでは使えません")
+    stages = request_profile(request)
+    problems = build_fast_problems(data, stages)
+    keys, results = lookup_cached_results(data, problems)
+    finish_results([result for result in results if result is not None], stages, data.debug)
+
+    def on_result(i: int, result: dict) -> None:
+        cache_result(keys[i], result)
+        finish_results([result], stages, data.debug)
+
+    # ジョブは対話的なリクエストの後回しになるので、timeLimitSeconds からの期限は付けない（待っても解く）
+    submit_many = decompose.submit_decomposed if data.decomposition == "group" else None
+    job = jobs.start(job_store, solver.solve_category, data.targetObjectCategoryKeys, problems, results,
+                     on_result=on_result, submit_many=submit_many)
+    return {"jobId": job.id, "status": job.status}
+
+@app.get("/jobs/{job_id}")
+def get_job_status(job_id: str):
+    """カテゴリごとの状態・暫定解・ギャップを返す"""
+    _, snapshot = job_store.snapshot(get_job_or_404(job_id))
+    return snapshot
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """ジョブの進捗を Server-Sent Events で配信する。完了すると done イベントを送って終了する"""
+    job = get_job_or_404(job_id)
+
+    async def event_stream():
+        last_version = -1
+        while True:
+            version, snapshot = job_store.snapshot(job)
+            if version != last_version:
+                last_version = version
+                event = "done" if job.finished else "progress"
+                yield f"event: {event}\ndata: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+                if job.finished:
+                    return
+            await asyncio.sleep(jobs.POLL_INTERVAL)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@app.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    """完了したジョブの結果（/solve-dynamic-problem-fast と同じ形式）を返す"""
+    job = get_job_or_404(job_id)
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=f"ジョブが失敗しました: {job.error}")
+    if not job.finished:
+        raise HTTPException(status_code=409, detail="ジョブはまだ完了していません")
+    return job.result
@@ -0,0 +1,154 @@
+"""
+Prometheus 形式のメトリクス
+
+外部ライブラリは使わず、プロセス内でカウンター・ゲージ・ヒストグラムを集計し、
+/metrics でテキスト形式 (text/plain; version=0.0.4) として返す。
+"""
+import bisect
+import math
+import threading
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 処理時間（秒）のヒストグラムの区切り
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# モデルの大きさ（変数・制約の数）の区切り
+SIZE_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 1_000_000)
+# 最適性ギャップの区切り
+GAP_BUCKETS = (0.0, 0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+_lock = threading.Lock()
+_metrics: list["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: dict[tuple[tuple[str, str], ...], object] = {}
+        with _lock:
+            _metrics.append(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple[tuple[str, str], ...]:
+        return tuple((name, str(labels.get(name, ""))) for name in self.label_names)
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        lines += self._samples()
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        with _lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = TIME_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with _lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    with _lock:
+        return "\n".join(metric.render() for metric in _metrics) + "\n"
+
+
+# --- API で使うメトリクス ---
+
+REQUEST_SECONDS = Histogram("movingtasks_request_seconds", "HTTPリクエストの処理時間", ("method", "path", "status"))
+STAGE_SECONDS = Histogram("movingtasks_stage_seconds", "求解の段階ごとの処理時間", ("stage", "engine"))
+CATEGORY_RESULTS = Counter("movingtasks_category_results_total", "カテゴリごとの求解結果の件数", ("engine", "status", "cache"))
+MODEL_VARIABLES = Histogram("movingtasks_model_variables", "CBCモデルの変数の数", (), SIZE_BUCKETS)
+MODEL_CONSTRAINTS = Histogram("movingtasks_model_constraints", "CBCモデルの制約の数", (), SIZE_BUCKETS)
+GAP = Histogram("movingtasks_gap", "CBCの最適性ギャップ", ("status",), GAP_BUCKETS)
+CACHE_ENTRIES = Gauge("movingtasks_solution_cache_entries", "結果キャッシュのエントリ数")
+SOLVER_QUEUED = Gauge("movingtasks_solver_queued", "求解の待ち行列にある問題の数")
+SOLVER_RUNNING = Gauge("movingtasks_solver_running", "ワーカーで解いている最中の問題の数")
+SOLVER_REJECTED = Counter("movingtasks_solver_rejected_total", "待ち行列がいっぱいで断ったリクエストの数")
+SOLVER_COALESCED = Counter("movingtasks_solver_coalesced_total", "解いている最中の同じ問題の結果を分け合った数")
+SOLVER_EXPIRED = Counter("movingtasks_solver_expired_total", "期限を過ぎて解かなかった問題の数")
+SOLVER_POOL_RESTARTS = Counter("movingtasks_solver_pool_restarts_total", "ワーカーの異常終了でプロセスプールを作り直した回数")
+
+
+def record_request_stages(stages: dict[str, float]) -> None:
+    """リクエスト単位の段階（リクエストの解析・前処理・数量の抽出など）を記録する"""
+    for stage, seconds in stages.items():
+        STAGE_SECONDS.observe(seconds, stage=stage, engine="")
+
+
+def record_result(result: dict, profile: dict | None) -> None:
+    """カテゴリ1件分の結果と、solver が付けたプロファイルを記録する"""
+    engine = result.get("engine", "cbc")
+    CATEGORY_RESULTS.inc(engine=engine, status=str(result.get("status")),
+                         cache="hit" if result.get("cacheHit") else "miss")
+    if not profile:
+        return
+    for stage, seconds in profile["stages"].items():
+        STAGE_SECONDS.observe(seconds, stage=stage, engine=engine)
+    if profile.get("model"):
+        MODEL_VARIABLES.observe(profile["model"]["variables"])
+        MODEL_CONSTRAINTS.observe(profile["model"]["constraints"])
+    if profile.get("gap") is not None:
+        GAP.observe(profile["gap"], status=str(result.get("status")))
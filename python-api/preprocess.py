@@ -0,0 +1,196 @@
+"""
+リクエストの列指向配列への変換
+
+カテゴリごとに全地点・全経路を Python で走査しないよう、ProblemDataModel を一度だけ
+NumPy 配列（地点×カテゴリの変化前・変化後の数量行列と、経路の始点・終点・距離の配列）に変換し、
+各カテゴリの供給量・需要量と供給地→需要地のコストはベクトル演算で取り出す。
+"""
+import os
+
+import numpy as np
+
+import cache
+import routing
+
+# paths から求めた最短距離（変化する地点どうしの距離行列）のキャッシュ
+distance_cache = cache.DistanceCache(int(os.environ.get("DISTANCE_CACHE_SIZE", cache.DEFAULT_MAX_DISTANCE_ENTRIES)))
+
+
+def path_distances(paths, point_keys: list[str]) -> np.ndarray:
+    """
+    paths（PathModel の一覧）の最短距離で、point_keys どうしの距離行列を作る（到達できない組は inf）。
+    同じ辺・同じ地点の組なら、前回の結果をそのまま返す
+    """
+    edges = []
+    for path in paths:
+        if path.isProhibited:
+            continue
+        edges.append((path.from_node, path.to_node, path.cost))
+        edges.append((path.to_node, path.from_node, path.cost if path.oppositeCost is None else path.oppositeCost))
+    key = cache.distance_key(edges, point_keys)
+    matrix = distance_cache.get(key)
+    if matrix is None:
+        rows = routing.distance_rows(edges, point_keys, point_keys)
+        matrix = np.array(rows, dtype=np.float64).reshape(len(point_keys), len(point_keys))
+        matrix.flags.writeable = False
+        distance_cache.put(key, matrix)
+    return matrix
+
+
+class ProblemArrays:
+    def __init__(self, point_keys: list[str], category_index: dict[str, int],
+                 from_amounts: np.ndarray, to_amounts: np.ndarray,
+                 route_from: np.ndarray, route_to: np.ndarray, distances: np.ndarray):
+        self.point_keys = np.array(point_keys, dtype=object)
+        self.point_index = {key: i for i, key in enumerate(point_keys)}
+        self.category_index = category_index
+        # 地点×カテゴリの数量（その地点にない物品は 0）
+        self.from_amounts = from_amounts
+        self.to_amounts = to_amounts
+        # 経路（始点・終点は地点番号。重複はなく、地点以外を結ぶ経路は含めない）
+        self.route_from = route_from
+        self.route_to = route_to
+        self.distances = distances
+        # カテゴリごとに (始点, 終点) のタプルを作り直さないよう、経路のキーも配列で持つ
+        self.route_keys = np.empty(len(distances), dtype=object)
+        self.route_keys[:] = list(zip(self.point_keys[route_from].tolist(), self.point_keys[route_to].tolist()))
+        # 任意の組の距離を二分探索で引くための、(始点, 終点) の符号で並べた配列（初回に作る）
+        self._sorted_codes: np.ndarray | None = None
+        self._sorted_order: np.ndarray | None = None
+
+    @classmethod
+    def from_model(cls, data) -> "ProblemArrays":
+        """ProblemDataModel から配列を作る。paths があれば routes の距離を最短距離で上書きする"""
+        point_keys = list(data.points)
+        point_index = {key: i for i, key in enumerate(point_keys)}
+        category_index = {key: j for j, key in enumerate(data.objectCategories)}
+
+        rows, cols, froms, tos = [], [], [], []
+        for i, point in enumerate(data.points.values()):
+            for category_key, change in point.objects.items():
+                rows.append(i)
+                cols.append(category_index.setdefault(category_key, len(category_index)))
+                froms.append(change.fromAmount)
+                tos.append(change.toAmount)
+        shape = (len(point_keys), len(category_index))
+        from_amounts = np.zeros(shape, dtype=np.int64)
+        to_amounts = np.zeros(shape, dtype=np.int64)
+        from_amounts[rows, cols] = froms
+        to_amounts[rows, cols] = tos
+
+        # コストはRouteのdistanceを利用
+        route_from = np.array([point_index.get(r.from_node, -1) for r in data.routes.values()], dtype=np.int64)
+        route_to = np.array([point_index.get(r.to_node, -1) for r in data.routes.values()], dtype=np.int64)
+        distances = np.array([r.distance for r in data.routes.values()], dtype=np.float64)
+        if data.paths:
+            # 数量が変化する地点どうしの距離だけを求める
+            changed = np.flatnonzero((from_amounts != to_amounts).any(axis=1))
+            matrix = path_distances(data.paths, [point_keys[i] for i in changed])
+            rows, cols = np.nonzero(np.isfinite(matrix) & ~np.eye(len(changed), dtype=bool))
+            route_from = np.concatenate([route_from, changed[rows]])
+            route_to = np.concatenate([route_to, changed[cols]])
+            distances = np.concatenate([distances, matrix[rows, cols]])
+
+        valid = (route_from >= 0) & (route_to >= 0)
+        route_from, route_to, distances = route_from[valid], route_to[valid], distances[valid]
+
+        # 同じ (始点, 終点) が複数あれば dict と同様に最初の位置・最後の値を残す
+        codes = route_from * max(len(point_keys), 1) + route_to
+        _, first = np.unique(codes, return_index=True)
+        _, last_reversed = np.unique(codes[::-1], return_index=True)
+        last = len(codes) - 1 - last_reversed
+        order = np.argsort(first)
+        return cls(point_keys, category_index, from_amounts, to_amounts,
+                   route_from[first[order]], route_to[first[order]], distances[last[order]])
+
+    def quantity_changes(self, category_key: str) -> tuple[dict[str, int], dict[str, int]]:
+        """カテゴリごとに、在庫が減る地点と増える地点の変化量（正の値）を抽出する"""
+        j = self.category_index.get(category_key)
+        if j is None:
+            return {}, {}
+        change = self.to_amounts[:, j] - self.from_amounts[:, j]
+        decreases = np.flatnonzero(change < 0)
+        increases = np.flatnonzero(change > 0)
+        return (dict(zip(self.point_keys[decreases].tolist(), (-change[decreases]).tolist())),
+                dict(zip(self.point_keys[increases].tolist(), change[increases].tolist())))
+
+    def _mask(self, keys) -> np.ndarray:
+        mask = np.zeros(len(self.point_keys), dtype=bool)
+        mask[[self.point_index[key] for key in keys]] = True
+        return mask
+
+    def costs_between(self, supply_nodes: dict[str, int], demand_nodes: dict[str, int]) -> dict[tuple[str, str], float]:
+        """供給地→需要地の経路のコストだけを取り出す"""
+        selected = np.flatnonzero(self._mask(supply_nodes)[self.route_from] & self._mask(demand_nodes)[self.route_to])
+        return dict(zip(self.route_keys[selected].tolist(), self.distances[selected].tolist()))
+
+    def distances_between(self, from_keys: list[str], to_keys: list[str]) -> np.ndarray:
+        """(from_keys[i], to_keys[i]) の経路の距離を並べて返す。経路がない組は nan"""
+        return self.distances_by_index(np.array([self.point_index.get(key, -1) for key in from_keys], dtype=np.int64),
+                                       np.array([self.point_index.get(key, -1) for key in to_keys], dtype=np.int64))
+
+    def distances_by_index(self, from_index: np.ndarray, to_index: np.ndarray) -> np.ndarray:
+        """distances_between の地点番号版（地点でないものは -1）"""
+        if not len(self.distances):
+            return np.full(len(from_index), np.nan)
+        routes = self._find_routes(from_index, to_index)
+        return np.where(routes >= 0, self.distances[np.maximum(routes, 0)], np.nan)
+
+    def _find_routes(self, from_index: np.ndarray, to_index: np.ndarray) -> np.ndarray:
+        """(from_index[i], to_index[i]) の経路の位置を返す。経路がない組は -1"""
+        n = max(len(self.point_keys), 1)
+        if self._sorted_codes is None:
+            codes = self.route_from * n + self.route_to
+            self._sorted_order = np.argsort(codes, kind="stable")
+            self._sorted_codes = codes[self._sorted_order]
+        queries = from_index * n + to_index
+        if not len(self._sorted_codes) or not len(queries):
+            return np.full(len(queries), -1, dtype=np.int64)
+        position = np.minimum(np.searchsorted(self._sorted_codes, queries), len(self._sorted_codes) - 1)
+        found = (self._sorted_codes[position] == queries) & (from_index >= 0) & (to_index >= 0)
+        return np.where(found, self._sorted_order[position], -1)
+
+    def set_quantities(self, changes: list[tuple[str, str, int | None, int | None]]) -> None:
+        """(地点, カテゴリ, 変化前, 変化後) の数量を書き換える。None の側は変えない。知らないカテゴリは列を追加する"""
+        for point_key, category_key, from_amount, to_amount in changes:
+            i = self.point_index[point_key]
+            j = self.category_index.get(category_key)
+            if j is None:
+                j = self.category_index[category_key] = len(self.category_index)
+                column = np.zeros((len(self.point_keys), 1), dtype=np.int64)
+                self.from_amounts = np.hstack([self.from_amounts, column])
+                self.to_amounts = np.hstack([self.to_amounts, column])
+            if from_amount is not None:
+                self.from_amounts[i, j] = from_amount
+            if to_amount is not None:
+                self.to_amounts[i, j] = to_amount
+
+    def set_distances(self, distances: dict[tuple[str, str], float]) -> None:
+        """(始点, 終点) → 距離 で経路の距離を書き換える。ない経路は追加する"""
+        pairs = list(distances)
+        from_index = np.array([self.point_index[s] for s, _ in pairs], dtype=np.int64)
+        to_index = np.array([self.point_index[d] for _, d in pairs], dtype=np.int64)
+        values = np.array(list(distances.values()), dtype=np.float64)
+        routes = self._find_routes(from_index, to_index)
+        self.distances[routes[routes >= 0]] = values[routes >= 0]
+
+        new = routes < 0
+        if new.any():
+            new_keys = np.empty(int(new.sum()), dtype=object)
+            new_keys[:] = [pair for pair, is_new in zip(pairs, new) if is_new]
+            self.route_from = np.concatenate([self.route_from, from_index[new]])
+            self.route_to = np.concatenate([self.route_to, to_index[new]])
+            self.distances = np.concatenate([self.distances, values[new]])
+            self.route_keys = np.concatenate([self.route_keys, new_keys])
+            self._sorted_codes = None
+
+    def changed_points(self) -> np.ndarray:
+        """いずれかのカテゴリで数量が変化する地点の番号"""
+        return np.flatnonzero((self.from_amounts != self.to_amounts).any(axis=1))
+
+    def changed_categories(self, point_keys: list[str]) -> set[str]:
+        """指定した地点すべてで数量が変化するカテゴリ（その地点どうしの経路を使いうるカテゴリ）"""
+        rows = [self.point_index[key] for key in point_keys]
+        changed = (self.from_amounts[rows] != self.to_amounts[rows]).all(axis=0)
+        categories = list(self.category_index)
+        return {categories[j] for j in np.flatnonzero(changed)}
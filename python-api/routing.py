@@ -0,0 +1,155 @@
+"""
+経路グラフからの最短距離計算
+
+フロントから Path（辺）の一覧が送られてきた場合に、クライアントの Route を信用せず
+サーバー側で距離を計算するためのモジュール。グラフは整数インデックスの隣接配列
+（CSR 形式）に変換してからダイクストラ法を実行する。
+出発点が多いときは、出発点を分けてワーカープロセスで並列に探索する。
+"""
+import array
+import heapq
+import math
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# 並列に探索するワーカープロセスの数（1 なら常に同じプロセスで探索する）
+MAX_WORKERS = int(os.environ.get("ROUTING_MAX_WORKERS", os.cpu_count() or 1))
+# 出発点がこの数より少なければ、プロセスの起動・グラフの受け渡しの方が高くつくので並列にしない
+PARALLEL_MIN_SOURCES = int(os.environ.get("ROUTING_PARALLEL_MIN_SOURCES", 64))
+
+# (offsets, targets, costs): offsets[u]:offsets[u + 1] がノード u から出る辺の範囲
+Graph = tuple[array.array, array.array, array.array]
+
+
+def build_csr(node_count: int, edge_from: list[int], edge_to: list[int],
+              edge_costs: list[float]) -> tuple[array.array, array.array, array.array, array.array]:
+    """
+    番号つきの辺を CSR 形式にする。
+    戻り値の order[e] は CSR の e 番目の辺が元の何番目の辺か（辺に付随する情報を並べ替えるのに使う）
+    """
+    offsets = array.array("q", [0]) * (node_count + 1)
+    for u in edge_from:
+        offsets[u + 1] += 1
+    for i in range(node_count):
+        offsets[i + 1] += offsets[i]
+
+    targets = array.array("q", [0]) * len(edge_from)
+    costs = array.array("d", [0.0]) * len(edge_from)
+    order = array.array("q", [0]) * len(edge_from)
+    cursor = offsets[:-1]
+    for i, (u, v, c) in enumerate(zip(edge_from, edge_to, edge_costs)):
+        e = cursor[u]
+        cursor[u] += 1
+        targets[e] = v
+        costs[e] = c
+        order[e] = i
+    return offsets, targets, costs, order
+
+
+def build_graph(edges: list[tuple[str, str, float]]) -> tuple[dict[str, int], array.array, array.array, array.array]:
+    """(始点, 終点, コスト) の辺リストを CSR 形式 (ノード番号, offsets, targets, costs) に変換する"""
+    index: dict[str, int] = {}
+    for u, v, _ in edges:
+        index.setdefault(u, len(index))
+        index.setdefault(v, len(index))
+    offsets, targets, costs, _ = build_csr(len(index), [index[u] for u, _, _ in edges],
+                                           [index[v] for _, v, _ in edges], [float(c) for _, _, c in edges])
+    return index, offsets, targets, costs
+
+
+def dijkstra(offsets: array.array, targets: array.array, costs: array.array,
+             source: int) -> tuple[array.array, array.array]:
+    """source からの (距離, 最短路木で各ノードに入る辺の番号) 。到達できないノードは inf と -1"""
+    n = len(offsets) - 1
+    dist = array.array("d", [math.inf]) * n
+    pred_edge = array.array("q", [-1]) * n
+    dist[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        for e in range(offsets[u], offsets[u + 1]):
+            v = targets[e]
+            nd = d + costs[e]
+            if nd < dist[v]:
+                dist[v] = nd
+                pred_edge[v] = e
+                heapq.heappush(heap, (nd, v))
+    return dist, pred_edge
+
+
+def _search_chunk(graph: Graph, sources: list[int],
+                  targets: list[int] | None) -> list[tuple[int, array.array, array.array | None]]:
+    """
+    ワーカーで出発点の一部を探索する。
+    targets を指定すると、受け渡しを減らすため距離はその順に並べたものだけを返し、辺の番号は返さない
+    """
+    results = []
+    for s in sources:
+        dist, pred_edge = dijkstra(*graph, s)
+        if targets is None:
+            results.append((s, dist, pred_edge))
+        else:
+            results.append((s, array.array("d", [dist[t] for t in targets]), None))
+    return results
+
+
+_executor: ProcessPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    # グラフは呼び出しごとに渡すので、プロセスはグラフが変わっても使い回せる
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=MAX_WORKERS)
+        return _executor
+
+
+def search_many(graph: Graph, sources: list[int], targets: list[int] | None = None,
+                max_workers: int | None = None) -> list[tuple[int, array.array, array.array | None]]:
+    """各出発点からダイクストラ法を実行し、出発点の順に (出発点, 距離, 辺の番号) を返す（targets は _search_chunk と同じ）"""
+    workers = min(MAX_WORKERS if max_workers is None else max_workers, len(sources))
+    if workers <= 1 or len(sources) < PARALLEL_MIN_SOURCES:
+        return _search_chunk(graph, sources, targets)
+
+    # ワーカーあたり数個に分け、探索の重さの偏りをならす
+    chunk_size = -(-len(sources) // (workers * 4))
+    chunks = [sources[i:i + chunk_size] for i in range(0, len(sources), chunk_size)]
+    futures = [_get_executor().submit(_search_chunk, graph, chunk, targets) for chunk in chunks]
+    return [result for future in futures for result in future.result()]
+
+
+def distance_rows(edges: list[tuple[str, str, float]], sources: list[str], targets: list[str],
+                  max_workers: int | None = None) -> list[array.array]:
+    """sources[i] から targets[j] への最短距離を i 行目の j 番目に並べる。到達できない組とグラフにない点は inf"""
+    index, offsets, graph_targets, costs = build_graph(edges)
+    source_indices = [index[s] for s in sources if s in index]
+    target_indices = [index.get(t, -1) for t in targets]
+    searched = iter(search_many((offsets, graph_targets, costs), source_indices,
+                                [max(t, 0) for t in target_indices], max_workers))
+    missing = [j for j, t in enumerate(target_indices) if t < 0]
+    rows = []
+    for s in sources:
+        if s not in index:
+            rows.append(array.array("d", [math.inf]) * len(targets))
+            continue
+        dist = next(searched)[1]
+        for j in missing:
+            dist[j] = math.inf
+        rows.append(dist)
+    return rows
+
+
+def shortest_distances(edges: list[tuple[str, str, float]], sources: list[str], targets: list[str],
+                       max_workers: int | None = None) -> dict[tuple[str, str], float]:
+    """sources の各点から targets の各点への最短距離。到達できない組は含めない"""
+    result: dict[tuple[str, str], float] = {}
+    for s, dist in zip(sources, distance_rows(edges, sources, targets, max_workers)):
+        for t, d in zip(targets, dist):
+            if t != s and not math.isinf(d):
+                result[(s, t)] = d
+    return result
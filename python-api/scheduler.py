@@ -0,0 +1,252 @@
+"""
+求解の共有スケジューラー
+
+全リクエスト・全ジョブのカテゴリごとの求解を、固定数のワーカープロセス (solver.MAX_WORKERS) で順番に解く。
+同時に何人が「解く」を押しても CBC がCPU数を超えて起動しないようにするためのもの。
+
+- 待ち行列は優先度つき（対話的なエンドポイントの方をジョブより先に解く）
+- リクエストごとの期限（timeLimitSeconds から決める）を過ぎて順番が来た問題は解かずに失敗させ、
+  期限までに残り時間が少なければその分だけ時間制限を縮めて解く
+- 待ち行列がいっぱいのときは、しばらく空きを待ってから QueueFullError で断る
+- 内容が同じ問題（cache.problem_key と初期解が同じ）が待ち行列にあるか解いている最中なら、
+  新しく解かずにその結果を分け合う（カテゴリが違えば、結果の objectKey をそのカテゴリに付け替える）
+- ワーカープロセスが異常終了してプールが壊れたら、そのとき解いていた問題を失敗させ、プールを作り直す
+"""
+import copy
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable
+
+import cache
+import metrics
+import solver
+
+# 待ち行列に置ける問題の数の上限（解いている最中のものは含めない）
+MAX_QUEUE = int(os.environ.get("SOLVER_MAX_QUEUE", 64))
+# 待ち行列がいっぱいのとき、空きを待つ秒数（0 ならすぐに断る）
+QUEUE_WAIT_SECONDS = float(os.environ.get("SOLVER_QUEUE_WAIT", 2.0))
+# 期限までの残りがこれより短ければ、解かずに期限切れにする（秒）
+MIN_TIME_LIMIT = 1
+
+# 優先度（小さいほど先に解く）
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class DeadlineExceededError(Exception):
+    pass
+
+
+def deadline_after(seconds: float) -> float:
+    """今から seconds 秒後の期限 (time.monotonic 基準)"""
+    return time.monotonic() + seconds
+
+
+def coalesce_key(func: Callable[..., dict], problem: dict) -> str | None:
+    """
+    同じ結果になる問題をまとめるためのキー。カテゴリ1つ分の問題でなければまとめない。
+    log_path（呼び出し元ごとのログの書き出し先）を指定した問題もまとめない
+    """
+    if "supply_nodes" not in problem or problem.get("log_path"):
+        return None
+    # 初期解が違うと、同じ費用の別の解や時間切れ時の暫定解が変わりうる
+    initial_flows = problem.get("initial_flows")
+    flows = hashlib.sha256(json.dumps(sorted([s, d, a] for (s, d), a in initial_flows.items()),
+                                      separators=(",", ":"), ensure_ascii=False).encode()).hexdigest() if initial_flows else None
+    return f"{func.__module__}.{func.__qualname__}:{problem.get('warm_start', True)}:{flows}:{cache.problem_key(problem)}"
+
+
+class _Entry:
+    def __init__(self, key: str | None, func: Callable[..., dict], problem: dict, priority: int,
+                 deadline: float | None):
+        self.key = key
+        self.func = func
+        self.problem = problem
+        self.priority = priority
+        self.deadline = deadline
+        self.state = "queued"
+        # 結果を待つ Future と、その呼び出し元の問題のカテゴリ（まとめた問題ではカテゴリが違いうる）
+        self.waiters: list[tuple[Future, str | None]] = []
+        # 解いているプール（壊れたときに、どのプールを作り直すか判断する）
+        self.executor: ProcessPoolExecutor | None = None
+
+
+class SolverScheduler:
+    def __init__(self, workers: int = solver.MAX_WORKERS, max_queue: int = MAX_QUEUE,
+                 queue_wait: float = QUEUE_WAIT_SECONDS):
+        self.workers = max(workers, 1)
+        self.max_queue = max_queue
+        self.queue_wait = queue_wait
+        self._executor: ProcessPoolExecutor | None = None
+        self._condition = threading.Condition()
+        self._heap: list[tuple[int, int, _Entry]] = []
+        self._sequence = itertools.count()
+        # 待ち行列にあるか解いている最中の問題（キー → エントリ）
+        self._in_flight: dict[str, _Entry] = {}
+        self._queued = 0
+        self._running = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _discard_executor(self, executor: ProcessPoolExecutor) -> None:
+        """壊れたプールを捨てる。次に解く問題からは新しいプールを使う（_condition を持った状態で呼ぶ）"""
+        if self._executor is executor:
+            self._executor = None
+            metrics.SOLVER_POOL_RESTARTS.inc()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, func: Callable[..., dict], problem: dict, priority: int = PRIORITY_INTERACTIVE,
+               deadline: float | None = None) -> Future:
+        """1問題（func のキーワード引数）を待ち行列に入れる。結果には solveTime（秒）が付く"""
+        return self.submit_many(func, [problem], priority, deadline)[0]
+
+    def submit_many(self, func: Callable[..., dict], problems: list[dict], priority: int = PRIORITY_INTERACTIVE,
+                    deadline: float | None = None) -> list[Future]:
+        """
+        複数の問題をまとめて待ち行列に入れる。1つでも入りきらなければ、どれも入れずに QueueFullError を送出する。
+        """
+        keys = [coalesce_key(func, problem) for problem in problems]
+        with self._condition:
+            def new_entries() -> int:
+                unique = {key for key in keys if key is not None and key not in self._in_flight}
+                return len(unique) + keys.count(None)
+
+            if not self._condition.wait_for(lambda: self._queued + new_entries() <= self.max_queue,
+                                            timeout=self.queue_wait):
+                metrics.SOLVER_REJECTED.inc()
+                raise QueueFullError(f"求解の待ち行列がいっぱいです（{self._queued} 件待ち）")
+
+            futures = []
+            for key, problem in zip(keys, problems):
+                future = Future()
+                entry = self._in_flight.get(key) if key is not None else None
+                if entry is None:
+                    entry = _Entry(key, func, problem, priority, deadline)
+                    self._push(entry)
+                    if key is not None:
+                        self._in_flight[key] = entry
+                else:
+                    metrics.SOLVER_COALESCED.inc()
+                    if entry.state == "queued":
+                        self._merge(entry, problem, priority, deadline)
+                entry.waiters.append((future, problem.get("category_key")))
+                futures.append(future)
+            self._dispatch()
+        return futures
+
+    def _push(self, entry: _Entry) -> None:
+        heapq.heappush(self._heap, (entry.priority, next(self._sequence), entry))
+        self._queued += 1
+
+    def _merge(self, entry: _Entry, problem: dict, priority: int, deadline: float | None) -> None:
+        """まだ解き始めていない問題に同じ問題が加わったら、条件の良い方（長い時間制限・遅い期限・高い優先度）に合わせる"""
+        if "time_limit" in problem:
+            entry.problem = {**entry.problem, "time_limit": max(entry.problem.get("time_limit", 0), problem["time_limit"])}
+        entry.deadline = None if entry.deadline is None or deadline is None else max(entry.deadline, deadline)
+        if priority < entry.priority:
+            # 古い位置の要素は取り出したときに読み飛ばす
+            entry.priority = priority
+            heapq.heappush(self._heap, (priority, next(self._sequence), entry))
+
+    def _dispatch(self) -> None:
+        """空いているワーカーに、優先度の高い順に問題を渡す（_condition を持った状態で呼ぶ）"""
+        while self._running < self.workers and self._heap:
+            _, _, entry = heapq.heappop(self._heap)
+            if entry.state != "queued":
+                continue
+            self._queued -= 1
+            self._condition.notify_all()
+
+            problem = entry.problem
+            if entry.deadline is not None:
+                remaining = entry.deadline - time.monotonic()
+                if remaining < MIN_TIME_LIMIT:
+                    metrics.SOLVER_EXPIRED.inc()
+                    self._finish(entry, exception=DeadlineExceededError("期限までに求解を始められませんでした"))
+                    continue
+                if "time_limit" in problem:
+                    problem = {**problem, "time_limit": max(MIN_TIME_LIMIT, min(problem["time_limit"], int(remaining)))}
+
+            entry.state = "running"
+            self._running += 1
+            entry.executor = self._get_executor()
+            try:
+                inner = entry.executor.submit(solver._timed_call, entry.func, problem)
+            except BrokenProcessPool:
+                # 前に解いた問題でプールが壊れていれば、作り直して渡し直す
+                self._discard_executor(entry.executor)
+                entry.executor = self._get_executor()
+                inner = entry.executor.submit(solver._timed_call, entry.func, problem)
+            inner.add_done_callback(lambda inner, entry=entry: self._on_done(entry, inner))
+
+    def _on_done(self, entry: _Entry, inner: Future) -> None:
+        with self._condition:
+            self._running -= 1
+            exception = inner.exception()
+            if isinstance(exception, BrokenProcessPool):
+                # ワーカーが異常終了した。この問題は失敗させ、以降の問題は新しいプールで解く
+                self._discard_executor(entry.executor)
+            self._finish(entry, result=None if exception is not None else inner.result(), exception=exception)
+            self._dispatch()
+
+    def _finish(self, entry: _Entry, result: dict | list | None = None, exception: BaseException | None = None) -> None:
+        entry.state = "done"
+        if entry.key is not None and self._in_flight.get(entry.key) is entry:
+            del self._in_flight[entry.key]
+        for i, (waiter, category_key) in enumerate(entry.waiters):
+            if exception is not None:
+                waiter.set_exception(exception)
+            elif i == 0:
+                waiter.set_result(result)
+            else:
+                # まとめた側の結果は呼び出し元ごとに別のオブジェクトにし、計測値は最初の1件にだけ残す
+                shared = copy.deepcopy({k: v for k, v in result.items() if k != "profile"})
+                shared["coalesced"] = True
+                if category_key is not None and category_key != shared.get("objectKey", category_key):
+                    cache.relabel(shared, category_key)
+                waiter.set_result(shared)
+
+    def stats(self) -> dict[str, int]:
+        with self._condition:
+            return {"workers": self.workers, "running": self._running, "queued": self._queued}
+
+
+_scheduler: SolverScheduler | None = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> SolverScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = SolverScheduler()
+        return _scheduler
+
+
+def submit(func: Callable[..., dict], problem: dict, priority: int = PRIORITY_INTERACTIVE,
+           deadline: float | None = None) -> Future:
+    return get_scheduler().submit(func, problem, priority, deadline)
+
+
+def run_parallel(func: Callable[..., dict], problems: list[dict], priority: int = PRIORITY_INTERACTIVE,
+                 deadline: float | None = None) -> list[dict]:
+    """
+    カテゴリごとの問題を共有のワーカーで解き、元の順番で結果を返す。
+    各結果にはワーカー内での所要時間 solveTime（秒）が付く。
+    """
+    futures = get_scheduler().submit_many(func, problems, priority, deadline)
+    return [future.result() for future in futures]
@@ -0,0 +1,161 @@
+"""
+サーバー側の問題セッション
+
+大きな会場では、解くたびに ProblemDataModel 全体（全地点・全経路）を送って検証し直すだけで時間がかかる。
+セッションは最初に一度だけ問題を受け取って preprocess.ProblemArrays に変換して保持し、
+以降は変更分（数量・経路の距離・タスクペナルティなど）だけを受け取って配列を書き換える。
+変更の影響を受けたカテゴリだけを「未求解」にし、解き直すときはそのカテゴリだけを解く。
+
+数量と距離は arrays の値が正しい（data の points の objects と routes は作成時のまま）。
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import preprocess
+import routing
+
+# 保持するセッションの上限（超えたら最も使われていないものから捨てる）
+MAX_SESSIONS = 20
+
+
+class Session:
+    def __init__(self, data, arrays: preprocess.ProblemArrays):
+        self.id = uuid.uuid4().hex
+        self.data = data
+        self.arrays = arrays
+        self.createdAt = time.time()
+        self.updatedAt = self.createdAt
+        # 変更を受け付けるたびに増える番号
+        self.version = 0
+        # カテゴリごとの最後の結果と、その後に変更されたかを判定するための番号
+        self.results: dict[str, dict] = {}
+        self.revisions: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def to_dict(self) -> dict:
+        return {
+            "sessionId": self.id,
+            "version": self.version,
+            "createdAt": self.createdAt,
+            "updatedAt": self.updatedAt,
+            "targetObjectCategoryKeys": list(self.data.targetObjectCategoryKeys),
+            "pendingCategories": self.pending_categories(),
+        }
+
+    def _touch(self, category_keys) -> None:
+        for key in category_keys:
+            self.revisions[key] = self.revisions.get(key, 0) + 1
+
+    def pending_categories(self) -> list[str]:
+        """解き直しが必要な（結果がないか、結果の後に変更された）対象カテゴリ"""
+        return [key for key in self.data.targetObjectCategoryKeys
+                if key not in self.results or self.results[key]["revision"] != self.revisions.get(key, 0)]
+
+    def apply_patch(self, patch) -> list[str]:
+        """
+        変更を適用し、影響を受けたカテゴリを返す。
+        知らない地点を指定した場合などは、何も変えずに ValueError を送出する。
+        """
+        arrays = self.arrays
+        for change in patch.quantities:
+            if change.pointKey not in arrays.point_index:
+                raise ValueError(f"地点 '{change.pointKey}' はありません")
+        distances = {}
+        if patch.routes:
+            if self.data.paths:
+                raise ValueError("辺 (paths) から距離を計算するセッションでは、経路の距離は変更できません")
+            for route in patch.routes:
+                for key in (route.from_node, route.to_node):
+                    if key not in arrays.point_index:
+                        raise ValueError(f"地点 '{key}' はありません")
+                distances[(route.from_node, route.to_node)] = route.distance
+
+        affected: set[str] = set()
+        if patch.quantities:
+            before = set(arrays.changed_points().tolist())
+            arrays.set_quantities([(change.pointKey, change.objectKey, change.fromAmount, change.toAmount)
+                                   for change in patch.quantities])
+            affected.update(change.objectKey for change in patch.quantities)
+            if self.data.paths:
+                self._add_path_distances(before)
+        if distances:
+            # 両端の数量が変化するカテゴリだけが、その経路を使いうる
+            for s, d in distances:
+                affected |= arrays.changed_categories([s, d])
+            arrays.set_distances(distances)
+
+        update = {}
+        if patch.taskPenalty is not None and patch.taskPenalty != self.data.taskPenalty:
+            update["taskPenalty"] = patch.taskPenalty
+            affected.update(arrays.category_index)
+        if patch.timeLimitSeconds is not None:
+            update["timeLimitSeconds"] = patch.timeLimitSeconds
+        if patch.targetObjectCategoryKeys is not None:
+            update["targetObjectCategoryKeys"] = patch.targetObjectCategoryKeys
+        if update:
+            self.data = self.data.model_copy(update=update)
+
+        self._touch(affected)
+        self.version += 1
+        self.updatedAt = time.time()
+        return sorted(affected)
+
+    def _add_path_distances(self, before: set[int]) -> None:
+        """新しく数量が変化するようになった地点と、変化する地点との最短距離を求めて追加する"""
+        arrays = self.arrays
+        changed = arrays.changed_points().tolist()
+        added = [arrays.point_keys[i] for i in changed if i not in before]
+        if not added:
+            return
+        edges = []
+        for path in self.data.paths:
+            if path.isProhibited:
+                continue
+            edges.append((path.from_node, path.to_node, path.cost))
+            edges.append((path.to_node, path.from_node, path.cost if path.oppositeCost is None else path.oppositeCost))
+        changed_keys = [arrays.point_keys[i] for i in changed]
+        distances = routing.shortest_distances(edges, added, changed_keys)
+        distances.update(routing.shortest_distances(edges, changed_keys, added))
+        if distances:
+            arrays.set_distances(distances)
+
+    def store_results(self, results: list[dict], revisions: dict[str, int]) -> None:
+        """解き始めたときから変更されていないカテゴリの結果だけを保存する"""
+        for result in results:
+            key = result["objectKey"]
+            if revisions.get(key, 0) == self.revisions.get(key, 0):
+                # debug はその回のリクエストの計測値なので残さない
+                self.results[key] = {"revision": revisions.get(key, 0),
+                                     "result": {k: v for k, v in result.items() if k != "debug"}}
+
+    def result_for(self, category_key: str) -> dict | None:
+        entry = self.results.get(category_key)
+        return entry["result"] if entry is not None else None
+
+
+class SessionStore:
+    def __init__(self, max_sessions: int = MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, data, arrays: preprocess.ProblemArrays) -> Session:
+        session = Session(data, arrays)
+        with self._lock:
+            self._sessions[session.id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def get(self, session_id: str) -> Session | None:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
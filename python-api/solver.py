@@ -0,0 +1,534 @@
+"""
+物品カテゴリ1つ分の輸送問題を解くモジュール
+
+engine="flow" はプロセス内の最小費用流 + タスク集約ヒューリスティック、
+engine="cbc" は従来どおり PuLP/CBC による混合整数計画で解く。
+"""
+import math
+import os
+import re
+import time
+from typing import Callable
+
+import pulp
+
+import flow
+
+ENGINES = ("flow", "cbc")
+
+# カテゴリを並列に解くワーカープロセス数（scheduler が使う）
+MAX_WORKERS = int(os.environ.get("SOLVER_MAX_WORKERS", os.cpu_count() or 1))
+
+# CBCのログから暫定解・下界を読み取るパターン
+_INCUMBENT_PATTERNS = [
+    re.compile(r"Integer solution of (\S+) found"),
+]
+_BOUND_PATTERNS = [
+    re.compile(r"Continuous objective value is (\S+)"),
+]
+_BOTH_PATTERNS = [
+    re.compile(r"(\S+) best solution, best possible (\S+)"),
+    re.compile(r"best objective (\S+) \(best possible (\S+)\)"),
+]
+
+
+def _to_float(text: str) -> float | None:
+    try:
+        return float(text.rstrip(","))
+    except ValueError:
+        return None
+
+
+def parse_cbc_log(text: str) -> dict:
+    """CBCのログから最新の暫定解（incumbent）と下界（bound）、ギャップを取り出す"""
+    incumbent = None
+    bound = None
+    for line in text.splitlines():
+        for pattern in _INCUMBENT_PATTERNS:
+            m = pattern.search(line)
+            if m and _to_float(m.group(1)) is not None:
+                incumbent = _to_float(m.group(1))
+        for pattern in _BOUND_PATTERNS:
+            m = pattern.search(line)
+            if m and _to_float(m.group(1)) is not None:
+                bound = _to_float(m.group(1))
+        for pattern in _BOTH_PATTERNS:
+            m = pattern.search(line)
+            if m and _to_float(m.group(1)) is not None and _to_float(m.group(2)) is not None:
+                incumbent = _to_float(m.group(1))
+                bound = _to_float(m.group(2))
+
+    gap = None
+    if incumbent is not None and bound is not None:
+        gap = max(0.0, (incumbent - bound) / max(abs(incumbent), 1e-9))
+    return {"incumbent": incumbent, "bound": bound, "gap": gap}
+
+
+def candidate_arcs(supply_nodes: dict[str, int], demand_nodes: dict[str, int],
+                   costs: dict[tuple[str, str], float], limit: int | None = None,
+                   required: dict[tuple[str, str], int] | None = None) -> list[tuple[str, str]]:
+    """
+    変数を作る (供給地, 需要地) の組を選ぶ。
+    経路が存在する組だけを使い、limit があれば供給地ごとに距離の近い limit 件の需要地に絞る。
+    絞った組で実行不能なら limit を倍にして広げ、全経路でも実行不能なら従来どおり
+    全組み合わせ（存在しない経路は大きなコスト）に戻す。required の組は必ず含める。
+    """
+    existing = [r for r in costs if r[0] in supply_nodes and r[1] in demand_nodes]
+
+    def feasible(arcs) -> bool:
+        return flow.network_simplex(supply_nodes, demand_nodes, {r: costs[r] for r in arcs}) is not None
+
+    if limit is not None and limit < len(demand_nodes):
+        by_supply: dict[str, list[tuple[float, str]]] = {s: [] for s in supply_nodes}
+        for s, d in existing:
+            by_supply[s].append((costs[(s, d)], d))
+        for candidates in by_supply.values():
+            candidates.sort()
+
+        k = max(limit, 1)
+        while k < len(demand_nodes):
+            chosen = set(required or ())
+            for s, candidates in by_supply.items():
+                chosen.update((s, d) for _, d in candidates[:k])
+            # 変数の順番が毎回同じになるよう costs の順で並べる
+            arcs = [r for r in existing if r in chosen]
+            if feasible(arcs):
+                return arcs
+            k *= 2
+
+    if required is not None or feasible(existing):
+        return existing
+    return [(s, d) for s in supply_nodes for d in demand_nodes]
+
+
+def build_cbc_model(supply_nodes: dict[str, int], demand_nodes: dict[str, int],
+                    costs: dict[tuple[str, str], float], task_penalty: int,
+                    route_keys: list[tuple[str, str]] | None = None):
+    """
+    CBCに渡す混合整数計画モデルを組み立てる。
+    route_keys を省略すると candidate_arcs で経路の存在する組だけに変数を作る。
+    """
+    # 2. PuLP問題の定義 (ロジックは前回とほぼ同じ)
+    prob = pulp.LpProblem("Dynamic_Transportation_Problem", pulp.LpMinimize)
+
+    # 変数定義
+    if route_keys is None:
+        route_keys = candidate_arcs(supply_nodes, demand_nodes, costs)
+    route_vars = pulp.LpVariable.dicts("Route", route_keys, lowBound=0, cat='Integer')
+    task_vars = pulp.LpVariable.dicts("TaskActive", route_keys, cat='Binary')
+
+    # 目的関数
+    prob += (
+        pulp.lpSum([route_vars[r] * costs.get(r, 1e9) for r in route_keys]) + # 存在しない経路は大きなコスト
+        pulp.lpSum([task_vars[r] * task_penalty for r in route_keys]),
+        "Total_Cost"
+    )
+
+    # 制約条件
+    out_routes: dict[str, list] = {s_key: [] for s_key in supply_nodes}
+    in_routes: dict[str, list] = {d_key: [] for d_key in demand_nodes}
+    for r in route_keys:
+        out_routes[r[0]].append(route_vars[r])
+        in_routes[r[1]].append(route_vars[r])
+
+    for s_key, s_amount in supply_nodes.items():
+        prob += pulp.lpSum(out_routes[s_key]) <= s_amount
+
+    for d_key, d_amount in demand_nodes.items():
+        prob += pulp.lpSum(in_routes[d_key]) == d_amount
+
+    M = sum(supply_nodes.values())
+    for r in route_keys:
+        prob += route_vars[r] <= M * task_vars[r]
+
+    return prob, route_keys, route_vars, task_vars
+
+
+def model_size(prob: pulp.LpProblem) -> dict:
+    return {"variables": prob.numVariables(), "constraints": prob.numConstraints()}
+
+
+def solve_category_plain(category_key: str, supply_nodes: dict[str, int], demand_nodes: dict[str, int],
+                         costs: dict[tuple[str, str], float], task_penalty: int) -> dict:
+    """時間制限なしでCBCを実行する (/solve-dynamic-problem 用)"""
+    stages = {}
+    stage_start = time.perf_counter()
+    prob, route_keys, route_vars, _ = build_cbc_model(supply_nodes, demand_nodes, costs, task_penalty)
+    stages["modelBuild"] = time.perf_counter() - stage_start
+
+    # 3. 問題を解いて結果を返す (前回と同様のロジック)
+    stage_start = time.perf_counter()
+    prob.solve()
+    stages["cbcRun"] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    status = pulp.LpStatus[prob.status]
+    category_routes = []
+
+    if status == "Optimal":
+        for r in route_keys:
+            amount = pulp.value(route_vars[r])
+            if amount > 0:
+                category_routes.append({
+                    "supplyNode": r[0],
+                    "demandNode": r[1],
+                    "amount": amount,
+                    "objectKey": category_key # ★ objectKeyも付与
+                })
+
+    total_cost = pulp.value(prob.objective) if status == "Optimal" else None
+    stages["extractValues"] = time.perf_counter() - stage_start
+
+    # ★ このカテゴリの結果オブジェクトを作成
+    return {
+        "objectKey": category_key,
+        "status": status,
+        "totalCost": total_cost,
+        "taskCount": len(category_routes), # ★ タスク数を計算
+        "routes": category_routes,
+        "profile": {"stages": stages, "model": model_size(prob), "gap": 0.0 if status == "Optimal" else None},
+    }
+
+
+def find_start_solution(supply_nodes: dict[str, int], demand_nodes: dict[str, int],
+                        costs: dict[tuple[str, str], float], task_penalty: int,
+                        initial_flows: dict[tuple[str, str], float] | None = None) -> dict[tuple[str, str], int] | None:
+    """
+    CBCの初期解（MIP start）を用意する。
+    前回の解があれば新しい供給量・需要量に合わせて修正し、なければ最小費用流で作る。
+    どちらも作れなければ None。
+    """
+    start = None
+    if initial_flows:
+        start = flow.repair_solution(initial_flows, supply_nodes, demand_nodes, costs)
+    if start is None:
+        start = flow.network_simplex(supply_nodes, demand_nodes, costs)
+    if start is None:
+        return None
+    return flow.merge_tasks(start, supply_nodes, costs, task_penalty)
+
+
+def solve_category_cbc(category_key: str, supply_nodes: dict[str, int], demand_nodes: dict[str, int],
+                       costs: dict[tuple[str, str], float], task_penalty: int, time_limit: int,
+                       log_path: str | None = None, warm_start: bool = True,
+                       initial_flows: dict[tuple[str, str], float] | None = None,
+                       candidate_limit: int | None = None) -> dict:
+    # 段階ごとの所要時間（秒）。結果の profile に入れて返す
+    stages = {}
+
+    # ★ 良い暫定解から探索を始められるよう、初期解を用意しておく
+    start = None
+    start_cost = None
+    if warm_start:
+        stage_start = time.perf_counter()
+        start = find_start_solution(supply_nodes, demand_nodes, costs, task_penalty, initial_flows)
+        warm_start = start is not None
+        stages["warmStart"] = time.perf_counter() - stage_start
+
+    # 変数は候補の組だけに作る（初期解で使う組は必ず含める）
+    stage_start = time.perf_counter()
+    route_keys = candidate_arcs(supply_nodes, demand_nodes, costs, candidate_limit, start)
+    prob, route_keys, route_vars, task_vars = build_cbc_model(supply_nodes, demand_nodes, costs, task_penalty, route_keys)
+
+    if start is not None:
+        start_cost = flow.total_cost(start, costs, task_penalty)
+        for r in route_keys:
+            amount = start.get(r, 0)
+            route_vars[r].setInitialValue(amount)
+            task_vars[r].setInitialValue(1 if amount > 0 else 0)
+    stages["modelBuild"] = time.perf_counter() - stage_start
+
+    # ★ 1. solveメソッドに時間制限を追加
+    # ここでは55秒に設定（Renderのタイムアウトが約1分のため）
+    # log_path を指定するとCBCのログを標準出力の代わりにファイルへ書き出す（ジョブの進捗表示用）
+    solver = pulp.PULP_CBC_CMD(timeLimit=time_limit, msg=0 if log_path else 1, logPath=log_path, warmStart=warm_start)
+    # ★ 2. solve()の前後で時間を記録
+    start_time = time.time()
+    prob.solve(solver)
+    end_time = time.time()
+
+    solve_time = end_time - start_time
+    stages["cbcRun"] = solve_time
+    print(f"--- Solve time for {category_key}: {solve_time:.2f} seconds ---")
+
+    stage_start = time.perf_counter()
+    status = pulp.LpStatus[prob.status]
+    objective_value = pulp.value(prob.objective)
+
+    # ★★★ 3. 独自のステータス判定ロジック ★★★
+    custom_status = "Infeasible" # デフォルト
+
+    if objective_value is not None:
+        # 解が見つかった場合
+        if status == "Optimal" and solve_time < time_limit * 0.98:
+            # ステータスがOptimal かつ 時間制限に明らかに達していない場合のみ最適と判断
+            custom_status = "Optimal"
+        else:
+            # それ以外はすべて暫定解 (Feasible) とする
+            custom_status = "Feasible"
+
+    category_routes = []
+
+    # --- 結果のルート抽出 ---
+    # 解が見つかっている場合（OptimalまたはFeasible）のみ実行
+    if custom_status in ["Optimal", "Feasible"]:
+        for r in route_keys:
+            amount = pulp.value(route_vars[r])
+            if amount is not None and amount > 0:
+                category_routes.append({
+                    "supplyNode": r[0], "demandNode": r[1],
+                    "amount": amount, "objectKey": category_key
+                })
+    stages["extractValues"] = time.perf_counter() - stage_start
+
+    # ギャップは最適なら 0、それ以外はログが残っていればそこから読む
+    gap = None
+    if custom_status == "Optimal":
+        gap = 0.0
+    elif log_path and os.path.exists(log_path):
+        with open(log_path, encoding="utf-8", errors="replace") as f:
+            gap = parse_cbc_log(f.read())["gap"]
+
+    return {
+        "objectKey": category_key,
+        "status": custom_status,
+        "totalCost": objective_value,
+        "taskCount": len(category_routes),
+        "routes": category_routes,
+        "engine": "cbc",
+        "warmStartCost": start_cost,
+        "profile": {"stages": stages, "model": model_size(prob), "gap": gap},
+    }
+
+
+def solve_category_flow(category_key: str, supply_nodes: dict[str, int], demand_nodes: dict[str, int],
+                        costs: dict[tuple[str, str], float], task_penalty: int) -> dict:
+    stages = {}
+    start_time = time.time()
+    flows = flow.network_simplex(supply_nodes, demand_nodes, costs)
+    stages["networkSimplex"] = time.time() - start_time
+    if flows is None:
+        print(f"--- Min-cost flow infeasible for {category_key} ---")
+        return {
+            "objectKey": category_key,
+            "status": "Infeasible",
+            "totalCost": None,
+            "taskCount": 0,
+            "routes": [],
+            "engine": "flow",
+            "profile": {"stages": stages, "model": None, "gap": None},
+        }
+
+    # 最小費用流はペナルティなしなら厳密解。ペナルティがある場合は局所探索でタスクをまとめ、
+    # 下界（flow.lower_bound）に届いていれば最適解、届かなければ最適性を保証できないので暫定解とする
+    stage_start = time.time()
+    bound = flow.lower_bound(flows, demand_nodes, costs, task_penalty)
+    flows = flow.merge_tasks(flows, supply_nodes, costs, task_penalty)
+    total_cost = flow.total_cost(flows, costs, task_penalty)
+    optimal = total_cost <= bound + flow.EPS * max(1.0, abs(bound))
+    stages["mergeTasks"] = time.time() - stage_start
+    solve_time = time.time() - start_time
+    print(f"--- Solve time for {category_key} (flow): {solve_time:.3f} seconds ---")
+
+    category_routes = [
+        {"supplyNode": s, "demandNode": d, "amount": amount, "objectKey": category_key}
+        for (s, d), amount in flows.items()
+    ]
+    return {
+        "objectKey": category_key,
+        "status": "Optimal" if optimal else "Feasible",
+        "totalCost": total_cost,
+        "taskCount": len(category_routes),
+        "routes": category_routes,
+        "engine": "flow",
+        "profile": {"stages": stages, "model": None, "gap": 0.0 if optimal else None},
+    }
+
+
+def solve_category(category_key: str, supply_nodes: dict[str, int], demand_nodes: dict[str, int],
+                   costs: dict[tuple[str, str], float], task_penalty: int, time_limit: int,
+                   engine: str = "flow", log_path: str | None = None, warm_start: bool = True,
+                   initial_flows: dict[tuple[str, str], float] | None = None,
+                   candidate_limit: int | None = None) -> dict:
+    """指定されたエンジンで1カテゴリを解く。flowで解けない場合はCBCにフォールバックする"""
+    flow_stages = {}
+    if engine == "flow":
+        result = solve_category_flow(category_key, supply_nodes, demand_nodes, costs, task_penalty)
+        if result["status"] != "Infeasible":
+            return result
+        # 経路が足りない等で解けない場合は、存在しない経路を大きなコストで扱うCBCに任せる
+        flow_stages = result["profile"]["stages"]
+    result = solve_category_cbc(category_key, supply_nodes, demand_nodes, costs, task_penalty, time_limit,
+                                log_path, warm_start, initial_flows, candidate_limit)
+    result["profile"]["stages"] = {**flow_stages, **result["profile"]["stages"]}
+    return result
+
+
+def build_joint_model(problems: list[dict], route_keys: list[list[tuple[str, str]]]):
+    """
+    全カテゴリをまとめた混合整数計画モデルを組み立てる。
+    TaskActive は (供給地, 需要地) の組ごとに1つで全カテゴリが共有し、
+    big-M も組ごとの上限 Σ_k min(供給量, 需要量) に絞って制約を1本にまとめる。
+    """
+    prob = pulp.LpProblem("Joint_Transportation_Problem", pulp.LpMinimize)
+    task_penalty = problems[0]["task_penalty"] if problems else 0
+
+    route_vars = []
+    pair_vars: dict[tuple[str, str], list] = {}
+    pair_bounds: dict[tuple[str, str], int] = {}
+    for k, (problem, keys) in enumerate(zip(problems, route_keys)):
+        supply_nodes, demand_nodes = problem["supply_nodes"], problem["demand_nodes"]
+        variables = pulp.LpVariable.dicts(f"Route_{k}", keys, lowBound=0, cat='Integer')
+        route_vars.append(variables)
+        for r in keys:
+            pair_vars.setdefault(r, []).append(variables[r])
+            pair_bounds[r] = pair_bounds.get(r, 0) + min(supply_nodes[r[0]], demand_nodes[r[1]])
+    task_vars = pulp.LpVariable.dicts("TaskActive", list(pair_vars), cat='Binary')
+
+    prob += (
+        pulp.lpSum([variables[r] * problem["costs"].get(r, 1e9)
+                    for problem, keys, variables in zip(problems, route_keys, route_vars) for r in keys]) +
+        pulp.lpSum([task_vars[r] * task_penalty for r in pair_vars]),
+        "Total_Cost"
+    )
+
+    for problem, keys, variables in zip(problems, route_keys, route_vars):
+        out_routes: dict[str, list] = {s_key: [] for s_key in problem["supply_nodes"]}
+        in_routes: dict[str, list] = {d_key: [] for d_key in problem["demand_nodes"]}
+        for r in keys:
+            out_routes[r[0]].append(variables[r])
+            in_routes[r[1]].append(variables[r])
+        for s_key, s_amount in problem["supply_nodes"].items():
+            prob += pulp.lpSum(out_routes[s_key]) <= s_amount
+        for d_key, d_amount in problem["demand_nodes"].items():
+            prob += pulp.lpSum(in_routes[d_key]) == d_amount
+
+    for r, variables in pair_vars.items():
+        prob += pulp.lpSum(variables) <= pair_bounds[r] * task_vars[r]
+        # 何も運ばない組の TaskActive を 1 にできないようにする（ペナルティが 0 のとき、開くだけの解を出さないため）
+        prob += task_vars[r] <= pulp.lpSum(variables)
+
+    # 対称性を除く制約は入れない。入れ替えても費用が同じになるのは内容が同じカテゴリどうしだけで、
+    # その運ぶ量を経路ごとに違う重みをつけた和の大きい順に並べる制約を試したところ、
+    # 18 地点ずつ・同じカテゴリ 5 つの問題 10 件で CBC の求解時間は初期解なしで約 1.1 倍、初期解ありで約 1.45 倍に増えた
+    # (CBC 自身の対称性の処理で足りており、制約を増やすと初期解から改善する探索が遅くなる)
+
+    return prob, route_vars, task_vars
+
+
+def solve_joint(problems: list[dict], time_limit: int, log_path: str | None = None,
+                warm_start: bool = True, candidate_limit: int | None = None) -> list[dict]:
+    """
+    全カテゴリを1つのCBCモデルで解き、カテゴリごとの結果（solve_category と同じ形式）を返す。
+    同じ (供給地, 需要地) を複数のカテゴリが使っても、タスクペナルティは1回だけかかる。
+    """
+    stages = {}
+    task_penalty = problems[0]["task_penalty"] if problems else 0
+
+    # 初期解はカテゴリごとに作って重ねる
+    starts: list[dict[tuple[str, str], int] | None] = [None] * len(problems)
+    if warm_start:
+        stage_start = time.perf_counter()
+        starts = [find_start_solution(p["supply_nodes"], p["demand_nodes"], p["costs"], task_penalty,
+                                      p.get("initial_flows")) for p in problems]
+        warm_start = all(start is not None for start in starts)
+        stages["warmStart"] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    route_keys = [candidate_arcs(p["supply_nodes"], p["demand_nodes"], p["costs"], candidate_limit, start)
+                  for p, start in zip(problems, starts)]
+    prob, route_vars, task_vars = build_joint_model(problems, route_keys)
+    start_cost = None
+    if warm_start:
+        used = set()
+        start_cost = 0.0
+        for p, keys, variables, start in zip(problems, route_keys, route_vars, starts):
+            for r in keys:
+                variables[r].setInitialValue(start.get(r, 0))
+            used.update(start)
+            start_cost += sum(p["costs"][r] * amount for r, amount in start.items())
+        for r, variable in task_vars.items():
+            variable.setInitialValue(1 if r in used else 0)
+        start_cost += task_penalty * len(used)
+    stages["modelBuild"] = time.perf_counter() - stage_start
+
+    cbc = pulp.PULP_CBC_CMD(timeLimit=time_limit, msg=0 if log_path else 1, logPath=log_path, warmStart=warm_start)
+    start_time = time.time()
+    prob.solve(cbc)
+    solve_time = time.time() - start_time
+    stages["cbcRun"] = solve_time
+    print(f"--- Solve time for joint model ({len(problems)} categories): {solve_time:.2f} seconds ---")
+
+    stage_start = time.perf_counter()
+    objective_value = pulp.value(prob.objective)
+    custom_status = "Infeasible"
+    if objective_value is not None:
+        custom_status = "Optimal" if pulp.LpStatus[prob.status] == "Optimal" and solve_time < time_limit * 0.98 else "Feasible"
+
+    category_flows: list[dict[tuple[str, str], float]] = []
+    users: dict[tuple[str, str], int] = {}
+    for keys, variables in zip(route_keys, route_vars):
+        flows = {}
+        if custom_status != "Infeasible":
+            for r in keys:
+                amount = pulp.value(variables[r])
+                if amount is not None and amount > 0:
+                    flows[r] = amount
+                    users[r] = users.get(r, 0) + 1
+        category_flows.append(flows)
+    stages["extractValues"] = time.perf_counter() - stage_start
+
+    gap = None
+    if custom_status == "Optimal":
+        gap = 0.0
+    elif log_path and os.path.exists(log_path):
+        with open(log_path, encoding="utf-8", errors="replace") as f:
+            gap = parse_cbc_log(f.read())["gap"]
+
+    joint = {
+        "categoryCount": len(problems),
+        "taskCount": len(users),
+        "totalCost": objective_value,
+        "warmStartCost": start_cost,
+    }
+    results = []
+    for problem, flows in zip(problems, category_flows):
+        category_key = problem["category_key"]
+        # 共有するタスクのペナルティは、その組を使うカテゴリで等分して各カテゴリの費用に含める
+        total_cost = None
+        if custom_status != "Infeasible":
+            total_cost = sum(problem["costs"].get(r, 1e9) * amount + task_penalty / users[r] for r, amount in flows.items())
+        results.append({
+            "objectKey": category_key,
+            "status": custom_status,
+            "totalCost": total_cost,
+            "taskCount": len(flows),
+            "routes": [{"supplyNode": s, "demandNode": d, "amount": amount, "objectKey": category_key}
+                       for (s, d), amount in flows.items()],
+            "engine": "cbc",
+            "joint": joint,
+            "solveTime": solve_time,
+        })
+    # 段階ごとの時間などはモデル1つ分なので、メトリクスが重複しないよう先頭のカテゴリにだけ付ける
+    if results:
+        results[0]["profile"] = {"stages": stages, "model": model_size(prob), "gap": gap}
+    return results
+
+
+def split_time_limit(time_limit: int, category_count: int) -> int:
+    """
+    リクエスト全体の時間制限をカテゴリごとの制限に分ける。
+    ワーカー数を超えるカテゴリは順番待ちになるため、待ちの段数で割る。
+    """
+    waves = math.ceil(category_count / max(MAX_WORKERS, 1)) if category_count > 0 else 1
+    return max(1, time_limit // waves)
+
+
+def _timed_call(func: Callable[..., dict], problem: dict) -> dict:
+    start_time = time.time()
+    result = func(**problem)
+    # solve_joint のように結果のリストを返すものは、各結果に solveTime が付いている
+    if isinstance(result, dict):
+        result["solveTime"] = time.time() - start_time
+    return result
+
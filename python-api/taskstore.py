@@ -0,0 +1,107 @@
+"""
+タスクの保存先
+
+本番では Firebase の tasks に保存する想定だが、書き込み方（eventId ごとに、一定件数ずつのバッチで書く）を
+同じにした SQLite 版をここに置く。ローカルでの動作確認と、Firebase を使わない運用で使う。
+1行（export.COLUMNS の順。タスクの物品1種類分）ごとに往復しないよう、バッチごとに executemany でまとめて書き込む。
+同じ eventId で保存し直すと、前回の行は置き換わる。前回の行の削除と全バッチの書き込みは1つのトランザクションで行い、
+途中で失敗したら前回の行のまま残す（書き込み中に読む側にも、書き終わるまでは前回の行が見える）。
+"""
+import itertools
+import sqlite3
+import time
+from typing import Iterable, Iterator
+
+import export
+
+# 1回のバッチで書く行数（Firestore のバッチ書き込みの上限に合わせる）
+DEFAULT_BATCH_SIZE = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    event_id TEXT PRIMARY KEY,
+    saved_at REAL NOT NULL,
+    row_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    event_id TEXT NOT NULL,
+    task_id INTEGER NOT NULL,
+    stop INTEGER NOT NULL,
+    source_node TEXT NOT NULL,
+    source_name TEXT,
+    demand_node TEXT NOT NULL,
+    demand_name TEXT,
+    object_key TEXT NOT NULL,
+    object_name TEXT,
+    amount INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_event ON tasks (event_id, task_id, stop);
+"""
+
+_COLUMNS = ("task_id", "stop", "source_node", "source_name", "demand_node", "demand_name",
+            "object_key", "object_name", "amount")
+
+
+def _batched(rows: Iterable[tuple], size: int) -> Iterator[list[tuple]]:
+    iterator = iter(rows)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+class SqliteTaskStore:
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # リクエストごとにスレッドが変わるので、操作ごとに接続する
+        return sqlite3.connect(self.path)
+
+    def write(self, event_id: str, rows: Iterable[tuple], batch_size: int = DEFAULT_BATCH_SIZE) -> dict:
+        """eventId の行を rows で置き換える。rows の途中で例外が出たら何も変えずに送出する。戻り値は書いた行数とバッチ数"""
+        insert = f"INSERT INTO tasks (event_id, {', '.join(_COLUMNS)}) VALUES ({', '.join('?' * (len(_COLUMNS) + 1))})"
+        row_count = 0
+        batches = 0
+        conn = self._connect()
+        try:
+            # with conn: で、ブロックを抜けたときにコミットし、例外のときはロールバックする
+            with conn:
+                conn.execute("DELETE FROM tasks WHERE event_id = ?", (event_id,))
+                for batch in _batched(rows, batch_size):
+                    conn.executemany(insert, [(event_id, *row) for row in batch])
+                    row_count += len(batch)
+                    batches += 1
+                conn.execute("INSERT OR REPLACE INTO events (event_id, saved_at, row_count) VALUES (?, ?, ?)",
+                             (event_id, time.time(), row_count))
+        finally:
+            conn.close()
+        return {"eventId": event_id, "rowCount": row_count, "batches": batches}
+
+    def has_event(self, event_id: str) -> bool:
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT 1 FROM events WHERE event_id = ?", (event_id,)).fetchone() is not None
+        finally:
+            conn.close()
+
+    def rows(self, event_id: str, fetch_size: int = export.CHUNK_ROWS) -> Iterator[tuple]:
+        """eventId の行を export.COLUMNS の順で少しずつ読み出す"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM tasks WHERE event_id = ? ORDER BY task_id, stop, rowid",
+                                  (event_id,))
+            while batch := cursor.fetchmany(fetch_size):
+                yield from batch
+        finally:
+            conn.close()
+
+    def delete(self, event_id: str) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM tasks WHERE event_id = ?", (event_id,))
+            conn.execute("DELETE FROM events WHERE event_id = ?", (event_id,))
+            conn.commit()
+        finally:
+            conn.close()
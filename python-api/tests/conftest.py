@@ -0,0 +1,5 @@
+import os
+import sys
+
+# テストは python-api のモジュールを直接 import する（main.py と同じくフラットな配置）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,74 @@
+import numpy as np
+
+import batching
+import preprocess
+
+
+def line_arrays(positions: dict[str, float], changes: dict[str, tuple[int, int]] | None = None,
+                missing: set[tuple[str, str]] = frozenset()) -> preprocess.ProblemArrays:
+    """一直線上の地点（距離は位置の差）。changes は物品 C の (変化前, 変化後)、missing は経路のない組"""
+    keys = list(positions)
+    changes = changes or {}
+    pairs = [(i, j) for i, a in enumerate(keys) for j, b in enumerate(keys) if i != j and (a, b) not in missing]
+    return preprocess.ProblemArrays(
+        keys, {"C": 0},
+        np.array([[changes.get(key, (0, 0))[0]] for key in keys], dtype=np.int64),
+        np.array([[changes.get(key, (0, 0))[1]] for key in keys], dtype=np.int64),
+        np.array([i for i, _ in pairs], dtype=np.int64), np.array([j for _, j in pairs], dtype=np.int64),
+        np.array([abs(positions[keys[i]] - positions[keys[j]]) for i, j in pairs], dtype=np.float64))
+
+
+def test_split_full_trips():
+    trips, remaining = batching.split_full_trips({"desk": 7, "chair": 3}, 4, {})
+    assert [sum(trip.values()) for trip in trips] == [4, 4]
+    assert remaining == {"chair": 2}
+    # 1個で上限を超える物品は1個ずつ運ぶ
+    trips, remaining = batching.split_full_trips({"piano": 2}, 4, {"piano": 10})
+    assert trips == [{"piano": 1}, {"piano": 1}] and remaining == {}
+
+
+def test_nearby_destinations_are_merged_within_capacity():
+    arrays = line_arrays({"S": 0, "A": 10, "B": 11, "C": 12})
+    tours = batching.savings_tours(arrays, "S", {"A": 1, "B": 1, "C": 1}, 3)
+    assert len(tours) == 1 and sorted(tours[0]) == ["A", "B", "C"]
+
+
+def test_capacity_limits_merges():
+    arrays = line_arrays({"S": 0, "A": 10, "B": 11, "C": 12})
+    tours = batching.savings_tours(arrays, "S", {"A": 2, "B": 2, "C": 1}, 3)
+    assert sorted(len(tour) for tour in tours) == [1, 2]
+    loads = {"A": 2, "B": 2, "C": 1}
+    assert all(sum(loads[d] for d in tour) <= 3 for tour in tours)
+
+
+def test_no_savings_keeps_separate_trips():
+    # 運搬元をはさんで反対側にある運搬先は、まとめても距離が減らない
+    arrays = line_arrays({"S": 0, "A": -5, "B": 5})
+    assert sorted(batching.savings_tours(arrays, "S", {"A": 1, "B": 1}, 10)) == [["A"], ["B"]]
+
+
+def test_destinations_without_a_route_between_are_not_merged():
+    arrays = line_arrays({"S": 0, "A": 10, "B": 11}, missing={("A", "B"), ("B", "A")})
+    assert sorted(batching.savings_tours(arrays, "S", {"A": 1, "B": 1}, 10)) == [["A"], ["B"]]
+
+
+def test_tasks_carry_every_item_in_the_physical_direction():
+    # S の在庫が減り A・B・C の在庫が増える。高速版の結果は増える側が supplyNode
+    arrays = line_arrays({"S": 0, "A": 10, "B": 11, "C": 12},
+                         {"S": (9, 0), "A": (0, 5), "B": (0, 1), "C": (0, 3)})
+    routes = [{"supplyNode": d, "demandNode": "S", "amount": amount, "objectKey": "C"}
+              for d, amount in (("A", 5), ("B", 1), ("C", 3))]
+    tasks = batching.build_tasks(arrays, routes, 4)
+    assert {task["sourceNode"] for task in tasks} == {"S"}
+    delivered = {}
+    for task in tasks:
+        assert task["load"] <= 4
+        for stop in task["stops"]:
+            for item in stop["items"]:
+                delivered[stop["demandNode"]] = delivered.get(stop["demandNode"], 0) + item["amount"]
+    assert delivered == {"A": 5, "B": 1, "C": 3}
+    assert [task["taskId"] for task in tasks] == list(range(1, len(tasks) + 1))
+    # A への 4 個は満載の1便、残りの A:1, B:1, C:3 は上限 4 の巡回にまとめる
+    assert len(tasks) == 3
+    summary = batching.summarize(tasks)
+    assert summary["taskCount"] == 3 and summary["totalLoad"] == 9
@@ -0,0 +1,110 @@
+import copy
+
+import pytest
+from fastapi.testclient import TestClient
+
+import cache
+import main
+from test_sessions import make_payload
+
+
+def problem(**kwargs) -> dict:
+    return {"category_key": "desk", "supply_nodes": {"S1": 2, "S2": 1}, "demand_nodes": {"D": 3},
+            "costs": {("S1", "D"): 1.0, ("S2", "D"): 2.0}, "task_penalty": 10, "time_limit": 10, **kwargs}
+
+
+def result(category_key: str = "desk", status: str = "Optimal", engine: str = "cbc") -> dict:
+    return {"objectKey": category_key, "status": status, "engine": engine, "totalCost": 24.0, "taskCount": 2,
+            "routes": [{"supplyNode": "S1", "demandNode": "D", "amount": 2, "objectKey": category_key},
+                       {"supplyNode": "S2", "demandNode": "D", "amount": 1, "objectKey": category_key}],
+            "solveTime": 1.5, "profile": {"stages": {}}, "debug": {}}
+
+
+def test_problem_key_covers_only_inputs_that_affect_the_result():
+    base = cache.problem_key(problem())
+    # カテゴリ名・時間制限・辞書の順番は結果に影響しない
+    assert cache.problem_key(problem(category_key="chair", time_limit=60)) == base
+    assert cache.problem_key(problem(supply_nodes={"S2": 1, "S1": 2})) == base
+    for changed in (problem(supply_nodes={"S1": 3, "S2": 1}), problem(demand_nodes={"D": 2}),
+                    problem(costs={("S1", "D"): 1.0, ("S2", "D"): 3.0}), problem(task_penalty=0),
+                    problem(engine="flow"), problem(candidate_limit=5), problem(groups={"S1": "g", "S2": "g", "D": "g"})):
+        assert cache.problem_key(changed) != base
+
+
+def test_hit_returns_a_relabelled_copy():
+    solutions = cache.SolutionCache()
+    assert solutions.get("k", "desk") is None
+    solutions.put("k", result())
+
+    hit = solutions.get("k", "chair")
+    assert hit["objectKey"] == "chair"
+    assert {route["objectKey"] for route in hit["routes"]} == {"chair"}
+    assert hit["cacheHit"] is True and hit["solveTime"] == 0.0
+    assert "profile" not in hit and "debug" not in hit
+
+    # 返した結果を書き換えても、キャッシュの中身は変わらない
+    hit["routes"].clear()
+    assert len(solutions.get("k", "desk")["routes"]) == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    solutions = cache.SolutionCache(max_entries=2)
+    solutions.put("a", result())
+    solutions.put("b", result())
+    assert solutions.get("a", "desk") is not None
+    solutions.put("c", result())
+    assert len(solutions) == 2
+    assert solutions.get("b", "desk") is None
+    assert solutions.get("a", "desk") is not None and solutions.get("c", "desk") is not None
+
+
+def test_only_reproducible_results_are_stored():
+    solutions = cache.SolutionCache()
+    solutions.put("cbc-feasible", result(status="Feasible"))
+    solutions.put("flow-feasible", result(status="Feasible", engine="flow"))
+    solutions.put("flow-infeasible", result(status="Infeasible", engine="flow"))
+    assert solutions.get("cbc-feasible", "desk") is None
+    assert solutions.get("flow-feasible", "desk") is not None
+    assert solutions.get("flow-infeasible", "desk") is None
+
+    disabled = cache.SolutionCache(max_entries=0)
+    disabled.put("k", result())
+    assert len(disabled) == 0
+
+
+def test_latest_flows_are_kept_per_category():
+    solutions = cache.SolutionCache()
+    solutions.remember_latest(result(status="Feasible"))
+    assert solutions.latest_flows("desk") == {("S1", "D"): 2, ("S2", "D"): 1}
+    assert solutions.latest_flows("chair") is None
+
+
+def test_distance_cache_evicts_least_recently_used():
+    distances = cache.DistanceCache(max_entries=2)
+    distances.put("a", 1)
+    distances.put("b", 2)
+    assert distances.get("a") == 1
+    distances.put("c", 3)
+    assert distances.get("b") is None and distances.get("a") == 1 and distances.get("c") == 3
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "TASK_STORE_PATH", str(tmp_path / "tasks.sqlite3"))
+    main.solution_cache.clear()
+    with TestClient(main.app) as client:
+        yield client
+    main.solution_cache.clear()
+
+
+def test_identical_categories_keep_their_own_labels(client):
+    # C1 を C0 と同じ数量にすると、2つのカテゴリは同じキャッシュのキー・同じ待ち行列の問題になる
+    payload = make_payload()
+    for point in payload["points"].values():
+        point["objects"]["C1"] = copy.deepcopy(point["objects"]["C0"])
+    for _ in range(2):
+        results = client.post("/solve-dynamic-problem-fast", json=payload).json()
+        assert [result["objectKey"] for result in results] == ["C0", "C1"]
+        for result in results:
+            assert {route["objectKey"] for route in result["routes"]} == {result["objectKey"]}
+    assert all(result["cacheHit"] for result in results)
@@ -0,0 +1,93 @@
+import pytest
+
+import decompose
+import scheduler
+import solver
+
+
+def partial_route_problem(engine: str = "flow") -> dict:
+    """グループ G の中には S1→D1 しか経路がなく、D2 へはグループ H の S2 からしか運べない問題"""
+    return {
+        "category_key": "C",
+        "supply_nodes": {"S1": 5, "S2": 3},
+        "demand_nodes": {"D1": 3, "D2": 3},
+        "costs": {("S1", "D1"): 1.0, ("S2", "D2"): 10.0, ("S2", "D1"): 20.0},
+        "task_penalty": 0,
+        "time_limit": 10,
+        "engine": engine,
+        "groups": {"S1": "G", "D1": "G", "D2": "G", "S2": "H"},
+    }
+
+
+def assert_valid(problem: dict, result: dict) -> None:
+    out: dict[str, float] = {}
+    into: dict[str, float] = {}
+    for route in result["routes"]:
+        r = (route["supplyNode"], route["demandNode"])
+        assert r in problem["costs"]
+        out[r[0]] = out.get(r[0], 0) + route["amount"]
+        into[r[1]] = into.get(r[1], 0) + route["amount"]
+    assert all(out[s] <= problem["supply_nodes"][s] for s in out)
+    assert into == {d: amount for d, amount in problem["demand_nodes"].items()}
+
+
+def test_group_subproblem_is_solvable_with_partial_routes():
+    problem = partial_route_problem()
+    [sub] = decompose.group_subproblems(problem, 5)
+    result = solver.solve_category(**sub["problem"])
+    assert result["status"] != "Infeasible"
+    # グループ内で運べる分だけを運び、残りは UNMET_NODE からの分としてグループ間に回す
+    assert decompose.subproblem_flows(sub, result) == {("S1", "D1"): 3}
+
+
+def test_partial_routes_merge_without_missing_arcs():
+    for engine in ("flow", "cbc"):
+        problem = partial_route_problem(engine)
+        [result] = decompose.solve_decomposed([problem])
+        assert_valid(problem, result)
+        assert result["totalCost"] == 3 * 1.0 + 3 * 10.0
+        assert result["decomposition"]["intraGroupAmount"] == 3
+        assert result["decomposition"]["unroutedAmount"] == 0
+        assert result["status"] == "Feasible"
+
+
+def test_merge_results_drops_arcs_missing_from_costs():
+    problem = partial_route_problem()
+    inter_result = {
+        "status": "Feasible",
+        "routes": [{"supplyNode": "S2", "demandNode": "D2", "amount": 2},
+                   {"supplyNode": "S1", "demandNode": "D2", "amount": 1}],
+    }
+    result = decompose.merge_results(problem, [], {("S1", "D1"): 3}, inter_result)
+    assert {(r["supplyNode"], r["demandNode"]) for r in result["routes"]} == {("S1", "D1"), ("S2", "D2")}
+    assert result["totalCost"] == 3 * 1.0 + 2 * 10.0
+    assert result["decomposition"]["unroutedAmount"] == 1
+    # 運べない分が残る解は、有効な計画として返さない
+    assert result["status"] == "Partial"
+
+
+def test_inter_group_problem_is_requeued_with_backoff(monkeypatch):
+    attempts = []
+    sleeps = []
+
+    def submit(func, problem, priority, deadline):
+        attempts.append(problem)
+        if len(attempts) < 5:
+            raise scheduler.QueueFullError("いっぱい")
+        return "queued"
+
+    monkeypatch.setattr(scheduler, "submit", submit)
+    monkeypatch.setattr(decompose.time, "sleep", sleeps.append)
+    assert decompose._submit_until_queued({}, scheduler.PRIORITY_BACKGROUND, None) == "queued"
+    assert sleeps == [0.05, 0.1, 0.2, 0.4]
+
+
+def test_requeue_gives_up_without_a_deadline(monkeypatch):
+    def submit(func, problem, priority, deadline):
+        raise scheduler.QueueFullError("いっぱい")
+
+    monkeypatch.setattr(scheduler, "submit", submit)
+    monkeypatch.setattr(decompose, "REQUEUE_TIMEOUT_SECONDS", 0.2)
+    monkeypatch.setattr(decompose, "REQUEUE_MAX_DELAY", 0.05)
+    with pytest.raises(scheduler.QueueFullError):
+        decompose._submit_until_queued({}, scheduler.PRIORITY_BACKGROUND, None)
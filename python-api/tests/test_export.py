@@ -0,0 +1,92 @@
+import csv
+import io
+import zipfile
+from xml.etree import ElementTree
+
+import pytest
+from fastapi.testclient import TestClient
+
+import export
+import main
+from test_sessions import make_payload
+
+_NS = {"s": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+
+
+def rows(count: int) -> list[tuple]:
+    return [(i + 1, 1, "S", "元 <&>", "D", "先,\"引用\"", "desk", "机", i) for i in range(count)]
+
+
+def read_csv(chunks) -> list[list[str]]:
+    text = b"".join(chunks).decode("utf-8")
+    assert text.startswith("\ufeff")
+    return list(csv.reader(io.StringIO(text[1:])))
+
+
+def read_xlsx(chunks) -> list[list[str]]:
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zf:
+        assert zf.testzip() is None
+        root = ElementTree.fromstring(zf.read("xl/worksheets/sheet1.xml"))
+    return [[cell.findtext("s:v", namespaces=_NS) or cell.findtext("s:is/s:t", namespaces=_NS)
+             for cell in row.findall("s:c", _NS)] for row in root.find("s:sheetData", _NS)]
+
+
+def test_task_rows_expand_stops_and_items():
+    tasks = [{"taskId": 1, "sourceNode": "S", "stops": [
+        {"demandNode": "D1", "items": [{"objectKey": "desk", "amount": 2}, {"objectKey": "chair", "amount": 1}]},
+        {"demandNode": "D2", "items": [{"objectKey": "desk", "amount": 3}]}]}]
+    assert list(export.task_rows(tasks, {"S": "元", "D1": "先1"}, {"desk": "机"})) == [
+        (1, 1, "S", "元", "D1", "先1", "desk", "机", 2),
+        (1, 1, "S", "元", "D1", "先1", "chair", "chair", 1),
+        (1, 2, "S", "元", "D2", "D2", "desk", "机", 3),
+    ]
+
+
+def test_csv_is_streamed_in_chunks():
+    chunks = list(export.iter_csv(iter(rows(25)), chunk_rows=10))
+    assert len(chunks) == 3
+    assert read_csv(chunks) == [list(export.HEADERS)] + [[str(value) for value in row] for row in rows(25)]
+
+
+def test_xlsx_is_streamed_in_chunks():
+    chunks = list(export.iter_xlsx(iter(rows(25)), chunk_rows=10))
+    assert len(chunks) > 2
+    assert read_xlsx(chunks) == [list(export.HEADERS)] + [[str(value) for value in row] for row in rows(25)]
+
+
+def test_rows_are_consumed_lazily():
+    consumed = []
+
+    def generate():
+        for row in rows(30):
+            consumed.append(row)
+            yield row
+
+    chunks = export.iter_csv(generate(), chunk_rows=10)
+    next(chunks)
+    assert len(consumed) == 10
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "TASK_STORE_PATH", str(tmp_path / "tasks.sqlite3"))
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.mark.parametrize("file_format", ["csv", "xlsx"])
+def test_event_tasks_round_trip(client, file_format):
+    request = {"problem": make_payload(), "batching": {"capacity": 4}}
+    exported = client.post(f"/tasks/export?format={file_format}", json=request)
+    assert exported.status_code == 200
+    assert exported.headers["content-type"] == export.CONTENT_TYPES[file_format]
+
+    saved = client.put("/events/e1/tasks", json=request).json()
+    assert saved["rowCount"] > 0
+    downloaded = client.get(f"/events/e1/tasks?format={file_format}")
+    read = read_csv if file_format == "csv" else read_xlsx
+    assert read([downloaded.content]) == read([exported.content])
+    assert len(read([downloaded.content])) == saved["rowCount"] + 1
+
+    assert client.delete("/events/e1/tasks").status_code == 204
+    assert client.get("/events/e1/tasks").status_code == 404
@@ -0,0 +1,117 @@
+import random
+
+import pulp
+import pytest
+
+import flow
+import solver
+
+
+def random_problem(seed: int, max_nodes: int = 8) -> tuple[dict[str, int], dict[str, int], dict[tuple[str, str], float]]:
+    rng = random.Random(seed)
+    supply = {f"S{i}": rng.randint(1, 20) for i in range(rng.randint(2, max_nodes))}
+    demand = {f"D{j}": rng.randint(1, 15) for j in range(rng.randint(2, max_nodes))}
+    costs = {(s, d): float(rng.randint(1, 100)) for s in supply for d in demand if rng.random() < 0.6}
+    return supply, demand, costs
+
+
+def pulp_optimum(supply: dict[str, int], demand: dict[str, int], costs: dict[tuple[str, str], float]) -> float | None:
+    """同じ輸送問題（送り出し <= 供給、到着 == 需要）を PuLP で解いた最適値。実行不能なら None"""
+    prob = pulp.LpProblem("Transport", pulp.LpMinimize)
+    x = pulp.LpVariable.dicts("x", list(costs), lowBound=0)
+    prob += pulp.lpSum(x[r] * c for r, c in costs.items())
+    for s, amount in supply.items():
+        prob += pulp.lpSum(x[r] for r in costs if r[0] == s) <= amount
+    for d, amount in demand.items():
+        prob += pulp.lpSum(x[r] for r in costs if r[1] == d) == amount
+    prob.solve(pulp.PULP_CBC_CMD(msg=0))
+    if pulp.LpStatus[prob.status] != "Optimal":
+        return None
+    return pulp.value(prob.objective) or 0.0
+
+
+def assert_feasible(flows, supply, demand, costs) -> None:
+    assert all(r in costs and amount > 0 and amount == int(amount) for r, amount in flows.items())
+    for s, amount in supply.items():
+        assert sum(a for (fs, _), a in flows.items() if fs == s) <= amount
+    for d, amount in demand.items():
+        assert sum(a for (_, fd), a in flows.items() if fd == d) == amount
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_network_simplex_matches_pulp_optimum(seed):
+    supply, demand, costs = random_problem(seed)
+    flows = flow.network_simplex(supply, demand, costs)
+    expected = pulp_optimum(supply, demand, costs)
+    if expected is None:
+        assert flows is None
+        return
+    assert flows is not None
+    assert_feasible(flows, supply, demand, costs)
+    assert flow.total_cost(flows, costs, 0) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_network_simplex_matches_pulp_optimum_on_larger_problems(seed):
+    # 木の部分的なつなぎ直しが何度も起きる大きさ
+    supply, demand, costs = random_problem(seed, 40)
+    demand = dict(list(demand.items())[:len(supply)])
+    flows = flow.network_simplex(supply, demand, costs)
+    expected = pulp_optimum(supply, demand, costs)
+    assert (flows is None) == (expected is None)
+    if flows is not None:
+        assert_feasible(flows, supply, demand, costs)
+        assert flow.total_cost(flows, costs, 0) == pytest.approx(expected)
+
+
+def test_network_simplex_rejects_demand_over_supply():
+    assert flow.network_simplex({"S": 1}, {"D": 2}, {("S", "D"): 1.0}) is None
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_merge_tasks_keeps_feasibility_and_never_worsens(seed):
+    supply, demand, costs = random_problem(seed)
+    flows = flow.network_simplex(supply, demand, costs)
+    if flows is None:
+        return
+    for penalty in (5, 50, 500):
+        merged = flow.merge_tasks(flows, supply, costs, penalty)
+        assert_feasible(merged, supply, demand, costs)
+        assert flow.total_cost(merged, costs, penalty) <= flow.total_cost(flows, costs, penalty) + 1e-9
+
+
+def test_repair_solution_fits_new_amounts():
+    supply = {"S1": 10, "S2": 10}
+    demand = {"D1": 6, "D2": 6}
+    costs = {("S1", "D1"): 1.0, ("S1", "D2"): 5.0, ("S2", "D1"): 4.0, ("S2", "D2"): 2.0}
+    flows = flow.network_simplex(supply, demand, costs)
+    # 前回の解を、需要が変わった問題に合わせて直す
+    changed = {"D1": 9, "D2": 4}
+    repaired = flow.repair_solution(flows, supply, changed, costs)
+    assert repaired is not None
+    assert_feasible(repaired, supply, changed, costs)
+    assert flow.repair_solution(flows, supply, {"D1": 30}, costs) is None
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_lower_bound_never_exceeds_the_optimum(seed, tmp_path):
+    supply, demand, costs = random_problem(seed)
+    flows = flow.network_simplex(supply, demand, costs)
+    if flows is None:
+        return
+    result = solver.solve_category("C", supply, demand, costs, 20, 30, engine="cbc", log_path=str(tmp_path / "cbc.log"))
+    assert result["status"] == "Optimal"
+    assert flow.lower_bound(flows, demand, costs, 20) <= result["totalCost"] + 1e-6
+
+
+def test_flow_reports_optimal_when_the_bound_is_reached():
+    costs = {("S1", "D1"): 1.0, ("S1", "D2"): 5.0, ("S2", "D1"): 4.0, ("S2", "D2"): 2.0}
+    # 需要地ごとに1つのタスクで運べるので、下界と一致する
+    result = solver.solve_category_flow("C", {"S1": 5, "S2": 5}, {"D1": 5, "D2": 5}, costs, 10)
+    assert result["status"] == "Optimal"
+    assert result["profile"]["gap"] == 0.0
+    empty = solver.solve_category_flow("C", {}, {}, {}, 10)
+    assert empty["status"] == "Optimal" and empty["totalCost"] == 0
+    # D1 には 2 か所から運ぶしかないが、下界は需要地の数の 1 タスクなので最適とは示せない
+    split = solver.solve_category_flow("C", {"S1": 3, "S2": 3}, {"D1": 6}, {("S1", "D1"): 1.0, ("S2", "D1"): 1.0}, 10)
+    assert split["status"] == "Feasible"
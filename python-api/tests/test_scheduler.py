@@ -0,0 +1,98 @@
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import scheduler
+
+
+# ワーカープロセスに渡すので、モジュールの関数として定義する
+def sleep_and_echo(supply_nodes, demand_nodes, costs, task_penalty, seconds=0.0, tag=None, time_limit=None, **kwargs):
+    time.sleep(seconds)
+    return {"tag": tag, "time_limit": time_limit, "finishedAt": time.time(), "profile": {}}
+
+
+def crash(**kwargs):
+    os._exit(1)
+
+
+def problem(tag, **kwargs) -> dict:
+    return {"supply_nodes": {"S": 1}, "demand_nodes": {"D": 1}, "costs": {("S", "D"): float(tag)},
+            "task_penalty": 0, "tag": tag, **kwargs}
+
+
+@pytest.fixture
+def single_worker():
+    return scheduler.SolverScheduler(workers=1, max_queue=2, queue_wait=0.05)
+
+
+def test_coalesces_identical_problems(single_worker):
+    first, second, other = single_worker.submit_many(sleep_and_echo, [problem(1), problem(1), problem(2)])
+    assert "coalesced" not in first.result()
+    assert second.result()["coalesced"] is True
+    assert second.result() is not first.result()
+    assert "coalesced" not in other.result()
+
+
+def label_routes(category_key, supply_nodes, demand_nodes, costs, task_penalty, **kwargs):
+    return {"objectKey": category_key, "status": "Optimal", "profile": {},
+            "routes": [{"supplyNode": s, "demandNode": d, "amount": 1, "objectKey": category_key} for s, d in costs]}
+
+
+def test_coalesced_results_keep_their_own_category(single_worker):
+    # 内容が同じ別カテゴリの問題はまとめて解くが、結果はそれぞれのカテゴリのものとして返す
+    desk, chair = single_worker.submit_many(label_routes, [problem(1, category_key="desk"), problem(1, category_key="chair")])
+    assert chair.result()["coalesced"] is True
+    for future, category_key in [(desk, "desk"), (chair, "chair")]:
+        result = future.result()
+        assert result["objectKey"] == category_key
+        assert [route["objectKey"] for route in result["routes"]] == [category_key]
+
+
+def test_coalesce_key_respects_log_path_and_initial_flows():
+    base = scheduler.coalesce_key(sleep_and_echo, problem(1))
+    assert base == scheduler.coalesce_key(sleep_and_echo, problem(1))
+    assert scheduler.coalesce_key(sleep_and_echo, problem(1, log_path="a.log")) is None
+    warm = scheduler.coalesce_key(sleep_and_echo, problem(1, initial_flows={("S", "D"): 1}))
+    assert warm not in (None, base)
+    assert warm == scheduler.coalesce_key(sleep_and_echo, problem(1, initial_flows={("S", "D"): 1}))
+
+
+def test_interactive_problems_run_before_background(single_worker):
+    busy = single_worker.submit(sleep_and_echo, problem(1, seconds=0.3))
+    time.sleep(0.1)
+    background = single_worker.submit(sleep_and_echo, problem(2), scheduler.PRIORITY_BACKGROUND)
+    interactive = single_worker.submit(sleep_and_echo, problem(3), scheduler.PRIORITY_INTERACTIVE)
+    busy.result()
+    assert interactive.result()["finishedAt"] <= background.result()["finishedAt"]
+
+
+def test_rejects_when_queue_is_full(single_worker):
+    busy = single_worker.submit(sleep_and_echo, problem(1, seconds=0.3))
+    time.sleep(0.1)
+    queued = single_worker.submit_many(sleep_and_echo, [problem(2), problem(3)])
+    with pytest.raises(scheduler.QueueFullError):
+        single_worker.submit(sleep_and_echo, problem(4))
+    # 同じ問題が待ち行列にあれば、いっぱいでも結果を分け合える
+    shared = single_worker.submit(sleep_and_echo, problem(2))
+    for future in [busy, *queued, shared]:
+        future.result()
+
+
+def test_expired_problems_are_not_solved(single_worker):
+    future = single_worker.submit(sleep_and_echo, problem(1), deadline=scheduler.deadline_after(0))
+    with pytest.raises(scheduler.DeadlineExceededError):
+        future.result()
+
+
+def test_time_limit_is_shrunk_to_the_deadline(single_worker):
+    future = single_worker.submit(sleep_and_echo, problem(1, time_limit=60), deadline=scheduler.deadline_after(5))
+    assert future.result()["time_limit"] <= 5
+
+
+def test_recovers_from_a_broken_pool(single_worker):
+    with pytest.raises(BrokenProcessPool):
+        single_worker.submit(crash, problem(1)).result()
+    assert single_worker.submit(sleep_and_echo, problem(2)).result()["tag"] == 2
+    assert single_worker.stats() == {"workers": 1, "running": 0, "queued": 0}
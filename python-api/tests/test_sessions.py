@@ -0,0 +1,144 @@
+import copy
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+def make_payload(point_count: int = 12, seed: int = 0, with_paths: bool = False) -> dict:
+    """物品カテゴリ2つの小さな会場。with_paths なら routes の代わりに一列に並んだ辺を送る"""
+    rng = random.Random(seed)
+    categories = {key: {"key": key, "name": key} for key in ("C0", "C1")}
+    points = {}
+    for i in range(point_count):
+        points[f"p{i}"] = {"key": f"p{i}", "name": f"p{i}", "groupKey": f"g{i % 3}",
+                           "x": rng.uniform(0, 100), "y": rng.uniform(0, 100),
+                           "objects": {key: {"fromAmount": rng.randint(0, 6), "toAmount": 0} for key in categories}}
+    # 変化後の合計を変化前と同じにする
+    for key in categories:
+        for _ in range(sum(point["objects"][key]["fromAmount"] for point in points.values())):
+            points[rng.choice(list(points))]["objects"][key]["toAmount"] += 1
+    payload = {"objectCategories": categories, "points": points, "routes": {}, "taskPenalty": 10,
+               "targetObjectCategoryKeys": list(categories), "timeLimitSeconds": 10, "engine": "flow"}
+    keys = list(points)
+    if with_paths:
+        payload["paths"] = [{"from": a, "to": b, "cost": rng.randint(1, 20)} for a, b in zip(keys, keys[1:])]
+    else:
+        for a in keys:
+            for b in keys:
+                if a != b:
+                    pa, pb = points[a], points[b]
+                    payload["routes"][f"{a}_{b}"] = {"key": f"{a}_{b}", "from": a, "to": b, "nodeKeys": [a, b],
+                                                     "distance": round(abs(pa["x"] - pb["x"]) + abs(pa["y"] - pb["y"]), 1)}
+    return payload
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "TASK_STORE_PATH", str(tmp_path / "tasks.sqlite3"))
+    main.solution_cache.clear()
+    with TestClient(main.app) as client:
+        yield client
+
+
+def costs(results: list[dict]) -> dict[str, float]:
+    return {result["objectKey"]: round(result["totalCost"], 6) for result in results}
+
+
+def solve_from_scratch(client: TestClient, payload: dict) -> dict[str, float]:
+    main.solution_cache.clear()
+    return costs(client.post("/solve-dynamic-problem-fast", json=payload).json())
+
+
+def move_one_unit(payload: dict, category: str) -> tuple[dict, list[dict]]:
+    """category の変化後の数量を1つ別の地点へ移した問題と、それを表すパッチを返す"""
+    changed = copy.deepcopy(payload)
+    points = changed["points"]
+    donor = next(key for key, point in points.items() if point["objects"][category]["toAmount"] > 0)
+    receiver = next(key for key in points if key != donor)
+    points[donor]["objects"][category]["toAmount"] -= 1
+    points[receiver]["objects"][category]["toAmount"] += 1
+    patch = [{"pointKey": key, "objectKey": category, "toAmount": points[key]["objects"][category]["toAmount"]}
+             for key in (donor, receiver)]
+    return changed, patch
+
+
+def test_solve_reuses_unchanged_categories(client):
+    session_id = client.post("/sessions", json=make_payload()).json()["sessionId"]
+    first = client.post(f"/sessions/{session_id}/solve").json()
+    assert first["solvedCategories"] == ["C0", "C1"]
+    again = client.post(f"/sessions/{session_id}/solve").json()
+    assert again["solvedCategories"] == []
+    assert [result["reused"] for result in again["results"]] == [True, True]
+    assert costs(again["results"]) == costs(first["results"])
+
+
+def test_quantity_patch_matches_full_solve(client):
+    payload = make_payload()
+    session_id = client.post("/sessions", json=payload).json()["sessionId"]
+    client.post(f"/sessions/{session_id}/solve")
+
+    changed, patch = move_one_unit(payload, "C1")
+    response = client.patch(f"/sessions/{session_id}", json={"quantities": patch}).json()
+    assert response["affectedCategories"] == ["C1"]
+    assert response["pendingCategories"] == ["C1"]
+
+    solved = client.post(f"/sessions/{session_id}/solve").json()
+    assert solved["solvedCategories"] == ["C1"]
+    assert costs(solved["results"]) == solve_from_scratch(client, changed)
+
+
+def test_route_and_penalty_patches_match_full_solve(client):
+    payload = make_payload()
+    session_id = client.post("/sessions", json=payload).json()["sessionId"]
+    client.post(f"/sessions/{session_id}/solve")
+
+    changed = copy.deepcopy(payload)
+    changed["routes"]["p0_p1"]["distance"] = 0.5
+    client.patch(f"/sessions/{session_id}", json={"routes": [{"from": "p0", "to": "p1", "distance": 0.5}]})
+    solved = client.post(f"/sessions/{session_id}/solve").json()
+    assert costs(solved["results"]) == solve_from_scratch(client, changed)
+
+    changed["taskPenalty"] = 40
+    response = client.patch(f"/sessions/{session_id}", json={"taskPenalty": 40}).json()
+    assert response["affectedCategories"] == ["C0", "C1"]
+    solved = client.post(f"/sessions/{session_id}/solve").json()
+    assert costs(solved["results"]) == solve_from_scratch(client, changed)
+
+
+def test_path_session_adds_distances_for_new_points(client):
+    payload = make_payload(with_paths=True)
+    idle = "idle"
+    payload["points"][idle] = {"key": idle, "name": idle, "groupKey": "g0", "x": 0, "y": 0,
+                               "objects": {"C0": {"fromAmount": 0, "toAmount": 0}}}
+    payload["paths"].append({"from": "p5", "to": idle, "cost": 3})
+    session_id = client.post("/sessions", json=payload).json()["sessionId"]
+    client.post(f"/sessions/{session_id}/solve")
+
+    # 変化していなかった地点に数量の変化を加えると、その地点との最短距離が追加される
+    changed = copy.deepcopy(payload)
+    donor = next(key for key, point in changed["points"].items()
+                 if key != idle and point["objects"]["C0"]["toAmount"] > 0)
+    changed["points"][idle]["objects"]["C0"]["toAmount"] += 1
+    changed["points"][donor]["objects"]["C0"]["toAmount"] -= 1
+    patch = [{"pointKey": key, "objectKey": "C0", "toAmount": changed["points"][key]["objects"]["C0"]["toAmount"]}
+             for key in (idle, donor)]
+    client.patch(f"/sessions/{session_id}", json={"quantities": patch})
+    solved = client.post(f"/sessions/{session_id}/solve").json()
+    assert costs(solved["results"]) == solve_from_scratch(client, changed)
+
+    response = client.patch(f"/sessions/{session_id}", json={"routes": [{"from": "p0", "to": "p1", "distance": 1}]})
+    assert response.status_code == 400
+
+
+def test_invalid_patch_changes_nothing(client):
+    session_id = client.post("/sessions", json=make_payload()).json()["sessionId"]
+    response = client.patch(f"/sessions/{session_id}",
+                            json={"quantities": [{"pointKey": "missing", "objectKey": "C0", "toAmount": 1}]})
+    assert response.status_code == 400
+    assert client.get(f"/sessions/{session_id}").json()["version"] == 0
+    assert client.post("/sessions/missing/solve").status_code == 404
+    assert client.delete(f"/sessions/{session_id}").status_code == 204
+    assert client.get(f"/sessions/{session_id}").status_code == 404
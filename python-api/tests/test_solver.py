@@ -0,0 +1,77 @@
+import random
+
+import pytest
+
+import solver
+
+
+def random_problems(seed: int, categories: int = 3, task_penalty: int = 10) -> list[dict]:
+    rng = random.Random(seed)
+    supplies = [f"S{i}" for i in range(4)]
+    demands = [f"D{j}" for j in range(4)]
+    costs = {(s, d): float(rng.randint(1, 20)) for s in supplies for d in demands}
+    problems = []
+    for k in range(categories):
+        supply_nodes = {s: rng.randint(0, 4) for s in supplies}
+        total = sum(supply_nodes.values())
+        demand_nodes = {d: total // len(demands) for d in demands}
+        problems.append({"category_key": f"C{k}", "supply_nodes": {s: a for s, a in supply_nodes.items() if a > 0},
+                         "demand_nodes": {d: a for d, a in demand_nodes.items() if a > 0},
+                         "costs": costs, "task_penalty": task_penalty})
+    return problems
+
+
+def solve_separately(problems: list[dict], log_path: str) -> list[dict]:
+    return [solver.solve_category(**problem, time_limit=30, engine="cbc", log_path=log_path) for problem in problems]
+
+
+def assert_valid(problem: dict, result: dict) -> None:
+    out: dict[str, float] = {}
+    into: dict[str, float] = {}
+    for route in result["routes"]:
+        assert route["objectKey"] == problem["category_key"]
+        out[route["supplyNode"]] = out.get(route["supplyNode"], 0) + route["amount"]
+        into[route["demandNode"]] = into.get(route["demandNode"], 0) + route["amount"]
+    assert all(amount <= problem["supply_nodes"][s] for s, amount in out.items())
+    assert into == problem["demand_nodes"]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_joint_without_penalty_matches_separate_solves(seed, tmp_path):
+    # タスクペナルティが 0 ならカテゴリ間で分け合うものがないので、カテゴリごとに解いた費用の和と一致する
+    problems = random_problems(seed, task_penalty=0)
+    log_path = str(tmp_path / "cbc.log")
+    joint = solver.solve_joint(problems, 30, log_path=log_path)
+    separate = solve_separately(problems, log_path)
+    for problem, result in zip(problems, joint):
+        assert result["status"] == "Optimal"
+        assert_valid(problem, result)
+    assert joint[0]["joint"]["totalCost"] == pytest.approx(sum(result["totalCost"] for result in separate))
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_joint_never_costs_more_than_separate_solves(seed, tmp_path):
+    problems = random_problems(seed)
+    log_path = str(tmp_path / "cbc.log")
+    joint = solver.solve_joint(problems, 30, log_path=log_path)
+    separate = solve_separately(problems, log_path)
+    for problem, result in zip(problems, joint):
+        assert_valid(problem, result)
+    # カテゴリごとの解を重ねたものも joint の実行可能解なので、共有したペナルティの分だけ安くなりうる
+    assert joint[0]["joint"]["totalCost"] <= sum(result["totalCost"] for result in separate) + 1e-6
+    assert sum(result["totalCost"] for result in joint) == pytest.approx(joint[0]["joint"]["totalCost"])
+
+
+def test_joint_shares_the_task_penalty(tmp_path):
+    costs = {("S", "D"): 1.0, ("S2", "D"): 2.0}
+    problems = [{"category_key": key, "supply_nodes": {"S": 2, "S2": 2}, "demand_nodes": {"D": 2},
+                 "costs": costs, "task_penalty": 100} for key in ("desk", "chair")]
+    log_path = str(tmp_path / "cbc.log")
+    joint = solver.solve_joint(problems, 30, log_path=log_path)
+    separate = solve_separately(problems, log_path)
+    # 別々に解くとペナルティが 2 回かかるが、同じ組を使えば 1 回で済む
+    assert sum(result["totalCost"] for result in separate) == pytest.approx(2 * (2 * 1.0 + 100))
+    assert joint[0]["joint"]["taskCount"] == 1
+    assert joint[0]["joint"]["totalCost"] == pytest.approx(2 * 2 * 1.0 + 100)
+    for problem, result in zip(problems, joint):
+        assert result["routes"] == [{"supplyNode": "S", "demandNode": "D", "amount": 2, "objectKey": problem["category_key"]}]
@@ -0,0 +1,55 @@
+import sqlite3
+
+import pytest
+
+import taskstore
+
+
+def rows(count: int, object_key: str = "desk") -> list[tuple]:
+    return [(i // 3 + 1, i % 3 + 1, f"S{i}", f"元{i}", f"D{i}", f"先{i}", object_key, "机", i + 1) for i in range(count)]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return taskstore.SqliteTaskStore(str(tmp_path / "tasks.sqlite3"))
+
+
+def test_write_and_read_back_in_batches(store):
+    written = rows(1205)
+    assert store.write("e1", iter(written), batch_size=500) == {"eventId": "e1", "rowCount": 1205, "batches": 3}
+    assert store.has_event("e1")
+    assert list(store.rows("e1", fetch_size=100)) == written
+
+
+def test_rewrite_replaces_previous_rows(store):
+    store.write("e1", rows(10))
+    store.write("e2", rows(4, "chair"))
+    store.write("e1", rows(2, "chair"))
+    assert list(store.rows("e1")) == rows(2, "chair")
+    assert list(store.rows("e2")) == rows(4, "chair")
+
+
+def test_failed_write_keeps_previous_rows(store):
+    store.write("e1", rows(10))
+
+    def failing():
+        yield from rows(7, "chair")
+        raise RuntimeError("途中で失敗")
+
+    with pytest.raises(RuntimeError):
+        store.write("e1", failing(), batch_size=3)
+    assert list(store.rows("e1")) == rows(10)
+    with sqlite3.connect(store.path) as conn:
+        assert conn.execute("SELECT row_count FROM events WHERE event_id = 'e1'").fetchone() == (10,)
+
+    # まだ保存していない eventId なら、失敗しても保存されていないまま
+    with pytest.raises(RuntimeError):
+        store.write("e2", failing(), batch_size=3)
+    assert not store.has_event("e2")
+
+
+def test_delete(store):
+    store.write("e1", rows(3))
+    store.delete("e1")
+    assert not store.has_event("e1")
+    assert list(store.rows("e1")) == []
@@ -116,6 +116,8 @@ const TransportationSolver: React.FC = () => {
               } else if (result.status === "Feasible") {
                 statusColor = "lightblue";
                 statusText = "暫定解 (時間内)";
+              } else if (result.status === "Partial") {
+                statusText = "一部のみ (経路がなく運べない物品あり)";
               }
 
               return (